@@ -1,6 +1,10 @@
 import os
 import jwt
 import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
 
 # Configuration
@@ -8,6 +12,7 @@ SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "dev_secret_key_change_in_prod")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 15  # Short-lived for magic link
 SESSION_TOKEN_EXPIRE_DAYS = 90    # Long-lived for session
+VERIFIED_TOKEN_CACHE_SIZE = int(os.environ.get("VERIFIED_TOKEN_CACHE_SIZE", "1024"))
 
 def create_magic_link_token(email: str) -> str:
     """Generates a short-lived JWT for the magic link."""
@@ -28,6 +33,11 @@ def verify_token(token: str, expected_type: str) -> Optional[str]:
     Verifies the JWT token and returns the email (sub) if valid.
     Checks for expiration and correct token type.
     """
+    payload = _decode(token, expected_type)
+    return payload.get("sub") if payload else None
+
+def _decode(token: str, expected_type: str) -> Optional[dict]:
+    """Returns the token's payload if it verifies and has the expected type and a subject."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -36,6 +46,76 @@ def verify_token(token: str, expected_type: str) -> Optional[str]:
         if email is None or token_type != expected_type:
             return None
             
-        return email
+        return payload
     except jwt.PyJWTError:
         return None
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens that already passed verify_token, keyed by a SHA-256
+    of the token (the raw token is never held as a key). Entries are dropped
+    once their exp has passed, so results match verify_token. Failures are
+    not cached, so junk cookies can't push out valid sessions.
+    """
+    def __init__(self, capacity: int = VERIFIED_TOKEN_CACHE_SIZE):
+        self.capacity = capacity
+        # (token hash, expected_type) -> (email, exp as a unix timestamp or None)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str, expected_type: str) -> tuple:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest(), expected_type
+
+    def verify(self, token: str, expected_type: str) -> Optional[str]:
+        key = self._key(token, expected_type)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                email, exp = entry
+                if exp is None or exp > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return email
+                del self._entries[key]
+            self.misses += 1
+
+        payload = _decode(token, expected_type)
+        if payload is None:
+            return None
+        exp = payload.get("exp")
+        with self._lock:
+            self._entries[key] = (payload["sub"], float(exp) if exp is not None else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return payload["sub"]
+
+    def revoke(self, token: str) -> None:
+        """Evicts one token (e.g. on logout); the next use is verified from scratch."""
+        digest = self._key(token, "")[0]
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == digest]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """Evicts everything (e.g. after rotating JWT_SECRET_KEY)."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+verified_tokens = VerifiedTokenCache()
+
+def verify_token_cached(token: str, expected_type: str) -> Optional[str]:
+    """verify_token, served from the verified-token cache when possible."""
+    return verified_tokens.verify(token, expected_type)
+
+def revoke_token(token: str) -> None:
+    """Revocation hook: drops a token from the verified-token cache."""
+    verified_tokens.revoke(token)
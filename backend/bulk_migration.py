@@ -0,0 +1,188 @@
+"""
+Bulk prompt migrations (/migrate-tools, /migrate-owners).
+
+A migration is a transform(prompt) that returns the rewritten prompt, or None
+when the prompt needs no change. A transform that leaves already-migrated
+prompts alone makes re-runs no-ops. Prompts are visited in id order, in
+batches. Each batch is rewritten with put_prompts (concurrent PUTs, one
+manifest update). When the migration changes searchable text, the batch is
+embedded with batch calls. All of an invocation's vectors go to the vector
+store in a single upsert_many.
+
+Progress is checkpointed to migrations/{name}/checkpoint.json after every
+batch. If an invocation runs out of its time budget, it commits what it has
+and returns status "partial", and calling the endpoint again resumes from the
+checkpoint. If it is killed instead (Lambda timeout), the checkpoint lists the
+rewritten prompts whose vectors were not committed yet, and the next run
+re-embeds them first.
+"""
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+CHECKPOINT_PREFIX = "migrations/"
+MAX_REPORTED_DETAILS = 200
+
+class BulkMigration:
+    def __init__(self, name: str, transform: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+                 s3_service, vector_service, reembed: bool = False,
+                 describe: Optional[Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]] = None,
+                 batch_size: Optional[int] = None, concurrency: Optional[int] = None,
+                 time_budget: Optional[float] = None):
+        self.name = name
+        self.transform = transform
+        self.s3_service = s3_service
+        self.vector_service = vector_service
+        self.reembed = reembed and not vector_service.mock_mode
+        self.describe = describe or (lambda old, new: {"id": new["id"], "title": new.get("title")})
+        self.batch_size = batch_size or int(os.environ.get("MIGRATION_BATCH_SIZE", "100"))
+        self.concurrency = concurrency or int(os.environ.get("MIGRATION_CONCURRENCY", "16"))
+        # Stay under API Gateway's 29s integration timeout by default
+        self.time_budget = time_budget if time_budget is not None else float(os.environ.get("MIGRATION_TIME_BUDGET_SECONDS", "20"))
+
+    @property
+    def storage(self):
+        return self.s3_service.storage
+
+    @property
+    def checkpoint_key(self) -> str:
+        return f"{CHECKPOINT_PREFIX}{self.name}/checkpoint.json"
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        obj = self.storage.get(self.checkpoint_key)
+        return json.loads(obj[0].decode("utf-8")) if obj is not None else None
+
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        checkpoint["updated_at"] = datetime.now(timezone.utc).isoformat()
+        self.storage.put(self.checkpoint_key, json.dumps(checkpoint))
+
+    def reset(self) -> None:
+        self.storage.delete(self.checkpoint_key)
+
+    def _searchable_text(self, prompt: Dict[str, Any]) -> str:
+        tool_used = prompt.get("tool_used") or []
+        return self.vector_service._construct_searchable_text(
+            prompt.get("title", ""), prompt.get("description", ""), prompt.get("prompt_text", ""),
+            tool_used, prompt.get("tags") or [])
+
+    def _embed(self, prompts: List[Dict[str, Any]], vectors: Dict[str, list], errors: List[Dict[str, Any]]) -> None:
+        if not self.reembed or not prompts:
+            return
+        results = self.vector_service.embed_documents([self._searchable_text(p) for p in prompts])
+        for prompt, vector in zip(prompts, results):
+            if vector:
+                vectors[prompt["id"]] = vector
+            else:
+                errors.append({"id": prompt["id"], "error": "Failed to generate embedding"})
+
+    def run(self, dry_run: bool = False, restart: bool = False) -> Dict[str, Any]:
+        """
+        Runs (or resumes) the migration until it finishes or the time budget
+        is spent. With dry_run, nothing is written and the checkpoint is ignored.
+        """
+        started = time.perf_counter()
+        if restart and not dry_run:
+            self.reset()
+        checkpoint = None if dry_run else self.load_checkpoint()
+        if checkpoint is None or checkpoint.get("status") == "complete":
+            checkpoint = {
+                "run_id": uuid.uuid4().hex[:12],
+                "status": "running",
+                "cursor": None,
+                "scanned": 0,
+                "updated": 0,
+                "vectors_written": 0,
+                "unembedded": [],
+                "started_at": datetime.now(timezone.utc).isoformat(),
+            }
+        resumed_from = checkpoint["cursor"]
+
+        prompts = sorted(self.s3_service.list_prompts(), key=lambda p: p["id"])
+        if checkpoint["cursor"] is not None:
+            prompts = [p for p in prompts if p["id"] > checkpoint["cursor"]]
+
+        details: List[Dict[str, Any]] = []
+        errors: List[Dict[str, Any]] = []
+        vectors: Dict[str, list] = {}
+
+        # Prompts a killed run rewrote but never committed vectors for
+        if checkpoint["unembedded"] and not dry_run:
+            leftover = [p for p in self.s3_service.get_prompts_by_ids(checkpoint["unembedded"]) if p]
+            self._embed(leftover, vectors, errors)
+
+        index = 0
+        while index < len(prompts):
+            # Always make progress: at least one batch per invocation
+            if index and time.perf_counter() - started > self.time_budget:
+                break
+            batch = prompts[index:index + self.batch_size]
+            index += len(batch)
+
+            changed = []
+            for prompt in batch:
+                new_prompt = self.transform(dict(prompt))
+                if new_prompt is not None:
+                    changed.append(new_prompt)
+                    if len(details) < MAX_REPORTED_DETAILS:
+                        details.append(self.describe(prompt, new_prompt))
+            checkpoint["scanned"] += len(batch)
+            checkpoint["cursor"] = batch[-1]["id"]
+            if dry_run:
+                checkpoint["updated"] += len(changed)
+                continue
+
+            failed = self.s3_service.put_prompts(changed, max_workers=self.concurrency) if changed else {}
+            errors.extend({"id": pid, "error": error} for pid, error in failed.items())
+            written = [p for p in changed if p["id"] not in failed]
+            checkpoint["updated"] += len(written)
+            if self.reembed:
+                checkpoint["unembedded"] = sorted(set(checkpoint["unembedded"]) | {p["id"] for p in written})
+                self._embed(written, vectors, errors)
+            self._save_checkpoint(checkpoint)
+
+        complete = index >= len(prompts)
+        if vectors and not dry_run:
+            checkpoint["vectors_written"] += self.vector_service.upsert_many(vectors)
+        checkpoint["unembedded"] = []
+        checkpoint["status"] = "complete" if complete else "partial"
+        if not dry_run:
+            self._save_checkpoint(checkpoint)
+
+        print(f"Migration {self.name}{' (dry run)' if dry_run else ''}: {checkpoint['status']}, "
+              f"scanned {checkpoint['scanned']}, updated {checkpoint['updated']} "
+              f"in {time.perf_counter() - started:.1f}s")
+        return {
+            "status": checkpoint["status"],
+            "dry_run": dry_run,
+            "run_id": checkpoint["run_id"],
+            "resumed_from": resumed_from,
+            "total_scanned": checkpoint["scanned"],
+            "updated_count": checkpoint["updated"],
+            "vectors_written": checkpoint["vectors_written"],
+            "remaining": len(prompts) - index,
+            "errors": errors,
+            "details": details,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+def legacy_tools_transform(prompt: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Converts a string/None tool_used to a list; list-valued prompts are already migrated."""
+    tool_used = prompt.get("tool_used")
+    if tool_used is not None and not isinstance(tool_used, str):
+        return None
+    prompt["tool_used"] = [tool_used] if isinstance(tool_used, str) and tool_used.strip() else []
+    return prompt
+
+def owner_transform(mapping: Dict[str, str]) -> Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Backfills owner_email from username via mapping when it's missing or different."""
+    def transform(prompt: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        username = (prompt.get("username") or "").strip()
+        new_email = mapping.get(username)
+        if not new_email or prompt.get("owner_email") == new_email:
+            return None
+        prompt["owner_email"] = new_email
+        return prompt
+    return transform
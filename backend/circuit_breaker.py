@@ -0,0 +1,162 @@
+"""
+Circuit breaker and adaptive concurrency limit for an upstream dependency (Gemini).
+
+Every call first asks the guard for a permit. A permit is refused without
+waiting when:
+- the breaker is open: after GEMINI_BREAKER_FAILURES consecutive failures or
+  slow calls, for GEMINI_BREAKER_COOLDOWN_SECONDS; after that a single trial
+  call decides whether it closes again;
+- the calls in flight are at the concurrency limit. The limit follows
+  latency with AIMD: +1/limit per call under GEMINI_TARGET_LATENCY_MS and
+  x0.7 per slow or failed call, between 1 and GEMINI_MAX_CONCURRENCY.
+
+Refusing instead of queueing keeps request threads from piling up behind a
+slow dependency: search answers lexically and embedding work stays queued.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from .metrics import Counter, Gauge, register
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = register(Gauge(
+    "dependency_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("dependency",)))
+CONCURRENCY_LIMIT = register(Gauge(
+    "dependency_concurrency_limit", "Current adaptive concurrency limit", ("dependency",)))
+IN_FLIGHT = register(Gauge(
+    "dependency_in_flight", "Calls currently in flight", ("dependency",)))
+REJECTIONS = register(Counter(
+    "dependency_rejections_total", "Calls refused without being made, by reason (circuit_open, overloaded)",
+    ("dependency", "reason")))
+
+class DependencyUnavailable(Exception):
+    """Raised when the guard refuses a call; reason is "circuit_open" or "overloaded"."""
+    def __init__(self, dependency: str, reason: str):
+        super().__init__(f"{dependency} unavailable ({reason})")
+        self.reason = reason
+
+class DependencyGuard:
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, cooldown: Optional[float] = None,
+                 max_concurrency: Optional[int] = None, target_latency: Optional[float] = None,
+                 slow_call: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.environ.get("GEMINI_BREAKER_FAILURES", "5"))
+        self.cooldown = cooldown if cooldown is not None else float(os.environ.get("GEMINI_BREAKER_COOLDOWN_SECONDS", "30"))
+        self.max_concurrency = max_concurrency or int(os.environ.get("GEMINI_MAX_CONCURRENCY", "16"))
+        self.target_latency = target_latency or float(os.environ.get("GEMINI_TARGET_LATENCY_MS", "1500")) / 1000.0
+        # Slow enough to count as a failure for the breaker
+        self.slow_call = slow_call or float(os.environ.get("GEMINI_SLOW_CALL_MS", "5000")) / 1000.0
+
+        self.state = CLOSED
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self) -> None:
+        BREAKER_STATE.set(_STATE_VALUES[self.state], self.name)
+        CONCURRENCY_LIMIT.set(round(self.limit, 2), self.name)
+        IN_FLIGHT.set(self.in_flight, self.name)
+
+    def _refresh_locked(self) -> None:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self._publish()
+
+    def available(self) -> bool:
+        """False while the breaker is open (cheap check before doing optional work)."""
+        with self._lock:
+            self._refresh_locked()
+            return self.state != OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a trial call through."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def acquire(self) -> bool:
+        """
+        Takes a permit (the caller must call release()), or raises DependencyUnavailable.
+        Returns True if this is the half-open trial call.
+        """
+        with self._lock:
+            self._refresh_locked()
+            reason = None
+            trial = False
+            if self.state == OPEN or (self.state == HALF_OPEN and self._trial_in_flight):
+                reason = "circuit_open"
+            elif self.in_flight >= max(1, int(self.limit)):
+                reason = "overloaded"
+            elif self.state == HALF_OPEN:
+                self._trial_in_flight = trial = True
+            if reason is None:
+                self.in_flight += 1
+                self._publish()
+        if reason is not None:
+            REJECTIONS.inc(self.name, reason)
+            raise DependencyUnavailable(self.name, reason)
+        return trial
+
+    def release(self, success: bool, latency: float, trial: bool = False) -> None:
+        """Records the outcome of a permitted call."""
+        healthy = success and latency < self.slow_call
+        with self._lock:
+            self.in_flight -= 1
+            if trial:
+                self._trial_in_flight = False
+
+            if success and latency <= self.target_latency:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / max(self.limit, 1.0))
+            else:
+                self.limit = max(1.0, self.limit * 0.7)
+
+            if healthy:
+                self.consecutive_failures = 0
+                if self.state == HALF_OPEN:
+                    self.state = CLOSED
+                    print(f"Circuit for {self.name} closed")
+            else:
+                self.consecutive_failures += 1
+                if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                    if self.state != OPEN:
+                        print(f"Circuit for {self.name} opened after {self.consecutive_failures} failed or slow calls")
+                    self.state = OPEN
+                    self.opened_at = time.monotonic()
+            self._publish()
+
+    @contextmanager
+    def call(self):
+        """
+        Permit for one call. Raising inside the block counts as a failure;
+        a caller that catches a failure itself sets outcome["success"] = False.
+        """
+        trial = self.acquire()
+        outcome = {"success": True}
+        start = time.monotonic()
+        try:
+            yield outcome
+        except BaseException:
+            outcome["success"] = False
+            raise
+        finally:
+            self.release(outcome["success"], time.monotonic() - start, trial)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._refresh_locked()
+            return {
+                "state": self.state,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "consecutive_failures": self.consecutive_failures,
+            }
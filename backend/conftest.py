@@ -0,0 +1,12 @@
+"""
+Shared fixtures for the backend tests (helper classes are in testing.py).
+"""
+import pytest
+
+@pytest.fixture
+def real_mode(monkeypatch):
+    """Real (non-mock) services with no /tmp snapshots and a fake Gemini key."""
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    return monkeypatch
@@ -0,0 +1,173 @@
+"""
+Speculative embeddings for prompt drafts.
+
+When a signed-in user calls /generate-details with the draft's tools, the
+embedding of the searchable text the prompt would have (title, generated
+description and tags, prompt text, tools) is computed in the background. The
+result is kept under a draft key, which is the same content hash the
+embedding queue gives the job when the prompt is saved. The client sends the
+key back with the save; if the saved content still matches, the queue reuses
+the vector and makes no embedding call. Saves without a key never look here.
+
+Speculative drafts are held in memory and also written to
+drafts/embeddings/{key}.json, so a save that lands on another Lambda instance
+can still find them. They expire after DRAFT_EMBEDDING_TTL_SECONDS. Expired
+objects are removed by prune(), which is run by the embedding-queue drain.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .embedding_queue import content_hash
+from .metrics import Counter, register
+
+DRAFT_PREFIX = "drafts/embeddings/"
+
+DRAFT_LOOKUPS = register(Counter(
+    "draft_embedding_lookups_total", "Saved prompts whose embedding was looked up among drafts, by result (hit, miss)", ("result",)))
+
+class DraftEmbeddings:
+    def __init__(self, vector_service_getter: Callable[[], Any], ttl: Optional[float] = None,
+                 enabled: Optional[bool] = None, wait_timeout: float = 15.0):
+        self._vector_service_getter = vector_service_getter
+        self.ttl = ttl if ttl is not None else float(os.environ.get("DRAFT_EMBEDDING_TTL_SECONDS", "900"))
+        self.enabled = enabled if enabled is not None else os.environ.get("SPECULATIVE_EMBEDDING", "true").lower() == "true"
+        # Longer than one embedContent call (10s timeout)
+        self.wait_timeout = wait_timeout
+        # key -> (expires_at, vector)
+        self._drafts: Dict[str, tuple] = {}
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def vector_service(self):
+        return self._vector_service_getter()
+
+    @staticmethod
+    def _draft_key(key: str) -> str:
+        return f"{DRAFT_PREFIX}{key}.json"
+
+    def start(self, text: str) -> Optional[str]:
+        """Starts embedding text in the background. Returns the draft key, or None if disabled."""
+        vs = self.vector_service
+        if not self.enabled or vs.mock_mode or not vs.gemini_api_key:
+            return None
+        key = content_hash(text)
+        with self._lock:
+            self._expire_locked()
+            if key in self._drafts or key in self._in_flight:
+                return key
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="draft-embedding")
+            future = self._in_flight[key] = self._pool.submit(self._embed, key, text)
+        future.add_done_callback(lambda _: self._finish(key))
+        return key
+
+    def _embed(self, key: str, text: str) -> Optional[list]:
+        vector = self.vector_service.embed_document(text)
+        if not vector:
+            return None
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._drafts[key] = (expires_at, vector)
+        try:
+            self.vector_service.storage.put(self._draft_key(key), json.dumps({"expires_at": expires_at, "vector": vector}))
+        except Exception as e:
+            print(f"Error saving draft embedding {key[:12]}: {e}")
+        return vector
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _expire_locked(self) -> None:
+        now = time.time()
+        for key in [k for k, draft in self._drafts.items() if draft[0] <= now]:
+            del self._drafts[key]
+
+    def embedding_for(self, text: str) -> Optional[list]:
+        """
+        The embedding of text, for checks made before a save: the live draft
+        if there is one (waiting for it if in flight), otherwise embedded now.
+        Nothing is stored; the caller hands the vector to the embedding queue.
+        """
+        vs = self.vector_service
+        if vs.mock_mode or not vs.gemini_api_key:
+            return None
+        if not self.enabled:
+            return vs.embed_document(text)
+        key = content_hash(text)
+        with self._lock:
+            future = self._in_flight.get(key)
+        if future is not None:
+            try:
+                future.result(timeout=self.wait_timeout)
+            except Exception as e:
+                print(f"Draft embedding {key[:12]} did not finish: {e}")
+        with self._lock:
+            self._expire_locked()
+            draft = self._drafts.get(key)
+        if draft is not None:
+            return draft[1]
+        return vs.embed_document(text)
+
+    def take(self, key: str) -> Optional[list]:
+        """
+        Returns and consumes the draft vector for a draft key the client was
+        handed, waiting for a speculative embedding still in flight on this
+        instance. None if there is no live draft.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            future = self._in_flight.get(key)
+        if future is not None:
+            try:
+                future.result(timeout=self.wait_timeout)
+            except Exception as e:
+                print(f"Draft embedding {key[:12]} did not finish: {e}")
+
+        with self._lock:
+            self._expire_locked()
+            draft = self._drafts.pop(key, None)
+        vector = draft[1] if draft is not None else None
+
+        storage = self.vector_service.storage
+        if vector is None:
+            try:
+                obj = storage.get(self._draft_key(key))
+                if obj is not None:
+                    stored = json.loads(obj[0].decode("utf-8"))
+                    if stored.get("expires_at", 0) > time.time():
+                        vector = stored.get("vector")
+            except Exception as e:
+                print(f"Error reading draft embedding {key[:12]}: {e}")
+        if vector is not None:
+            try:
+                storage.delete(self._draft_key(key))
+            except Exception as e:
+                print(f"Error deleting draft embedding {key[:12]}: {e}")
+
+        DRAFT_LOOKUPS.inc("hit" if vector is not None else "miss")
+        return vector
+
+    def prune(self) -> int:
+        """Deletes expired drafts from storage. Returns the number removed."""
+        vs = self.vector_service
+        if vs.mock_mode:
+            return 0
+        removed = 0
+        now = time.time()
+        for key in list(vs.storage.list_keys(DRAFT_PREFIX)):
+            try:
+                obj = vs.storage.get(key)
+                if obj is None or json.loads(obj[0].decode("utf-8")).get("expires_at", 0) <= now:
+                    vs.storage.delete(key)
+                    removed += 1
+            except Exception as e:
+                print(f"Error pruning draft embedding {key}: {e}")
+        return removed
@@ -0,0 +1,78 @@
+"""
+Near-duplicate prompts.
+
+create_prompt can check a new prompt against the stored vectors before it is
+saved (DUPLICATE_CHECK=flag|reject, DUPLICATE_THRESHOLD). The check uses the
+prompt's embedding, which the save's queued job then reuses.
+
+duplicate_clusters() finds every group of near-duplicates in the store. It
+is an all-pairs pass done with blocked matrix products (see similarity.py):
+only the pairs above the threshold are kept from each block, and they are
+merged with union-find. No N x N array is ever built.
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+from .metrics import stage
+from .similarity import similarity_blocks
+
+def duplicate_threshold() -> float:
+    return float(os.environ.get("DUPLICATE_THRESHOLD", "0.95"))
+
+def duplicate_check_mode() -> str:
+    """"off", "flag" (save and report the matches) or "reject" (409)."""
+    return os.environ.get("DUPLICATE_CHECK", "off").lower()
+
+def duplicate_clusters(vector_service, threshold: Optional[float] = None,
+                       max_block_bytes: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Groups of prompts connected by similarity >= threshold, largest first:
+    [{"prompt_ids": [...], "max_score": s, "pairs": n}, ...]
+    """
+    import numpy as np
+
+    threshold = duplicate_threshold() if threshold is None else threshold
+    ids, matrix, etag = vector_service._load_all_embeddings()
+    if not ids or matrix is None or matrix.shape[0] < 2:
+        return []
+    prompt_ids, prompts = vector_service._prompt_matrix(ids, matrix, etag)
+
+    parent = list(range(len(prompt_ids)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    best: Dict[int, float] = {}
+    pair_counts: Dict[int, int] = {}
+    pairs = []
+    with stage("duplicates.scan"):
+        for start, scores in similarity_blocks(prompts, max_block_bytes):
+            # Each pair once: only columns after the row's own index
+            rows, cols = np.nonzero(scores >= threshold)
+            keep = cols > rows + start
+            for row, col in zip(rows[keep], cols[keep]):
+                i = int(row) + start
+                pairs.append((i, int(col), float(scores[row, col])))
+                a, b = find(i), find(int(col))
+                if a != b:
+                    parent[b] = a
+
+    for i, j, score in pairs:
+        root = find(i)
+        best[root] = max(best.get(root, score), score)
+        pair_counts[root] = pair_counts.get(root, 0) + 1
+    members: Dict[int, List[str]] = {}
+    for i in range(len(prompt_ids)):
+        root = find(i)
+        if root in best:
+            members.setdefault(root, []).append(prompt_ids[i])
+
+    clusters = [
+        {"prompt_ids": members[root], "max_score": round(best[root], 6), "pairs": pair_counts[root]}
+        for root in members
+    ]
+    clusters.sort(key=lambda c: (-len(c["prompt_ids"]), -c["max_score"]))
+    return clusters
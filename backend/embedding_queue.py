@@ -0,0 +1,343 @@
+"""
+Write-behind queue for prompt embeddings.
+
+create/update enqueue the prompt's searchable text and return right away; a
+worker thread embeds whatever has queued up during a short coalescing window
+with one batchEmbedContents call and commits it with one upsert_many (one
+vectors.npy rewrite). Later updates to a prompt replace its queued text.
+Jobs whose text was already embedded speculatively as a draft reuse that
+vector instead (see draft_embeddings.py).
+
+Each job also has a durable marker at embedding-jobs/{prompt_id}.json that
+holds the text. The marker is deleted once the vector is committed. On
+Lambda, the execution environment is frozen between invocations, so the
+worker only makes progress while a request is running. Markers left behind
+by a frozen or recycled instance are picked up by recover() on the next
+start, or by POST /admin/embedding-queue/drain (e.g. from a schedule).
+With EMBEDDING_QUEUE_MODE=sync, jobs are processed before the request returns.
+While Gemini's circuit breaker is open, jobs stay queued ("deferred") and
+are not charged an attempt.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import Counter, Gauge, register, stage
+
+MARKER_PREFIX = "embedding-jobs/"
+
+QUEUE_DEPTH = register(Gauge(
+    "embedding_queue_depth", "Embedding jobs waiting in this instance's write-behind queue"))
+QUEUE_JOBS = register(Counter(
+    "embedding_queue_jobs_total", "Embedding jobs by outcome (done, retried, failed, cancelled)", ("outcome",)))
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class EmbeddingQueue:
+    def __init__(self, vector_service_getter: Callable[[], Any], mode: Optional[str] = None,
+                 window: Optional[float] = None, max_batch: Optional[int] = None,
+                 max_attempts: Optional[int] = None,
+                 vector_lookup: Optional[Callable[[str], Optional[list]]] = None):
+        self._vector_service_getter = vector_service_getter
+        # content_hash -> precomputed vector (speculative draft embeddings), consulted before embedding
+        self._vector_lookup = vector_lookup
+        self.mode = (mode or os.environ.get("EMBEDDING_QUEUE_MODE", "background")).lower()
+        self.window = window if window is not None else float(os.environ.get("EMBEDDING_QUEUE_WINDOW_MS", "500")) / 1000.0
+        self.max_batch = max_batch or int(os.environ.get("EMBEDDING_QUEUE_MAX_BATCH", "100"))
+        self.max_attempts = max_attempts or int(os.environ.get("EMBEDDING_QUEUE_MAX_ATTEMPTS", "3"))
+
+        # prompt_id -> job; a newer enqueue for the same prompt replaces the older job
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._in_flight: Dict[str, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        self._process_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._recovered = False
+
+    @property
+    def vector_service(self):
+        return self._vector_service_getter()
+
+    def _enabled(self) -> bool:
+        vs = self.vector_service
+        return not vs.mock_mode and bool(vs.gemini_api_key)
+
+    @staticmethod
+    def _marker_key(prompt_id: str) -> str:
+        return f"{MARKER_PREFIX}{prompt_id}.json"
+
+    def _write_marker(self, job: Dict[str, Any]) -> None:
+        try:
+            # A vector handed to enqueue() stays in memory; recovery re-embeds
+            marker = {k: v for k, v in job.items() if k != "vector"}
+            self.vector_service.storage.put(self._marker_key(job["prompt_id"]), json.dumps(marker))
+        except Exception as e:
+            # The in-memory job still runs; only crash recovery is lost
+            print(f"Error writing embedding marker for {job['prompt_id']}: {e}")
+
+    def _read_marker(self, prompt_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            obj = self.vector_service.storage.get(self._marker_key(prompt_id))
+        except Exception as e:
+            print(f"Error reading embedding marker for {prompt_id}: {e}")
+            return None
+        return json.loads(obj[0].decode("utf-8")) if obj is not None else None
+
+    def _gemini_available(self) -> bool:
+        return self.vector_service.gemini_guard.available()
+
+    def _update_depth(self) -> None:
+        QUEUE_DEPTH.set(len(self._jobs) + len(self._in_flight))
+
+    def enqueue(self, prompt_id: str, text: str, draft_key: Optional[str] = None,
+                vector: Optional[list] = None) -> str:
+        """
+        Queues (re-)embedding of a prompt and returns its embedding_status:
+        "pending", "done"/"failed" in sync mode, "deferred" while Gemini's
+        circuit is open, or "skipped" when embeddings are off (mock mode or
+        no Gemini key). draft_key is the key /generate-details handed the
+        client; it is only looked up if it still matches the text. vector is
+        the text's embedding when the caller already has it (no Gemini call).
+        """
+        if not self._enabled():
+            return "skipped"
+
+        key = content_hash(text)
+        job = {
+            "prompt_id": prompt_id,
+            "status": "pending",
+            "text": text,
+            "content_hash": key,
+            "draft_key": draft_key if draft_key == key else None,
+            "vector": vector,
+            "attempts": 0,
+            "error": None,
+            "enqueued_at": _now(),
+            "updated_at": _now(),
+        }
+        self._write_marker(job)
+        with self._cond:
+            self._jobs[prompt_id] = job
+            self._update_depth()
+            self._cond.notify()
+
+        if self.mode == "sync" and self._gemini_available():
+            self.process_pending()
+            return self.status(prompt_id)["embedding_status"]
+        self._ensure_worker()
+        return "pending" if self._gemini_available() else "deferred"
+
+    def cancel(self, prompt_id: str) -> None:
+        """Drops a queued job and its marker (the prompt was deleted)."""
+        with self._cond:
+            if self._jobs.pop(prompt_id, None) is not None:
+                QUEUE_JOBS.inc("cancelled")
+            self._update_depth()
+        if not self.vector_service.mock_mode:
+            try:
+                self.vector_service.storage.delete(self._marker_key(prompt_id))
+            except Exception as e:
+                print(f"Error deleting embedding marker for {prompt_id}: {e}")
+
+    def _ensure_worker(self) -> None:
+        with self._cond:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name="embedding-queue", daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        if not self._recovered:
+            self._recovered = True
+            self.recover(stale_after=float(os.environ.get("EMBEDDING_QUEUE_STALE_SECONDS", "60")))
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+            # Let concurrent saves pile up so they share one embed call and one matrix write
+            time.sleep(self.window)
+            if not self._gemini_available():
+                time.sleep(max(self.vector_service.gemini_guard.retry_after(), self.window))
+                continue
+            try:
+                self.process_pending()
+            except Exception as e:
+                print(f"Embedding queue worker error: {e}")
+                time.sleep(1.0)
+
+    def process_pending(self) -> int:
+        """Processes every queued job in batches of max_batch. Returns the number committed."""
+        committed = 0
+        while True:
+            with self._process_lock:
+                with self._cond:
+                    if not self._jobs or not self._gemini_available():
+                        return committed
+                    ready = list(self._jobs)[:self.max_batch]
+                    batch = {pid: self._jobs.pop(pid) for pid in ready}
+                    self._in_flight.update(batch)
+                try:
+                    committed += self._process_batch(batch)
+                finally:
+                    with self._cond:
+                        for pid in batch:
+                            self._in_flight.pop(pid, None)
+                        self._update_depth()
+
+    def _process_batch(self, batch: Dict[str, Dict[str, Any]]) -> int:
+        vs = self.vector_service
+        jobs = list(batch.values())
+        with stage("embedding_queue.flush"):
+            embedded = {}
+            to_embed = []
+            for job in jobs:
+                vector = job.get("vector")
+                if not vector and self._vector_lookup is not None and job.get("draft_key"):
+                    vector = self._vector_lookup(job["draft_key"])
+                if vector:
+                    embedded[job["prompt_id"]] = vector
+                else:
+                    to_embed.append(job)
+            vectors = vs.embed_documents([job["text"] for job in to_embed]) if to_embed else []
+            embedded.update({job["prompt_id"]: vector for job, vector in zip(to_embed, vectors) if vector})
+            failed = [job for job, vector in zip(to_embed, vectors) if not vector]
+            error = "Embedding failed"
+            if embedded:
+                try:
+                    vs.upsert_many(embedded)
+                except Exception as e:
+                    error = f"Vector store write failed: {e}"
+                    failed = jobs
+                    embedded = {}
+
+        for prompt_id in embedded:
+            self._complete(batch[prompt_id])
+        if failed and not self._gemini_available():
+            # The breaker opened (or was open) during this batch: defer, don't charge attempts
+            with self._cond:
+                for job in failed:
+                    self._jobs.setdefault(job["prompt_id"], job)
+                self._update_depth()
+            failed = []
+        for job in failed:
+            self._retry_or_fail(job, error)
+        print(f"Embedding queue: committed {len(embedded)} of {len(jobs)} jobs")
+        return len(embedded)
+
+    def _complete(self, job: Dict[str, Any]) -> None:
+        QUEUE_JOBS.inc("done")
+        with self._cond:
+            if job["prompt_id"] in self._jobs:
+                # Updated again while we were embedding; the newer job owns the marker
+                return
+        marker = self._read_marker(job["prompt_id"])
+        if marker is not None and marker.get("content_hash") != job["content_hash"]:
+            # Another instance queued newer text meanwhile
+            return
+        try:
+            self.vector_service.storage.delete(self._marker_key(job["prompt_id"]))
+        except Exception as e:
+            print(f"Error deleting embedding marker for {job['prompt_id']}: {e}")
+
+    def _retry_or_fail(self, job: Dict[str, Any], error: str) -> None:
+        job = dict(job, attempts=job["attempts"] + 1, error=error, updated_at=_now())
+        if job["attempts"] >= self.max_attempts:
+            job["status"] = "failed"
+            QUEUE_JOBS.inc("failed")
+            print(f"Embedding for {job['prompt_id']} failed after {job['attempts']} attempts: {error}")
+            self._write_marker(job)
+            return
+        QUEUE_JOBS.inc("retried")
+        self._write_marker(job)
+        with self._cond:
+            # Don't clobber a newer job for the same prompt
+            self._jobs.setdefault(job["prompt_id"], job)
+            self._update_depth()
+
+    def recover(self, stale_after: float = 0.0, include_failed: bool = False) -> int:
+        """
+        Re-queues jobs from markers in storage that are not queued here and
+        were last touched more than stale_after seconds ago (younger ones are
+        probably still in another instance's queue). Returns the number queued.
+        """
+        if not self._enabled():
+            return 0
+        storage = self.vector_service.storage
+        now = time.time()
+        queued = 0
+        try:
+            keys = list(storage.list_keys(MARKER_PREFIX))
+        except Exception as e:
+            print(f"Error listing embedding markers: {e}")
+            return 0
+        for key in keys:
+            prompt_id = key[len(MARKER_PREFIX):-len(".json")]
+            with self._cond:
+                if prompt_id in self._jobs or prompt_id in self._in_flight:
+                    continue
+            job = self._read_marker(prompt_id)
+            if job is None or (job.get("status") == "failed" and not include_failed):
+                continue
+            try:
+                age = now - datetime.fromisoformat(job["updated_at"]).timestamp()
+            except (KeyError, ValueError):
+                age = float("inf")
+            if age < stale_after:
+                continue
+            if job.get("status") == "failed":
+                job = dict(job, status="pending", attempts=0)
+            with self._cond:
+                self._jobs.setdefault(prompt_id, job)
+                self._update_depth()
+            queued += 1
+        if queued:
+            print(f"Embedding queue: recovered {queued} jobs from storage")
+        return queued
+
+    def drain(self, include_failed: bool = False) -> Dict[str, Any]:
+        """Recovers every marker in storage and processes the whole queue before returning."""
+        recovered = self.recover(stale_after=0.0, include_failed=include_failed)
+        committed = self.process_pending()
+        return {"recovered": recovered, "committed": committed, **self.stats()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"queued": len(self._jobs), "in_flight": len(self._in_flight), "mode": self.mode}
+
+    def status(self, prompt_id: str) -> Dict[str, Any]:
+        """
+        embedding_status of a prompt: pending/processing (queued here),
+        pending/failed (marker in storage), deferred (pending while Gemini's
+        circuit is open), done (vector committed),
+        missing (no vector and no job) or skipped (embeddings off).
+        """
+        result: Dict[str, Any] = {"prompt_id": prompt_id, "attempts": 0, "error": None, "updated_at": None}
+        if not self._enabled():
+            return dict(result, embedding_status="skipped")
+
+        with self._cond:
+            job = self._jobs.get(prompt_id)
+            in_flight = prompt_id in self._in_flight
+        if job is None and not in_flight:
+            job = self._read_marker(prompt_id)
+        if in_flight:
+            job = job or self._in_flight.get(prompt_id) or {}
+            return dict(result, embedding_status="processing", attempts=job.get("attempts", 0),
+                        updated_at=job.get("updated_at"))
+        if job is not None:
+            status = job["status"]
+            if status == "pending" and not self._gemini_available():
+                status = "deferred"
+            return dict(result, embedding_status=status, attempts=job.get("attempts", 0),
+                        error=job.get("error"), updated_at=job.get("updated_at"))
+
+        ids, _, _ = self.vector_service._load_all_embeddings()
+        return dict(result, embedding_status="done" if prompt_id in ids else "missing")
@@ -0,0 +1,167 @@
+"""
+Outbox for magic-link emails.
+
+/auth/login records a delivery and hands the SES call off, so the response
+doesn't wait for SES. The magic link is minted by whichever side sends it
+(link_builder), so it never travels in an invocation payload, where AWS would
+keep it in the async queue and any failure destination. Under uvicorn a background task sends it
+after the response. On Lambda a background task would still run before the
+invocation returns, so the function instead invokes itself asynchronously
+(InvocationType=Event, which needs lambda:InvokeFunction on itself) and the
+handler passes that event to handle_event(). If the invoke fails, or
+MAIL_ASYNC_INVOKE=false, it falls back to the background task.
+
+Delivery is retried with exponential backoff (MAIL_SEND_ATTEMPTS).
+Throttling and transient SES errors are retried; rejections such as an
+unverified address are not. The outcome is written to
+mail-outbox/{delivery_id}.json without the link itself, and can be read from
+any instance via GET /auth/login/deliveries/{delivery_id}, which the login
+page polls to report failures.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import Counter, register
+from .storage import get_boto3_client
+
+OUTBOX_PREFIX = "mail-outbox/"
+# Key of the asynchronous self-invocation event that carries one delivery
+ASYNC_EVENT_KEY = "mail_outbox_delivery"
+MAX_TRACKED = 1000
+# SES errors worth another attempt
+RETRYABLE_ERRORS = {"Throttling", "ThrottlingException", "ServiceUnavailable", "InternalFailure", "RequestTimeout"}
+
+MAIL_DELIVERIES = register(Counter(
+    "mail_deliveries_total", "Magic-link deliveries by outcome (sent, failed, retried)", ("outcome",)))
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _mask(email: str) -> str:
+    name, _, domain = email.partition("@")
+    return f"{name[:1]}***@{domain}"
+
+class MailOutbox:
+    def __init__(self, ses_getter: Callable[[], Any], link_builder: Callable[[str], str],
+                 storage_getter: Optional[Callable[[], Any]] = None,
+                 attempts: Optional[int] = None, backoff: Optional[float] = None):
+        self._ses_getter = ses_getter
+        self._link_builder = link_builder
+        self._storage_getter = storage_getter
+        self.attempts = attempts or int(os.environ.get("MAIL_SEND_ATTEMPTS", "3"))
+        self.backoff = backoff if backoff is not None else float(os.environ.get("MAIL_RETRY_BACKOFF_SECONDS", "0.5"))
+        self._deliveries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _update(self, delivery_id: str, **fields) -> Dict[str, Any]:
+        with self._lock:
+            record = self._deliveries.setdefault(delivery_id, {"id": delivery_id})
+            record.update(fields, updated_at=_now())
+            self._deliveries.move_to_end(delivery_id)
+            while len(self._deliveries) > MAX_TRACKED:
+                self._deliveries.popitem(last=False)
+            return dict(record)
+
+    def _persist(self, record: Dict[str, Any]) -> None:
+        if self._storage_getter is None:
+            return
+        try:
+            self._storage_getter().put(f"{OUTBOX_PREFIX}{record['id']}.json", json.dumps(record))
+        except Exception as e:
+            print(f"Error persisting mail delivery {record['id']}: {e}")
+
+    def enqueue(self, recipient_email: str) -> str:
+        """Records a queued delivery and returns its id; pass it to dispatch()."""
+        delivery_id = uuid.uuid4().hex
+        self._update(delivery_id, status="queued", recipient=_mask(recipient_email), attempts=0,
+                     error=None, created_at=_now())
+        return delivery_id
+
+    def dispatch(self, delivery_id: str, recipient_email: str, background_tasks) -> str:
+        """
+        Hands the delivery off: an asynchronous self-invocation on Lambda,
+        else a background task. Returns "lambda" or "background".
+        """
+        function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+        if function_name and os.environ.get("MAIL_ASYNC_INVOKE", "true").lower() == "true":
+            payload = {ASYNC_EVENT_KEY: {"id": delivery_id, "email": recipient_email}}
+            try:
+                get_boto3_client("lambda").invoke(
+                    FunctionName=function_name, InvocationType="Event", Payload=json.dumps(payload).encode("utf-8"))
+                return "lambda"
+            except Exception as e:
+                print(f"Async invoke for mail delivery {delivery_id} failed, sending in this invocation: {e}")
+        background_tasks.add_task(self.deliver, delivery_id, recipient_email)
+        return "background"
+
+    def handle_event(self, event: Any) -> Optional[Dict[str, Any]]:
+        """Sends a delivery handed off by dispatch(). None if event is not one of ours."""
+        if not isinstance(event, dict) or ASYNC_EVENT_KEY not in event:
+            return None
+        job = event[ASYNC_EVENT_KEY]
+        return {"delivery_id": job["id"], "sent": self.deliver(job["id"], job["email"])}
+
+    def deliver(self, delivery_id: str, recipient_email: str) -> bool:
+        """Mints the magic link and sends the email, retrying transient failures. Returns True once sent."""
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            magic_link = self._link_builder(recipient_email)
+        except Exception as e:
+            print(f"Could not mint the magic link for delivery {delivery_id}: {e}")
+            record = self._update(delivery_id, status="failed", error=f"Could not create the link: {e}")
+            MAIL_DELIVERIES.inc("failed")
+            self._persist(record)
+            return False
+        ses = self._ses_getter()
+        for attempt in range(1, self.attempts + 1):
+            self._update(delivery_id, status="sending", attempts=attempt, recipient=_mask(recipient_email))
+            try:
+                ses.deliver_magic_link(recipient_email, magic_link)
+                record = self._update(delivery_id, status="sent", error=None)
+                MAIL_DELIVERIES.inc("sent")
+                self._persist(record)
+                return True
+            except (ClientError, BotoCoreError) as e:
+                if isinstance(e, ClientError):
+                    code = e.response.get("Error", {}).get("Code", "")
+                    error = f"{code}: {e.response.get('Error', {}).get('Message', '')}"
+                    retryable = code in RETRYABLE_ERRORS
+                else:
+                    error = str(e)
+                    retryable = True
+                print(f"Magic link delivery {delivery_id} attempt {attempt} failed: {error}")
+                self._update(delivery_id, error=error)
+                if not retryable or attempt == self.attempts:
+                    break
+                MAIL_DELIVERIES.inc("retried")
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+        record = self._update(delivery_id, status="failed")
+        MAIL_DELIVERIES.inc("failed")
+        self._persist(record)
+        return False
+
+    def status(self, delivery_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The delivery's record. An outcome recorded on this instance wins;
+        otherwise the persisted outcome (the send may have run elsewhere),
+        else this instance's queued record. None if unknown.
+        """
+        with self._lock:
+            record = self._deliveries.get(delivery_id)
+            record = dict(record) if record is not None else None
+        if (record is not None and record.get("status") in ("sent", "failed")) or self._storage_getter is None:
+            return record
+        try:
+            obj = self._storage_getter().get(f"{OUTBOX_PREFIX}{delivery_id}.json")
+        except Exception as e:
+            print(f"Error reading mail delivery {delivery_id}: {e}")
+            return record
+        return json.loads(obj[0].decode("utf-8")) if obj is not None else record
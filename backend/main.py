@@ -1,15 +1,28 @@
 from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
 from mangum import Mangum
-from pydantic import BaseModel, validator
-from typing import List, Optional
-from fastapi import Request, Response, Depends, Cookie
-from fastapi.responses import RedirectResponse
-from .services import S3Service, VectorService, SESService
+from pydantic import BaseModel, Field, validator
+from typing import Any, Dict, List, Optional
+from fastapi import Request, Response, Depends, Cookie, BackgroundTasks, Query
+from fastapi.responses import RedirectResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from .services import S3Service, VectorService, SESService, LazyService, GENERATE_FALLBACK
 from .tool_metadata_service import ToolMetadataService
-from .auth_utils import create_magic_link_token, create_session_token, verify_token
+from .auth_utils import create_magic_link_token, create_session_token, verify_token, verify_token_cached
+from .metrics import MetricsMiddleware, render_metrics
+from .profiling import ProfilingMiddleware, get_recent_profile, list_recent_profiles
+from .slow_query_log import SlowQueryLog
+from .transfer import export_lines, BulkImporter
+from .embedding_queue import EmbeddingQueue
+from .draft_embeddings import DraftEmbeddings
+from .mail_outbox import MailOutbox
+from .bulk_migration import BulkMigration, legacy_tools_transform, owner_transform
+from .similar_prompts import SimilarPrompts
+from .duplicates import duplicate_check_mode, duplicate_clusters, duplicate_threshold
+from .topics import TopicIndex
 import os
 import json
+import time
 
 app = FastAPI()
 
@@ -30,22 +43,64 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-handler = Mangum(app)
+_asgi_handler = Mangum(app)
 
-# Initialize services
-s3_service = S3Service()
-vector_service = VectorService(s3_service)
-ses_service = SESService()
-tool_metadata_service = ToolMetadataService(s3_service)
+def handler(event, context):
+    """Lambda entry point: magic-link deliveries handed off by /auth/login, else HTTP events."""
+    delivered = mail_outbox.handle_event(event)
+    if delivered is not None:
+        return delivered
+    return _asgi_handler(event, context)
+
+# Initialize services lazily: each one is built on first use so that routes
+# like /auth/me or /tools don't pay for boto3 clients on a cold start.
+s3_service = LazyService(S3Service)
+vector_service = LazyService(lambda: VectorService(s3_service.get_instance()))
+ses_service = LazyService(SESService)
+tool_metadata_service = LazyService(lambda: ToolMetadataService(s3_service))
+slow_query_log = SlowQueryLog(lambda: s3_service.storage)
+def magic_link_for(email: str) -> str:
+    """A fresh magic link for email, minted where the email is sent."""
+    token = create_magic_link_token(email)
+    api_base_url = os.environ.get("API_BASE_URL", "http://127.0.0.1:8000")
+    return f"{api_base_url}/auth/verify?token={token}"
+
+# Magic-link emails are sent after /auth/login responds, on Lambda by an async self-invocation (see mail_outbox.py)
+mail_outbox = MailOutbox(ses_service.get_instance, magic_link_for, lambda: s3_service.storage)
+# Write-behind embeddings for create/update (see embedding_queue.py), reusing
+# vectors speculatively computed during /generate-details (see draft_embeddings.py)
+draft_embeddings = DraftEmbeddings(vector_service.get_instance)
+embedding_queue = EmbeddingQueue(vector_service.get_instance, vector_lookup=draft_embeddings.take)
+# "More like this" from stored vectors and precomputed neighbour lists (see similar_prompts.py)
+similar_prompts = SimilarPrompts(vector_service.get_instance)
+# Browse-by-topic clusters over the stored embeddings (see topics.py)
+topic_index = TopicIndex(vector_service.get_instance, s3_service.get_instance)
+
+def _save_profile(profile_id: str, report: dict):
+    s3_service.storage.put(f"profiles/{profile_id}.json", json.dumps(report))
+
+# Admin-triggered request profiling (X-Profile + X-Admin-Secret), see profiling.py
+app.add_middleware(ProfilingMiddleware, on_report=_save_profile)
+
+# Per-route latency histograms and a Server-Timing header on every response
+# (added last so it wraps everything else and times the whole request)
+app.add_middleware(MetricsMiddleware)
+
+def _check_admin_secret(x_admin_secret: Optional[str]):
+    """Raises 403 unless the X-Admin-Secret header matches ADMIN_SECRET_KEY."""
+    admin_secret = os.environ.get("ADMIN_SECRET_KEY", "admin-secret-dev")
+    if x_admin_secret != admin_secret:
+        raise HTTPException(status_code=403, detail="Invalid admin secret")
 
 # Auth Models
 class LoginRequest(BaseModel):
     email: str
 
 @app.post("/auth/login")
-def login(request: LoginRequest):
+def login(request: LoginRequest, background_tasks: BackgroundTasks):
     email = request.email.lower().strip()
     
     # Domain validation
@@ -65,18 +120,19 @@ def login(request: LoginRequest):
         else:
             raise HTTPException(status_code=500, detail="Failed to send verification email.")
 
-    # 2. If Verified, Send Magic Link
-    token = create_magic_link_token(email)
-    
-    # Construct link
-    api_base_url = os.environ.get("API_BASE_URL", "http://127.0.0.1:8000")
-    magic_link = f"{api_base_url}/auth/verify?token={token}"
-    
-    # Send email
-    if ses_service.send_magic_link(email, magic_link):
-        return {"status": "success", "message": "Magic link sent. Check your email."}
-    else:
-        raise HTTPException(status_code=500, detail="Failed to send magic link.")
+    # 2. If Verified, Send Magic Link (minted by the sender, see magic_link_for)
+    # after responding; the login page polls /auth/login/deliveries/{delivery_id}
+    delivery_id = mail_outbox.enqueue(email)
+    mail_outbox.dispatch(delivery_id, email, background_tasks)
+    return {"status": "success", "message": "Magic link sent. Check your email.", "delivery_id": delivery_id}
+
+@app.get("/auth/login/deliveries/{delivery_id}")
+def get_login_delivery(delivery_id: str):
+    """Status of a magic-link email: queued, sending, sent or failed (with the last SES error)."""
+    record = mail_outbox.status(delivery_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return record
 
 @app.get("/auth/verify")
 def verify(token: str):
@@ -110,7 +166,7 @@ def get_current_user(session_token: Optional[str] = Cookie(None)):
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    email = verify_token(session_token, "session")
+    email = verify_token_cached(session_token, "session")
     if not email:
         raise HTTPException(status_code=401, detail="Invalid session")
         
@@ -120,18 +176,45 @@ def get_current_user(session_token: Optional[str] = Cookie(None)):
 def get_current_user_optional(session_token: Optional[str] = Cookie(None)):
     if not session_token:
         return None
-    email = verify_token(session_token, "session")
+    email = verify_token_cached(session_token, "session")
     return email
 
 # Dependency for protected routes
 def get_current_user_dep(session_token: Optional[str] = Cookie(None)):
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    email = verify_token(session_token, "session")
+    email = verify_token_cached(session_token, "session")
     if not email:
         raise HTTPException(status_code=401, detail="Invalid session")
     return email
 
+def _add_user_context(results: List[Dict[str, Any]], user_email: Optional[str], user_favorites: List[str]) -> None:
+    """Adds upvote defaults and the caller's user_context to search results (in place)."""
+    if user_email:
+        for result in results:
+            # Initialize upvote fields if missing
+            if 'upvotes' not in result:
+                result['upvotes'] = 0
+            if 'upvoted_by' not in result:
+                result['upvoted_by'] = []
+            
+            # Add user context
+            result['user_context'] = {
+                'is_upvoted': user_email in result.get('upvoted_by', []),
+                'is_favorited': result['id'] in user_favorites,
+                'can_edit': result.get('owner_email') == user_email
+            }
+    else:
+        # Add basic context for unauthenticated users
+        for result in results:
+            if 'upvotes' not in result:
+                result['upvotes'] = 0
+            result['user_context'] = {
+                'is_upvoted': False,
+                'is_favorited': False,
+                'can_edit': False
+            }
+
 class Prompt(BaseModel):
     title: str
     description: str
@@ -141,10 +224,18 @@ class Prompt(BaseModel):
     username: Optional[str] = None
     owner_email: Optional[str] = None
     upvotes: Optional[int] = 0
+    # draft_key from /generate-details; not stored with the prompt
+    draft_key: Optional[str] = None
 
 class GenerateRequest(BaseModel):
     title: str
     prompt_text: str
+    # The draft's tools; when given, the draft's embedding is computed speculatively
+    tool_used: Optional[List[str]] = None
+
+class SearchBatchRequest(BaseModel):
+    queries: List[str]
+    limit: int = Field(5, ge=1, le=50)
 
 class UpdateToolsRequest(BaseModel):
     tool_names: List[str]
@@ -159,21 +250,23 @@ class UpdateToolsRequest(BaseModel):
             raise ValueError('tool_names cannot contain empty strings')
         return cleaned
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus-format request and stage latency histograms for this instance."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {"message": "AI Prompt Repository API is running"}
 
 @app.post("/prompts")
-def create_prompt(prompt: Prompt, user_email: str = Depends(get_current_user_dep)):
+def create_prompt(prompt: Prompt, allow_duplicate: bool = False, user_email: str = Depends(get_current_user_dep)):
     try:
         # Set owner email
         prompt.owner_email = user_email
+        prompt_dict = prompt.dict(exclude={"draft_key"})
+        draft_key = prompt.draft_key
         
-        # 1. Save full details to S3
-        prompt_dict = prompt.dict()
-        prompt_id = s3_service.save_prompt(prompt_dict)
-        
-        # 2. Save vector embedding (mock)
         # We construct a text representation for semantic search
         searchable_text = vector_service._construct_searchable_text(
             prompt.title, 
@@ -182,21 +275,39 @@ def create_prompt(prompt: Prompt, user_email: str = Depends(get_current_user_dep
             prompt.tool_used, 
             prompt.tags
         )
+
+        # 1. Near-duplicate check against the stored vectors (see duplicates.py)
+        duplicates = []
+        vector = None
+        check_mode = duplicate_check_mode()
+        if check_mode in ("flag", "reject") and not allow_duplicate:
+            vector = draft_embeddings.embedding_for(searchable_text)
+            matches = vector_service.near_duplicates(vector, duplicate_threshold())
+            catalog = {p["id"]: p for p in s3_service.list_prompts()} if matches else {}
+            duplicates = [
+                {"id": pid, "title": catalog[pid].get("title"), "score": round(score, 4)}
+                for pid, score in matches if pid in catalog
+            ]
+            if duplicates and check_mode == "reject":
+                raise HTTPException(status_code=409, detail={
+                    "message": "A near-identical prompt already exists",
+                    "duplicates": duplicates
+                })
+            if duplicates:
+                prompt_dict["possible_duplicate_of"] = [d["id"] for d in duplicates]
+        
+        # 2. Save full details to S3
+        prompt_id = s3_service.save_prompt(prompt_dict)
         
-        vector_service.add_point(
-            text=searchable_text,
-            metadata={
-                "id": prompt_id,
-                "title": prompt.title,
-                "description": prompt.description,
-                "tags": prompt.tags,
-                "username": prompt.username,
-                "tool_used": prompt.tool_used, # Already validated as List[str] by Pydantic
-                "prompt_text": prompt.prompt_text
-            }
-        )
+        # 3. Queue the vector embedding (written behind the response), reusing the duplicate check's
+        embedding_status = embedding_queue.enqueue(prompt_id, searchable_text, draft_key, vector)
         
-        return {"status": "success", "id": prompt_id}
+        result = {"status": "success", "id": prompt_id, "embedding_status": embedding_status}
+        if duplicates:
+            result["possible_duplicates"] = duplicates
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -209,18 +320,7 @@ def list_prompts(user_email: Optional[str] = Depends(get_current_user_optional))
         # Add user context if authenticated
         if user_email:
             # Get user favorites
-            if s3_service.mock_mode:
-                user_favorites = s3_service.get_user_favorites(user_email)
-            else:
-                user_favorites = []
-                try:
-                    user_data = s3_service.s3.get_object(
-                        Bucket=s3_service.bucket_name,
-                        Key=f"users/{user_email}/favorites.json"
-                    )
-                    user_favorites = json.loads(user_data['Body'].read().decode('utf-8'))
-                except:
-                    user_favorites = []
+            user_favorites = s3_service.get_user_favorites(user_email)
             
             # Add user context to each prompt
             for prompt in prompts:
@@ -266,13 +366,13 @@ def update_prompt(prompt_id: str, prompt: Prompt, user_email: str = Depends(get_
             raise HTTPException(status_code=403, detail="You are not authorized to edit this prompt")
 
         # Update in S3
-        prompt_dict = prompt.dict()
+        prompt_dict = prompt.dict(exclude={"draft_key"})
         prompt_dict['id'] = prompt_id
         prompt_dict['owner_email'] = user_email # Ensure owner is preserved/set
 
         s3_service.update_prompt(prompt_id, prompt_dict)
         
-        # Update vector database
+        # Queue the vector update (written behind the response)
         searchable_text = vector_service._construct_searchable_text(
             prompt.title, 
             prompt.description, 
@@ -280,21 +380,55 @@ def update_prompt(prompt_id: str, prompt: Prompt, user_email: str = Depends(get_
             prompt.tool_used, 
             prompt.tags
         )
+        embedding_status = embedding_queue.enqueue(prompt_id, searchable_text, prompt.draft_key)
         
-        vector_service.add_point(
-            text=searchable_text,
-            metadata={
-                "id": prompt_id,
-                "title": prompt.title,
-                "description": prompt.description,
-                "tags": prompt.tags,
-                "username": prompt.username,
-                "tool_used": prompt.tool_used,
-                "prompt_text": prompt.prompt_text
-            }
-        )
-        
-        return {"status": "success", "id": prompt_id}
+        return {"status": "success", "id": prompt_id, "embedding_status": embedding_status}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/prompts/{prompt_id}/embedding-status")
+def get_embedding_status(prompt_id: str):
+    """Reports whether the prompt's embedding is pending, processing, done or failed."""
+    try:
+        status = embedding_queue.status(prompt_id)
+        if status["embedding_status"] == "missing" and not s3_service.get_prompt_by_id(prompt_id):
+            raise HTTPException(status_code=404, detail="Prompt not found")
+        return status
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/prompts/{prompt_id}/similar")
+def get_similar_prompts(prompt_id: str, limit: int = Query(5, ge=1, le=50),
+                        user_email: Optional[str] = Depends(get_current_user_optional)):
+    """Prompts similar to this one, from its stored vector (no embedding call)"""
+    prompt = s3_service.get_prompt_by_id(prompt_id)
+    if not prompt:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    try:
+        neighbours = similar_prompts.similar(prompt_id, limit)
+        if neighbours is None:
+            # Not embedded (yet): lexical matches on the title
+            fallback = "mock_mode" if vector_service.mock_mode else "no_embedding"
+            results = [p for p in vector_service._mock_search(prompt.get('title', '')) if p['id'] != prompt_id][:limit]
+        else:
+            fallback = None
+            prompt_dict = {p["id"]: p for p in s3_service.list_prompts()}
+            results = []
+            for neighbour_id, score in neighbours:
+                if neighbour_id in prompt_dict:
+                    result = prompt_dict[neighbour_id].copy()
+                    result["score"] = score
+                    results.append(result)
+
+        user_favorites = s3_service.get_user_favorites(user_email) if user_email else []
+        _add_user_context(results, user_email, user_favorites)
+        return {
+            "results": results,
+            "search_mode": "semantic" if fallback is None else "lexical",
+            "fallback_reason": fallback
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -361,57 +495,62 @@ def update_prompt_tools(prompt_id: str, request: UpdateToolsRequest):
 def search_prompts(q: str, user_email: Optional[str] = Depends(get_current_user_optional)):
     """Search prompts with user context"""
     try:
-        results = vector_service.search(q)
+        start = time.perf_counter()
+        trace = {}
+        results = vector_service.search(q, trace=trace)
         
         # Add user context if authenticated
-        if user_email:
-            # Get user favorites
-            if s3_service.mock_mode:
-                user_favorites = s3_service.get_user_favorites(user_email)
-            else:
-                user_favorites = []
-                try:
-                    user_data = s3_service.s3.get_object(
-                        Bucket=s3_service.bucket_name,
-                        Key=f"users/{user_email}/favorites.json"
-                    )
-                    user_favorites = json.loads(user_data['Body'].read().decode('utf-8'))
-                except:
-                    user_favorites = []
-            
-            # Add user context to each result
-            for result in results:
-                # Initialize upvote fields if missing
-                if 'upvotes' not in result:
-                    result['upvotes'] = 0
-                if 'upvoted_by' not in result:
-                    result['upvoted_by'] = []
-                
-                # Add user context
-                result['user_context'] = {
-                    'is_upvoted': user_email in result.get('upvoted_by', []),
-                    'is_favorited': result['id'] in user_favorites,
-                    'can_edit': result.get('owner_email') == user_email
-                }
-        else:
-            # Add basic context for unauthenticated users
-            for result in results:
-                if 'upvotes' not in result:
-                    result['upvotes'] = 0
-                result['user_context'] = {
-                    'is_upvoted': False,
-                    'is_favorited': False,
-                    'can_edit': False
-                }
+        user_favorites = s3_service.get_user_favorites(user_email) if user_email else []
+        _add_user_context(results, user_email, user_favorites)
         
-        return {"results": results}
+        slow_query_log.record(q, (time.perf_counter() - start) * 1000, trace, len(results))
+        # lexical while Gemini's circuit breaker is open (or embeddings are unavailable)
+        search_mode = "semantic" if trace.get("fallback") is None else "lexical"
+        return {"results": results, "search_mode": search_mode, "fallback_reason": trace.get("fallback")}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/batch")
+def search_prompts_batch(request: SearchBatchRequest, user_email: Optional[str] = Depends(get_current_user_optional)):
+    """Searches up to SEARCH_BATCH_MAX_QUERIES queries with one embedding call and one matrix product"""
+    max_queries = int(os.environ.get("SEARCH_BATCH_MAX_QUERIES", "32"))
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries cannot be empty")
+    if len(request.queries) > max_queries:
+        raise HTTPException(status_code=400, detail=f"At most {max_queries} queries per batch")
+    try:
+        answers = vector_service.search_batch(request.queries, limit=request.limit)
+        user_favorites = s3_service.get_user_favorites(user_email) if user_email else []
+        response = []
+        for query, answer in zip(request.queries, answers):
+            _add_user_context(answer["results"], user_email, user_favorites)
+            response.append({
+                "query": query,
+                "results": answer["results"],
+                "search_mode": "semantic" if answer["fallback"] is None else "lexical",
+                "fallback_reason": answer["fallback"]
+            })
+        return {"results": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate-details")
-def generate_details(request: GenerateRequest):
+def generate_details(request: GenerateRequest, user_email: Optional[str] = Depends(get_current_user_optional)):
     try:
         result = vector_service.generate_details(request.title, request.prompt_text)
+        # Only signed-in users (who can save) get a speculative embedding
+        if user_email and request.tool_used is not None and result != GENERATE_FALLBACK:
+            # Embed what create_prompt will see if the user keeps the generated details
+            searchable_text = vector_service._construct_searchable_text(
+                request.title,
+                result.get("description", ""),
+                request.prompt_text,
+                request.tool_used,
+                result.get("tags", [])
+            )
+            draft_key = draft_embeddings.start(searchable_text)
+            if draft_key:
+                result["draft_key"] = draft_key
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -424,7 +563,6 @@ def migrate_embeddings():
     """
     try:
         import numpy as np
-        import io
         
         # Get all prompts from S3
         all_prompts = s3_service.list_prompts()
@@ -461,18 +599,15 @@ def migrate_embeddings():
                     prompt.get('tags', [])
                 )
                 
-                # Generate embedding
-                vector = vector_service._get_embedding_rest(searchable_text)
+                # Generate embedding (one row per chunk for long prompts)
+                vector = vector_service.embed_document(searchable_text)
                 
                 if vector:
                     # Normalize
-                    vec_array = np.array(vector, dtype=np.float32)
-                    norm = np.linalg.norm(vec_array)
-                    if norm > 0:
-                        vec_array = vec_array / norm
+                    rows = vector_service._normalize_rows(np.atleast_2d(np.array(vector, dtype=np.float32)))
                         
-                    ids.append(prompt_id)
-                    vectors.append(vec_array)
+                    ids.extend([prompt_id] * rows.shape[0])
+                    vectors.append(rows)
                     
                     processed += 1
                     results["processed"].append({"id": prompt_id, "title": title})
@@ -484,30 +619,11 @@ def migrate_embeddings():
                 errors += 1
                 results["errors"].append({"id": prompt_id, "title": title, "error": str(e)})
         
-        # Save to S3
-        if not s3_service.mock_mode and len(vectors) > 0:
-            import json
-            
-            # 1. Save Matrix (vectors.npy)
+        # Save to storage
+        if not vector_service.mock_mode and len(vectors) > 0:
+            # Save IDs (ids.json) and Matrix (vectors.npy), replacing whatever was there
             matrix = np.vstack(vectors)
-            buffer = io.BytesIO()
-            np.save(buffer, matrix)
-            buffer.seek(0)
-            
-            s3_service.s3.put_object(
-                Bucket=s3_service.bucket_name,
-                Key="embeddings/vectors.npy",
-                Body=buffer.getvalue(),
-                ContentType='application/octet-stream'
-            )
-            
-            # 2. Save IDs (ids.json)
-            s3_service.s3.put_object(
-                Bucket=s3_service.bucket_name,
-                Key="embeddings/ids.json",
-                Body=json.dumps(ids),
-                ContentType='application/json'
-            )
+            vector_service._write_vectors(ids, matrix, None)
             
             print(f"Successfully migrated {len(vectors)} embeddings to vectors.npy and ids.json.")
         
@@ -524,109 +640,49 @@ def migrate_embeddings():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Migration failed: {str(e)}")
 
+# username -> owner_email backfill for /migrate-owners
+OWNER_EMAIL_MAPPING = {
+    "Rahul Singh Rathore": "RahulSingh.Rathore@in.pega.com",
+    "Devi Vara Prasad B": "DeviVaraPrasad.Bandaru@in.pega.com",
+    "Stuti": "Stuti.Bhushan@in.pega.com",
+    "Abhishek": "abhishek.asthana@pega.com",
+    "Parth": "ParthPandya.Alkeshbhai@in.pega.com"
+}
+
 @app.post("/migrate-owners")
-def migrate_owners():
+def migrate_owners(dry_run: bool = False, restart: bool = False):
     """
     One-time migration to backfill owner_email based on username.
+    Resumable: a "partial" result means call it again to continue (see bulk_migration.py).
     """
     try:
-        MAPPING = {
-            "Rahul Singh Rathore": "RahulSingh.Rathore@in.pega.com",
-            "Devi Vara Prasad B": "DeviVaraPrasad.Bandaru@in.pega.com",
-            "Stuti": "Stuti.Bhushan@in.pega.com",
-            "Abhishek": "abhishek.asthana@pega.com",
-            "Parth": "ParthPandya.Alkeshbhai@in.pega.com"
-        }
-        
-        all_prompts = s3_service.list_prompts()
-        updated_count = 0
-        updated_prompts = []
-        
-        for prompt in all_prompts:
-            username = prompt.get("username")
-            # Check if username matches (case-insensitive or exact? Let's do exact as per request, maybe strip)
-            if username:
-                username_clean = username.strip()
-                if username_clean in MAPPING:
-                    new_email = MAPPING[username_clean]
-                    # Only update if different or missing
-                    if prompt.get("owner_email") != new_email:
-                        prompt["owner_email"] = new_email
-                        s3_service.update_prompt(prompt["id"], prompt)
-                        updated_count += 1
-                        updated_prompts.append({"id": prompt["id"], "title": prompt.get("title"), "username": username, "new_email": new_email})
-        
-        return {
-            "status": "success",
-            "message": f"Updated {updated_count} prompts with owner emails.",
-            "details": updated_prompts
-        }
+        migration = BulkMigration(
+            "owners", owner_transform(OWNER_EMAIL_MAPPING), s3_service, vector_service,
+            describe=lambda old, new: {"id": new["id"], "title": new.get("title"), "username": new.get("username"), "new_email": new["owner_email"]}
+        )
+        result = migration.run(dry_run=dry_run, restart=restart)
+        verb = "Would update" if dry_run else "Updated"
+        result["message"] = f"{verb} {result['updated_count']} prompts with owner emails."
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Owner migration failed: {str(e)}")
 
 @app.post("/migrate-tools")
-def migrate_tools():
+def migrate_tools(dry_run: bool = False, restart: bool = False):
     """
     One-time migration to convert 'tool_used' from string to list[str].
+    Rewritten prompts are re-embedded and committed to the vector store in one write.
+    Resumable: a "partial" result means call it again to continue (see bulk_migration.py).
     """
     try:
-        all_prompts = s3_service.list_prompts()
-        updated_count = 0
-        updated_prompts = []
-        
-        for prompt in all_prompts:
-            tool_used = prompt.get("tool_used")
-            
-            # Check if it's a string (legacy format) or None
-            if tool_used is None or isinstance(tool_used, str):
-                # Convert to list
-                if isinstance(tool_used, str):
-                    new_tool_used = [tool_used] if tool_used.strip() else []
-                else:
-                    new_tool_used = []
-                
-                # Only update if it actually changed (avoid unnecessary writes)
-                # Note: We compare against the original value. 
-                # If original was None, new is []. They are different.
-                # If original was "foo", new is ["foo"]. They are different.
-                
-                prompt["tool_used"] = new_tool_used
-                
-                # Update in S3
-                s3_service.update_prompt(prompt["id"], prompt)
-                
-                # We should also update the embedding because the metadata has changed
-                searchable_text = vector_service._construct_searchable_text(
-                    prompt.get('title', ''), 
-                    prompt.get('description', ''), 
-                    prompt.get('prompt_text', ''), 
-                    new_tool_used, 
-                    prompt.get('tags', [])
-                )
-                
-                vector_service.add_point(
-                    text=searchable_text,
-                    metadata={
-                        "id": prompt["id"],
-                        "title": prompt.get("title"),
-                        "description": prompt.get("description"),
-                        "tags": prompt.get("tags"),
-                        "username": prompt.get("username"),
-                        "tool_used": new_tool_used,
-                        "prompt_text": prompt.get("prompt_text")
-                    }
-                )
-                
-                updated_count += 1
-                updated_prompts.append({"id": prompt["id"], "title": prompt.get("title"), "old_tool": tool_used, "new_tool": new_tool_used})
-                
-        return {
-            "status": "success",
-            "message": f"Scanned {len(all_prompts)} prompts. Updated {updated_count} prompts with list-type tool_used.",
-            "total_scanned": len(all_prompts),
-            "updated_count": updated_count,
-            "details": updated_prompts
-        }
+        migration = BulkMigration(
+            "tools", legacy_tools_transform, s3_service, vector_service, reembed=True,
+            describe=lambda old, new: {"id": new["id"], "title": new.get("title"), "old_tool": old.get("tool_used"), "new_tool": new["tool_used"]}
+        )
+        result = migration.run(dry_run=dry_run, restart=restart)
+        verb = "Would update" if dry_run else "Updated"
+        result["message"] = f"Scanned {result['total_scanned']} prompts. {verb} {result['updated_count']} prompts with list-type tool_used."
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Tool migration failed: {str(e)}")
 
@@ -636,9 +692,7 @@ def delete_prompt_admin(prompt_id: str, x_admin_secret: str = Header(None)):
     Admin endpoint to delete a prompt and its embedding.
     Protected by X-Admin-Secret header.
     """
-    admin_secret = os.environ.get("ADMIN_SECRET_KEY", "admin-secret-dev")
-    if x_admin_secret != admin_secret:
-        raise HTTPException(status_code=403, detail="Invalid admin secret")
+    _check_admin_secret(x_admin_secret)
 
     try:
         # 1. Delete from S3 (JSON)
@@ -648,6 +702,7 @@ def delete_prompt_admin(prompt_id: str, x_admin_secret: str = Header(None)):
 
         # 2. Delete from Vector Store (Embedding)
         # We don't fail hard if vector delete fails, but we log it
+        embedding_queue.cancel(prompt_id)
         vector_deleted = vector_service.delete_point(prompt_id)
         
         return {
@@ -663,6 +718,146 @@ def delete_prompt_admin(prompt_id: str, x_admin_secret: str = Header(None)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
 
+@app.post("/admin/embedding-queue/drain")
+def drain_embedding_queue(include_failed: bool = False, x_admin_secret: str = Header(None)):
+    """
+    Embeds every queued prompt, including jobs left in storage by other or
+    recycled instances. Meant for a schedule on Lambda, where the worker
+    thread is frozen between invocations.
+    """
+    _check_admin_secret(x_admin_secret)
+    try:
+        result = embedding_queue.drain(include_failed=include_failed)
+        result["drafts_pruned"] = draft_embeddings.prune()
+        # Rebuild the "similar prompts" lists if vectors changed
+        result["neighbours_etag"] = similar_prompts.refresh()
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Drain failed: {str(e)}")
+
+@app.get("/admin/duplicates")
+def get_duplicate_report(threshold: Optional[float] = Query(None, ge=0.5, le=1.0), x_admin_secret: str = Header(None)):
+    """Clusters of near-duplicate prompts from a blocked all-pairs pass over the stored vectors."""
+    _check_admin_secret(x_admin_secret)
+    try:
+        threshold = duplicate_threshold() if threshold is None else threshold
+        clusters = duplicate_clusters(vector_service.get_instance(), threshold)
+        prompt_dict = {p["id"]: p for p in s3_service.list_prompts()} if clusters else {}
+        for cluster in clusters:
+            cluster["prompts"] = [
+                {"id": pid, "title": prompt_dict.get(pid, {}).get("title"), "created_at": prompt_dict.get(pid, {}).get("created_at")}
+                for pid in cluster.pop("prompt_ids")
+            ]
+        return {
+            "threshold": threshold,
+            "clusters": clusters,
+            "duplicate_prompts": sum(len(c["prompts"]) for c in clusters)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Duplicate report failed: {str(e)}")
+
+@app.post("/admin/topics/rebuild")
+def rebuild_topics(k: Optional[int] = Query(None, ge=2, le=200), x_admin_secret: str = Header(None)):
+    """Re-clusters all prompt embeddings into topics (mini-batch k-means)."""
+    _check_admin_secret(x_admin_secret)
+    try:
+        return topic_index.rebuild(k)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Topic rebuild failed: {str(e)}")
+
+@app.get("/admin/profiles")
+def list_profiles(x_admin_secret: str = Header(None)):
+    """Lists the request profiles recorded on this instance (newest first)."""
+    _check_admin_secret(x_admin_secret)
+    return {"profiles": list_recent_profiles()}
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "json", x_admin_secret: str = Header(None)):
+    """
+    Returns a request profile by the id from the X-Profile-Id response header.
+    format=collapsed returns the stacks as text for flamegraph.pl or speedscope.
+    """
+    _check_admin_secret(x_admin_secret)
+
+    report = get_recent_profile(profile_id)
+    if report is None:
+        # Recorded by another instance (or before a restart)
+        try:
+            obj = s3_service.storage.get(f"profiles/{profile_id}.json")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to load profile: {str(e)}")
+        if obj is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        report = json.loads(obj[0].decode('utf-8'))
+
+    if format == "collapsed":
+        return PlainTextResponse(report["collapsed"])
+    return report
+
+@app.get("/admin/slow-queries")
+def get_slow_queries(limit: int = 20, include_flushed: bool = False, days: int = 1, x_admin_secret: str = Header(None)):
+    """
+    Returns the N slowest logged searches with their per-stage breakdown.
+    include_flushed also reads the entries other instances flushed to storage
+    over the last `days` days (needs SLOW_QUERY_FLUSH=true).
+    """
+    _check_admin_secret(x_admin_secret)
+
+    try:
+        entries = slow_query_log.worst(limit)
+        if include_flushed:
+            by_id = {e["id"]: e for e in slow_query_log.load_flushed(days)}
+            by_id.update({e["id"]: e for e in entries})
+            entries = sorted(by_id.values(), key=lambda e: e["total_ms"], reverse=True)[:limit]
+        return {
+            "threshold_ms": slow_query_log.threshold_ms,
+            "count": len(entries),
+            "queries": entries
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load slow queries: {str(e)}")
+
+@app.get("/admin/export")
+def export_prompts(include_vectors: bool = False, x_admin_secret: str = Header(None)):
+    """
+    Streams every prompt as NDJSON (one JSON object per line) without
+    buffering the corpus. include_vectors adds each prompt's embedding.
+    """
+    _check_admin_secret(x_admin_secret)
+
+    filename = f"prompts-{time.strftime('%Y%m%d-%H%M%S')}.ndjson"
+    return StreamingResponse(
+        export_lines(s3_service, vector_service, include_vectors=include_vectors),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/admin/import")
+async def import_prompts(request: Request, embed: bool = True, x_admin_secret: str = Header(None)):
+    """
+    Imports an NDJSON stream (the /admin/export format, or one prompt object
+    per line). Prompts keep their ids, so re-importing is idempotent. Lines
+    without a vector are embedded in batches if embed=true, and the vector
+    store is written once at the end.
+    """
+    _check_admin_secret(x_admin_secret)
+
+    importer = BulkImporter(s3_service, vector_service, embed=embed)
+    try:
+        pending = b""
+        async for chunk in request.stream():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                if importer.add_line(line):
+                    # Storage and Gemini calls block, so batches run in the threadpool
+                    await run_in_threadpool(importer.flush_batch)
+        if pending:
+            importer.add_line(pending)
+        return await run_in_threadpool(importer.finish)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Import failed after {importer.imported} prompts: {str(e)}")
+
 # Tool Metadata API Endpoints
 
 @app.get("/tools")
@@ -776,42 +971,56 @@ def get_tools_by_category(category_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/topics")
+def get_topics():
+    """Topics discovered from the prompt embeddings, labelled by their most frequent tags"""
+    try:
+        return topic_index.topics()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/topics/{topic_id}/prompts")
+def get_topic_prompts(topic_id: int, limit: Optional[int] = None,
+                      user_email: Optional[str] = Depends(get_current_user_optional)):
+    """Prompts assigned to a topic"""
+    try:
+        topic = topic_index.topic(topic_id)
+        if topic is None:
+            raise HTTPException(status_code=404, detail="Topic not found")
+        
+        members = set(topic["prompt_ids"])
+        prompts = [p for p in s3_service.list_prompts() if p["id"] in members]
+        prompts.sort(key=lambda p: p.get("upvotes", 0), reverse=True)
+        if limit:
+            prompts = prompts[:limit]
+        user_favorites = s3_service.get_user_favorites(user_email) if user_email else []
+        _add_user_context(prompts, user_email, user_favorites)
+        return {"topic": topic["topic"], "prompts": prompts}
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # User Interaction Endpoints (Upvotes and Favorites)
 
 @app.post("/prompts/{prompt_id}/upvote")
 def upvote_prompt(prompt_id: str, user_email: str = Depends(get_current_user_dep)):
     """Upvote a prompt (optimized)"""
     try:
-        # Get the specific prompt (optimized - no need to fetch all prompts)
-        prompt = s3_service.get_prompt_by_id(prompt_id)
+        # Read-modify-write on the prompt, or a transactional increment on SQLite
+        upvotes = s3_service.add_upvote(prompt_id, user_email)
         
-        if not prompt:
+        if upvotes is None:
             raise HTTPException(status_code=404, detail="Prompt not found")
         
-        # Initialize upvotes if not present
-        if 'upvotes' not in prompt:
-            prompt['upvotes'] = 0
-        
-        # Initialize upvoted_by list if not present
-        if 'upvoted_by' not in prompt:
-            prompt['upvoted_by'] = []
-        
-        # Check if user already upvoted
-        if user_email in prompt['upvoted_by']:
-            raise HTTPException(status_code=400, detail="Already upvoted")
-        
-        # Add upvote
-        prompt['upvotes'] += 1
-        prompt['upvoted_by'].append(user_email)
-        
-        # Update in S3
-        s3_service.update_prompt(prompt_id, prompt)
-        
         return {
             "status": "success",
-            "upvotes": prompt['upvotes'],
+            "upvotes": upvotes,
             "message": "Prompt upvoted successfully"
         }
+    except ValueError as ve:
+        # Already upvoted
+        raise HTTPException(status_code=400, detail=str(ve))
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -821,34 +1030,19 @@ def upvote_prompt(prompt_id: str, user_email: str = Depends(get_current_user_dep
 def remove_upvote(prompt_id: str, user_email: str = Depends(get_current_user_dep)):
     """Remove upvote from a prompt (optimized)"""
     try:
-        # Get the specific prompt (optimized - no need to fetch all prompts)
-        prompt = s3_service.get_prompt_by_id(prompt_id)
+        upvotes = s3_service.remove_upvote(prompt_id, user_email)
         
-        if not prompt:
+        if upvotes is None:
             raise HTTPException(status_code=404, detail="Prompt not found")
         
-        # Initialize fields if not present
-        if 'upvotes' not in prompt:
-            prompt['upvotes'] = 0
-        if 'upvoted_by' not in prompt:
-            prompt['upvoted_by'] = []
-        
-        # Check if user has upvoted
-        if user_email not in prompt['upvoted_by']:
-            raise HTTPException(status_code=400, detail="Not upvoted")
-        
-        # Remove upvote
-        prompt['upvotes'] = max(0, prompt['upvotes'] - 1)
-        prompt['upvoted_by'].remove(user_email)
-        
-        # Update in S3
-        s3_service.update_prompt(prompt_id, prompt)
-        
         return {
             "status": "success",
-            "upvotes": prompt['upvotes'],
+            "upvotes": upvotes,
             "message": "Upvote removed successfully"
         }
+    except ValueError as ve:
+        # Not upvoted
+        raise HTTPException(status_code=400, detail=str(ve))
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -858,24 +1052,8 @@ def remove_upvote(prompt_id: str, user_email: str = Depends(get_current_user_dep
 def get_user_favorites(user_email: str = Depends(get_current_user_dep)):
     """Get user's favorite prompts (optimized)"""
     try:
-        if s3_service.mock_mode:
-            # Get favorites from in-memory storage
-            favorite_ids = s3_service.get_user_favorites(user_email)
-            favorite_prompts = s3_service.get_prompts_by_ids(favorite_ids)
-            return {
-                "favorites": favorite_prompts,
-                "count": len(favorite_prompts)
-            }
-        
-        # Real S3 implementation - get favorite IDs first
-        try:
-            user_data = s3_service.s3.get_object(
-                Bucket=s3_service.bucket_name,
-                Key=f"users/{user_email}/favorites.json"
-            )
-            favorite_ids = json.loads(user_data['Body'].read().decode('utf-8'))
-        except:
-            favorite_ids = []
+        # Get favorite IDs first
+        favorite_ids = s3_service.get_user_favorites(user_email)
         
         # Fetch only the favorited prompts (optimized - no need to fetch all prompts)
         favorite_prompts = s3_service.get_prompts_by_ids(favorite_ids)
@@ -885,8 +1063,6 @@ def get_user_favorites(user_email: str = Depends(get_current_user_dep)):
             "count": len(favorite_prompts)
         }
     except Exception as e:
-        if s3_service.mock_mode:
-            return {"favorites": [], "count": 0}
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/users/me/favorites/{prompt_id}")
@@ -895,43 +1071,13 @@ def add_to_favorites(prompt_id: str, user_email: str = Depends(get_current_user_
     try:
         # Note: We skip the prompt existence check to avoid fetching all prompts
         # The prompt will simply not appear if it doesn't exist or gets deleted later
-        
-        if s3_service.mock_mode:
-            # Use in-memory storage for mock mode
-            success = s3_service.add_user_favorite(user_email, prompt_id)
-            favorite_ids = s3_service.get_user_favorites(user_email)
-            return {
-                "status": "success",
-                "message": "Added to favorites" if success else "Already in favorites",
-                "favorites_count": len(favorite_ids)
-            }
-        
-        # Real S3 implementation
-        try:
-            user_data = s3_service.s3.get_object(
-                Bucket=s3_service.bucket_name,
-                Key=f"users/{user_email}/favorites.json"
-            )
-            favorites = json.loads(user_data['Body'].read().decode('utf-8'))
-        except:
-            favorites = []
-        
-        # Add to favorites if not already there
-        if prompt_id not in favorites:
-            favorites.append(prompt_id)
-            
-            # Save back to S3
-            s3_service.s3.put_object(
-                Bucket=s3_service.bucket_name,
-                Key=f"users/{user_email}/favorites.json",
-                Body=json.dumps(favorites),
-                ContentType='application/json'
-            )
+        success = s3_service.add_user_favorite(user_email, prompt_id)
+        favorite_ids = s3_service.get_user_favorites(user_email)
         
         return {
             "status": "success",
-            "message": "Added to favorites",
-            "favorites_count": len(favorites)
+            "message": "Added to favorites" if success else "Already in favorites",
+            "favorites_count": len(favorite_ids)
         }
     except HTTPException as he:
         raise he
@@ -942,42 +1088,13 @@ def add_to_favorites(prompt_id: str, user_email: str = Depends(get_current_user_
 def remove_from_favorites(prompt_id: str, user_email: str = Depends(get_current_user_dep)):
     """Remove a prompt from user's favorites"""
     try:
-        if s3_service.mock_mode:
-            # Use in-memory storage for mock mode
-            success = s3_service.remove_user_favorite(user_email, prompt_id)
-            favorite_ids = s3_service.get_user_favorites(user_email)
-            return {
-                "status": "success",
-                "message": "Removed from favorites" if success else "Not in favorites",
-                "favorites_count": len(favorite_ids)
-            }
-        
-        # Real S3 implementation
-        try:
-            user_data = s3_service.s3.get_object(
-                Bucket=s3_service.bucket_name,
-                Key=f"users/{user_email}/favorites.json"
-            )
-            favorites = json.loads(user_data['Body'].read().decode('utf-8'))
-        except:
-            favorites = []
-        
-        # Remove from favorites if present
-        if prompt_id in favorites:
-            favorites.remove(prompt_id)
-            
-            # Save back to S3
-            s3_service.s3.put_object(
-                Bucket=s3_service.bucket_name,
-                Key=f"users/{user_email}/favorites.json",
-                Body=json.dumps(favorites),
-                ContentType='application/json'
-            )
+        success = s3_service.remove_user_favorite(user_email, prompt_id)
+        favorite_ids = s3_service.get_user_favorites(user_email)
         
         return {
             "status": "success",
-            "message": "Removed from favorites",
-            "favorites_count": len(favorites)
+            "message": "Removed from favorites" if success else "Not in favorites",
+            "favorites_count": len(favorite_ids)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
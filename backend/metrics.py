@@ -0,0 +1,225 @@
+"""
+In-process latency metrics: per-route and per-stage histograms exposed in the
+Prometheus text format at /metrics, and a Server-Timing header per response.
+
+Stages are timed with `stage("s3.get")` (a context manager) or `@timed("gemini.embed")`.
+Stdlib only, so importing it stays cheap on a Lambda cold start. Each Lambda
+execution environment keeps its own registry, so scrape or aggregate per instance.
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Seconds; covers sub-millisecond numpy steps up to Gemini timeouts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed label set."""
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float, int]]:
+        with self._lock:
+            return {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, label_values, le_label)} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Counter:
+    """Monotonic counter with a fixed label set."""
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+class Gauge(Counter):
+    """Value that can go up and down (set() replaces it)."""
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+_registry: List = []
+_registry_lock = threading.Lock()
+
+def register(metric):
+    """Adds a metric to the /metrics output and returns it."""
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+REQUEST_LATENCY = register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ("method", "route", "status")))
+STAGE_LATENCY = register(Histogram(
+    "stage_duration_seconds", "Latency of instrumented stages (S3 calls, Gemini calls, numpy scoring, ...)",
+    ("stage",)))
+STAGE_ERRORS = register(Counter(
+    "stage_errors_total", "Instrumented stages that raised", ("stage",)))
+
+def render_metrics() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Per-request accumulation of {stage: [total_seconds, count]} for Server-Timing.
+# The middleware sets a fresh dict; route handlers running in the threadpool
+# get a copy of the context that still points at the same dict.
+_request_stages: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar(
+    "request_stages", default=None)
+
+def record_stage(name: str, seconds: float) -> None:
+    """Records one completed stage in the histogram and the current request's timings."""
+    STAGE_LATENCY.observe(seconds, name)
+    stages = _request_stages.get()
+    if stages is not None:
+        entry = stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+@contextmanager
+def stage(name: str, trace: Optional[Dict[str, float]] = None):
+    """
+    Times the enclosed block as stage `name`. If trace is given, the elapsed
+    milliseconds are also added to trace[name] (used by the slow-query log).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        record_stage(name, elapsed)
+        if trace is not None:
+            trace[name] = trace.get(name, 0.0) + elapsed * 1000
+
+def timed(name: str):
+    """Decorator form of stage()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def begin_request() -> contextvars.Token:
+    return _request_stages.set({})
+
+def current_stages() -> Dict[str, List[float]]:
+    return dict(_request_stages.get() or {})
+
+def end_request(token: contextvars.Token) -> None:
+    _request_stages.reset(token)
+
+def server_timing_header(stages: Dict[str, List[float]], total_seconds: float) -> str:
+    """Formats stage timings as a Server-Timing header value (durations in ms)."""
+    parts = []
+    for name, (seconds, count) in sorted(stages.items(), key=lambda item: -item[1][0]):
+        metric = name.replace(" ", "_")
+        desc = f';desc="{count}x"' if count > 1 else ""
+        parts.append(f"{metric};dur={seconds * 1000:.1f}{desc}")
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records request latency per route template and adds a
+    Server-Timing header with the stages recorded while handling the request.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        token = begin_request()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                header = server_timing_header(current_stages(), time.perf_counter() - start)
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners can't blow up cardinality
+            route_label = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.observe(time.perf_counter() - start, scope.get("method", ""), route_label, str(status["code"]))
+            end_request(token)
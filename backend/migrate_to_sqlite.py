@@ -0,0 +1,61 @@
+"""
+Copies a bucket in the current layout (prompts/*.json, users/*/favorites.json,
+embeddings/*) into a SQLite database for single-node deployments.
+
+Run this with:
+    python3 -m backend.migrate_to_sqlite --source s3 --bucket llm-prompt-repository --sqlite-path ./data/prompts.db
+    python3 -m backend.migrate_to_sqlite --source local --source-dir ./data/bucket --sqlite-path ./data/prompts.db
+
+Re-running is safe: every key is upserted.
+"""
+import argparse
+import os
+import time
+
+from .storage import S3StorageBackend, LocalStorageBackend
+from .sqlite_storage import SQLiteStorageBackend
+
+# Derived from writes; the SQLite backend doesn't need it
+SKIPPED_KEYS = {"catalog/manifest.json"}
+
+def migrate(source, destination, prefixes=("prompts/", "users/", "embeddings/")) -> dict:
+    """Copies every key under prefixes from source to destination. Returns counts per prefix."""
+    counts = {}
+    for prefix in prefixes:
+        copied = 0
+        for key in source.list_keys(prefix):
+            if key in SKIPPED_KEYS:
+                continue
+            obj = source.get(key)
+            if obj is None:
+                continue  # Deleted while we were listing
+            content_type = 'application/octet-stream' if key.endswith('.npy') else 'application/json'
+            destination.put(key, obj[0], content_type=content_type)
+            copied += 1
+            if copied % 500 == 0:
+                print(f"  {prefix}: {copied} objects copied...")
+        counts[prefix] = copied
+        print(f"Copied {copied} objects under {prefix}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate prompts/*.json storage into SQLite")
+    parser.add_argument("--source", choices=["s3", "local"], default="s3")
+    parser.add_argument("--bucket", default=os.environ.get("S3_BUCKET_NAME", "llm-prompt-repository"))
+    parser.add_argument("--source-dir", default=os.environ.get("LOCAL_STORAGE_DIR", "./data"))
+    parser.add_argument("--sqlite-path", default=os.environ.get("SQLITE_PATH", "./data/prompts.db"))
+    args = parser.parse_args()
+
+    if args.source == "s3":
+        source = S3StorageBackend(args.bucket)
+    else:
+        source = LocalStorageBackend(args.source_dir)
+    destination = SQLiteStorageBackend(args.sqlite_path)
+
+    start = time.time()
+    counts = migrate(source, destination)
+    prompt_count = len(destination.query_prompts())
+    print(f"Done in {time.time() - start:.1f}s: {counts}. {prompt_count} prompts in {args.sqlite_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+On-demand profiling of a single request for admins.
+
+A request carrying `X-Profile: 1` and a valid `X-Admin-Secret` is sampled
+by a background thread; everything else pays only a header lookup. The
+response gets an `X-Profile-Id` header and the report is kept in memory and
+handed to a persistence callback (main.py writes it to profiles/{id}.json so
+it survives on Lambda, where the next request may hit another instance).
+
+Sync routes run in the threadpool, so a deterministic profiler started in
+the middleware would never see them. The sampler instead reads every
+thread's stack and keeps the ones running code from this package. On Lambda
+an instance serves one request at a time; under uvicorn, concurrent requests
+in the same code paths can show up in the report.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_THIS_FILE = os.path.abspath(__file__)
+
+def profiling_interval() -> float:
+    """Seconds between samples (PROFILE_SAMPLE_INTERVAL_MS, default 2ms)."""
+    return float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "2")) / 1000.0
+
+class SamplingProfiler:
+    """Samples the stacks of threads running backend code until stop() is called."""
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval or profiling_interval()
+        self._stacks: Counter = Counter()
+        self._labels: Dict[Any, str] = {}
+        self._backend_labels = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+            self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            if code.co_filename.startswith(_PACKAGE_DIR):
+                self._backend_labels.add(label)
+        return label
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                relevant = False
+                while frame is not None:
+                    filename = frame.f_code.co_filename
+                    if filename.startswith(_PACKAGE_DIR) and filename != _THIS_FILE:
+                        relevant = True
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                if relevant:
+                    stack.reverse()
+                    self._stacks[tuple(stack)] += 1
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope."""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self._stacks.most_common())
+
+    def report(self, top: int = 30) -> Dict[str, Any]:
+        """
+        Sample counts per function plus the collapsed stacks. top_self covers
+        every function (json, numpy, botocore leaves); top_cumulative only
+        this package's, where framework frames would otherwise crowd it out.
+        """
+        self_counts: Counter = Counter()
+        cumulative: Counter = Counter()
+        for stack, count in self._stacks.items():
+            self_counts[stack[-1]] += count
+            for label in set(stack) & self._backend_labels:
+                cumulative[label] += count
+        total = sum(self._stacks.values()) or 1
+        as_rows = lambda counter: [
+            {"function": label, "samples": count, "percent": round(100.0 * count / total, 1)}
+            for label, count in counter.most_common(top)
+        ]
+        return {
+            "duration_ms": round(self.duration * 1000, 1),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "stack_samples": sum(self._stacks.values()),
+            "top_self": as_rows(self_counts),
+            "top_cumulative": as_rows(cumulative),
+            "collapsed": self.collapsed(),
+        }
+
+# Most recent reports on this instance
+_recent_profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_recent_lock = threading.Lock()
+MAX_RECENT_PROFILES = 20
+
+def remember_profile(profile_id: str, report: Dict[str, Any]) -> None:
+    with _recent_lock:
+        _recent_profiles[profile_id] = report
+        while len(_recent_profiles) > MAX_RECENT_PROFILES:
+            _recent_profiles.popitem(last=False)
+
+def get_recent_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    with _recent_lock:
+        return _recent_profiles.get(profile_id)
+
+def list_recent_profiles():
+    with _recent_lock:
+        return [
+            {"id": pid, "path": r["path"], "method": r["method"], "status": r["status"], "duration_ms": r["duration_ms"]}
+            for pid, r in reversed(_recent_profiles.items())
+        ]
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles requests sent with `X-Profile` by an admin.
+    A missing or wrong secret just serves the request unprofiled.
+    """
+    def __init__(self, app, on_report: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.app = app
+        self.on_report = on_report
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        raw_headers = scope.get("headers") or []
+        if not any(name == b"x-profile" for name, _ in raw_headers):
+            await self.app(scope, receive, send)
+            return
+        admin_secret = os.environ.get("ADMIN_SECRET_KEY", "admin-secret-dev").encode("latin-1")
+        if dict(raw_headers).get(b"x-admin-secret") != admin_secret:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:12]
+        profiler = SamplingProfiler().start()
+        status = {"code": 500}
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                profiler.stop()
+                status["code"] = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            profiler.stop()
+            report = profiler.report()
+            report.update({
+                "id": profile_id,
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "status": status["code"],
+                "created_at": time.time(),
+            })
+            remember_profile(profile_id, report)
+            print(f"Profiled {scope.get('method')} {scope.get('path')} as {profile_id}: "
+                  f"{report['stack_samples']} samples over {report['duration_ms']}ms")
+            if self.on_report is not None:
+                from starlette.concurrency import run_in_threadpool
+                try:
+                    # Off the event loop: persisting usually means an S3 PUT
+                    await run_in_threadpool(self.on_report, profile_id, report)
+                except Exception as e:
+                    print(f"Error persisting profile {profile_id}: {e}")
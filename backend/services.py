@@ -1,25 +1,82 @@
-import boto3
+import copy
+import hashlib
 import json
 import uuid
 import os
 import time
-import requests
-import numpy as np
 import io
-from typing import List, Dict, Any, Optional
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime
 from botocore.exceptions import ClientError
+from .circuit_breaker import DependencyGuard, DependencyUnavailable
+from .metrics import Counter, register, stage
+from .similarity import blocked_top_k, cache_block_rows, parallel_top_k
+from .single_flight import SingleFlight
+from .snapshot import SnapshotStore, snapshots_enabled
+from .storage import get_boto3_client, create_storage_backend, PreconditionFailed, NOT_MODIFIED
+
+# numpy and requests are imported on the code paths that need them so that
+# importing this module stays cheap on a Lambda cold start.
+
+GENERATE_MODEL = "gemini-2.0-flash-lite"
+# Returned by generate_details when Gemini fails (never cached)
+GENERATE_FALLBACK = {
+    "tags": ["error", "generation-failed"],
+    "description": "Failed to generate description. Please try again."
+}
+GENERATE_CACHE = register(Counter(
+    "generate_details_cache_total", "/generate-details lookups by result (hit, miss, shared)", ("result",)))
+
+class LazyService:
+    """
+    Proxy that constructs a service on first attribute access.
+    Keeps module-level singletons in main.py without paying for boto3 clients
+    on routes that never touch them.
+    """
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get_instance(self):
+        """Returns the wrapped service, constructing it if needed."""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._instance is not None
+
+    def override(self, instance):
+        """Replaces the wrapped service (used by benchmarks to swap storage backends)."""
+        with self._lock:
+            self._instance = instance
+
+    def __getattr__(self, name):
+        return getattr(self.get_instance(), name)
 
 class SESService:
     def __init__(self):
         self.mock_mode = os.environ.get("MOCK_MODE", "false").lower() == "true"
         self.sender_email = os.environ.get("SES_SENDER_EMAIL", "no-reply@pega.com")
         self._mock_verified_emails = set() # Track verified emails in mock mode
+        # email -> (status, expires_at). Verified identities rarely change, so
+        # "Success" is kept for a day; anything else is re-checked soon after.
+        self._status_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._status_lock = threading.Lock()
+        self.verified_ttl = float(os.environ.get("SES_VERIFIED_TTL_SECONDS", "86400"))
+        self.unverified_ttl = float(os.environ.get("SES_UNVERIFIED_TTL_SECONDS", "30"))
         
         if self.mock_mode:
             print("SESService: Initialized in MOCK MODE")
         else:
-            self.ses = boto3.client('ses')
+            self.ses = get_boto3_client('ses')
 
     def get_identity_status(self, email: str) -> str:
         """Checks if the email is verified in SES."""
@@ -35,16 +92,36 @@ class SESService:
             print(f"SESService (Mock): Checking status for {email} -> Success")
             return "Success"
 
+        with self._status_lock:
+            cached = self._status_cache.get(email)
+            if cached is not None and cached[1] > time.time():
+                return cached[0]
+
         try:
-            response = self.ses.get_identity_verification_attributes(Identities=[email])
+            with stage("ses.get_identity_status"):
+                response = self.ses.get_identity_verification_attributes(Identities=[email])
             attributes = response.get('VerificationAttributes', {})
             if email in attributes:
-                return attributes[email]['VerificationStatus']
-            return "NotFound"
+                status = attributes[email]['VerificationStatus']
+            else:
+                status = "NotFound"
         except ClientError as e:
             print(f"Error checking identity status: {e}")
+            # Not cached: the next login asks SES again
             return "Error"
 
+        ttl = self.verified_ttl if status == "Success" else self.unverified_ttl
+        with self._status_lock:
+            self._status_cache[email] = (status, time.time() + ttl)
+            self._status_cache.move_to_end(email)
+            while len(self._status_cache) > 4096:
+                self._status_cache.popitem(last=False)
+        return status
+
+    def invalidate_identity_status(self, email: str) -> None:
+        with self._status_lock:
+            self._status_cache.pop(email, None)
+
     def verify_email(self, email: str) -> bool:
         """Triggers SES verification email."""
         if self.mock_mode:
@@ -53,8 +130,11 @@ class SESService:
             self._mock_verified_emails.add(email)
             return True
 
+        # The status changes once the user clicks the AWS link
+        self.invalidate_identity_status(email)
         try:
-            self.ses.verify_email_identity(EmailAddress=email)
+            with stage("ses.verify_email"):
+                self.ses.verify_email_identity(EmailAddress=email)
             print(f"Verification email sent to {email}")
             return True
         except ClientError as e:
@@ -63,6 +143,15 @@ class SESService:
 
     def send_magic_link(self, recipient_email: str, magic_link: str):
         """Sends the magic link via SES."""
+        try:
+            self.deliver_magic_link(recipient_email, magic_link)
+            return True
+        except ClientError as e:
+            print(f"Error sending email: {e.response['Error']['Message']}")
+            return False
+
+    def deliver_magic_link(self, recipient_email: str, magic_link: str) -> None:
+        """Sends the magic link via SES, raising ClientError on failure (see mail_outbox.py)."""
         subject = "Your Login Link"
         body_text = f"Click here to log in: {magic_link}\n\nThis link expires in 15 minutes."
         body_html = f"""<html>
@@ -84,9 +173,9 @@ class SESService:
             print(f"SESService (Mock): Sending email to {recipient_email}")
             print(f"Subject: {subject}")
             print(f"Link: {magic_link}")
-            return True
+            return
 
-        try:
+        with stage("ses.send_email"):
             self.ses.send_email(
                 Source=self.sender_email,
                 Destination={
@@ -109,167 +198,321 @@ class SESService:
                     }
                 }
             )
-            print(f"Email sent to {recipient_email}")
-            return True
-        except ClientError as e:
-            print(f"Error sending email: {e.response['Error']['Message']}")
-            return False
+        print(f"Email sent to {recipient_email}")
+
+def _dummy_prompts() -> List[Dict[str, Any]]:
+    """Seed data for MOCK_MODE."""
+    return [
+        {
+            "id": "dummy-1",
+            "title": "Python Fibonacci Generator",
+            "description": "A highly efficient Fibonacci sequence generator using memoization to optimize performance for large numbers. This implementation avoids recursion depth issues.",
+            "tool_used": ["ChatGPT"],
+            "prompt_text": "Write a python function for fibonacci sequence using memoization. Ensure it handles large inputs efficiently.",
+            "tags": ["python", "algorithm", "optimization"],
+            "username": "Alice",
+            "created_at": datetime.now().isoformat()
+        },
+        {
+            "id": "dummy-2",
+            "title": "React Loading Button",
+            "description": "A reusable React button component that accepts a loading prop. It disables the button and shows a spinning loader icon when the loading state is true, preventing multiple submissions.",
+            "tool_used": ["Claude", "Cursor"],
+            "prompt_text": "Create a React button component that accepts a loading prop and shows a spinner. Use Tailwind CSS for styling.",
+            "tags": ["react", "frontend", "ui", "components"],
+            "username": "Bob",
+            "created_at": datetime.now().isoformat()
+        },
+        {
+            "id": "dummy-3",
+            "title": "SQL Join Masterclass",
+            "description": "A comprehensive explanation of different types of SQL joins (INNER, LEFT, RIGHT, FULL) with clear, practical examples using two sample tables: 'Customers' and 'Orders'.",
+            "tool_used": ["Gemini"],
+            "prompt_text": "Explain INNER, LEFT, RIGHT, and FULL OUTER joins in SQL with simple examples using Customers and Orders tables.",
+            "tags": ["sql", "database", "tutorial", "backend"],
+            "username": "Charlie",
+            "created_at": datetime.now().isoformat()
+        },
+        {
+            "id": "dummy-4",
+            "title": "AWS Lambda Deployment Script",
+            "description": "A shell script to package a Python FastAPI application and deploy it to AWS Lambda via S3. It handles dependency installation, zipping, and AWS CLI commands.",
+            "tool_used": ["Copilot"],
+            "prompt_text": "Write a bash script to zip a python lambda function with dependencies and upload to S3.",
+            "tags": ["aws", "devops", "bash", "lambda"],
+            "username": "Dave",
+            "created_at": datetime.now().isoformat()
+        },
+        {
+            "id": "dummy-5",
+            "title": "FastAPI CRUD Boilerplate",
+            "description": "A complete starter template for a FastAPI backend with SQLAlchemy, Pydantic models, and CRUD operations for a 'User' resource. Includes Dockerfile.",
+            "tool_used": ["ChatGPT", "Cursor"],
+            "prompt_text": "Generate a production-ready FastAPI boilerplate with SQLAlchemy, Pydantic, and Docker support.",
+            "tags": ["python", "fastapi", "backend", "docker"],
+            "username": "Eve",
+            "created_at": datetime.now().isoformat()
+        },
+        {
+            "id": "dummy-6",
+            "title": "Midjourney Portrait Prompts",
+            "description": "A collection of high-quality prompts for generating realistic cyberpunk portraits in Midjourney v6. Focuses on lighting, texture, and color grading.",
+            "tool_used": ["Midjourney"],
+            "prompt_text": "Cyberpunk street samurai, neon rain, cinematic lighting, 8k resolution, photorealistic --v 6.0",
+            "tags": ["art", "midjourney", "generative-ai", "cyberpunk"],
+            "username": "Frank",
+            "created_at": datetime.now().isoformat()
+        }
+    ]
 
 class S3Service:
-    def __init__(self, bucket_name: str = None):
+    def __init__(self, bucket_name: str = None, storage=None):
         self.bucket_name = bucket_name or os.environ.get("S3_BUCKET_NAME", "llm-prompt-repository")
         self.mock_mode = os.environ.get("MOCK_MODE", "false").lower() == "true"
-        
+
+        # Object store with the bucket's key layout (S3, local disk or in-memory, see STORAGE_BACKEND)
+        self.storage = storage or create_storage_backend(self.bucket_name)
+        print(f"S3Service: Using {self.storage.name} storage backend")
+
+        # In-memory catalog ({prompt_id: prompt}) validated against the ETag of
+        # catalog/manifest.json, which every write through this service rewrites.
+        # A /tmp snapshot lets a fresh execution environment skip the crawl.
+        self._catalog = None
+        self._catalog_etag = None
+        self._catalog_lock = threading.Lock()
+        self._catalog_flight = SingleFlight("catalog")
+        self._catalog_snapshot = None
+        if self.storage.is_remote and snapshots_enabled():
+            self._catalog_snapshot = SnapshotStore("catalog")
+
         if self.mock_mode:
-            print("S3Service: Initialized in MOCK MODE (In-Memory Storage)")
-            self._local_storage = [
-                {
-                    "id": "dummy-1",
-                    "title": "Python Fibonacci Generator",
-                    "description": "A highly efficient Fibonacci sequence generator using memoization to optimize performance for large numbers. This implementation avoids recursion depth issues.",
-                    "tool_used": ["ChatGPT"],
-                    "prompt_text": "Write a python function for fibonacci sequence using memoization. Ensure it handles large inputs efficiently.",
-                    "tags": ["python", "algorithm", "optimization"],
-                    "username": "Alice",
-                    "created_at": datetime.now().isoformat()
-                },
-                {
-                    "id": "dummy-2",
-                    "title": "React Loading Button",
-                    "description": "A reusable React button component that accepts a loading prop. It disables the button and shows a spinning loader icon when the loading state is true, preventing multiple submissions.",
-                    "tool_used": ["Claude", "Cursor"],
-                    "prompt_text": "Create a React button component that accepts a loading prop and shows a spinner. Use Tailwind CSS for styling.",
-                    "tags": ["react", "frontend", "ui", "components"],
-                    "username": "Bob",
-                    "created_at": datetime.now().isoformat()
-                },
-                {
-                    "id": "dummy-3",
-                    "title": "SQL Join Masterclass",
-                    "description": "A comprehensive explanation of different types of SQL joins (INNER, LEFT, RIGHT, FULL) with clear, practical examples using two sample tables: 'Customers' and 'Orders'.",
-                    "tool_used": ["Gemini"],
-                    "prompt_text": "Explain INNER, LEFT, RIGHT, and FULL OUTER joins in SQL with simple examples using Customers and Orders tables.",
-                    "tags": ["sql", "database", "tutorial", "backend"],
-                    "username": "Charlie",
-                    "created_at": datetime.now().isoformat()
-                },
-                {
-                    "id": "dummy-4",
-                    "title": "AWS Lambda Deployment Script",
-                    "description": "A shell script to package a Python FastAPI application and deploy it to AWS Lambda via S3. It handles dependency installation, zipping, and AWS CLI commands.",
-                    "tool_used": ["Copilot"],
-                    "prompt_text": "Write a bash script to zip a python lambda function with dependencies and upload to S3.",
-                    "tags": ["aws", "devops", "bash", "lambda"],
-                    "username": "Dave",
-                    "created_at": datetime.now().isoformat()
-                },
-                {
-                    "id": "dummy-5",
-                    "title": "FastAPI CRUD Boilerplate",
-                    "description": "A complete starter template for a FastAPI backend with SQLAlchemy, Pydantic models, and CRUD operations for a 'User' resource. Includes Dockerfile.",
-                    "tool_used": ["ChatGPT", "Cursor"],
-                    "prompt_text": "Generate a production-ready FastAPI boilerplate with SQLAlchemy, Pydantic, and Docker support.",
-                    "tags": ["python", "fastapi", "backend", "docker"],
-                    "username": "Eve",
-                    "created_at": datetime.now().isoformat()
-                },
-                {
-                    "id": "dummy-6",
-                    "title": "Midjourney Portrait Prompts",
-                    "description": "A collection of high-quality prompts for generating realistic cyberpunk portraits in Midjourney v6. Focuses on lighting, texture, and color grading.",
-                    "tool_used": ["Midjourney"],
-                    "prompt_text": "Cyberpunk street samurai, neon rain, cinematic lighting, 8k resolution, photorealistic --v 6.0",
-                    "tags": ["art", "midjourney", "generative-ai", "cyberpunk"],
-                    "username": "Frank",
-                    "created_at": datetime.now().isoformat()
-                }
-            ]
-            # Add in-memory favorites storage for mock mode
-            self._local_favorites = {}  # Format: {user_email: [prompt_id1, prompt_id2, ...]}
-        else:
-            self.s3 = boto3.client('s3')
+            print("S3Service: Initialized in MOCK MODE (seeding dummy prompts)")
+            if not any(True for _ in self.storage.list_keys('prompts/')):
+                for prompt in _dummy_prompts():
+                    self.storage.put(self._prompt_key(prompt['id']), json.dumps(prompt))
+                self._touch_catalog_manifest()
+
+    CATALOG_MANIFEST_KEY = "catalog/manifest.json"
+
+    @staticmethod
+    def _prompt_key(prompt_id: str) -> str:
+        return f"prompts/{prompt_id}.json"
+
+    @staticmethod
+    def _favorites_key(user_email: str) -> str:
+        return f"users/{user_email}/favorites.json"
+
+    def _touch_catalog_manifest(self) -> Optional[str]:
+        """Rewrites the catalog manifest so other instances see a new ETag. Returns the new ETag."""
+        try:
+            return self.storage.put(
+                self.CATALOG_MANIFEST_KEY,
+                json.dumps({"generation": str(uuid.uuid4()), "updated_at": datetime.now().isoformat()})
+            )
+        except Exception as e:
+            print(f"Error updating catalog manifest: {e}")
+            return None
+
+    def _get_catalog_manifest_etag(self) -> Optional[str]:
+        """One HEAD request that tells us whether the cached catalog is still current."""
+        try:
+            etag = self.storage.head(self.CATALOG_MANIFEST_KEY)
+            if etag is None:
+                # Buckets written before the manifest existed: create one now
+                return self._touch_catalog_manifest()
+            return etag
+        except Exception as e:
+            print(f"Error checking catalog manifest: {e}")
+            return None
+
+    def _crawl_prompts(self) -> List[Dict[str, Any]]:
+        """Lists and fetches every prompts/*.json object."""
+        prompts = []
+        with stage("catalog.crawl"):
+            for key in self.storage.list_keys('prompts/'):
+                if key.endswith('.json'):
+                    # Get each object (Note: Inefficient for large datasets, but fine for MVP)
+                    obj = self.storage.get(key)
+                    if obj is not None:
+                        prompts.append(json.loads(obj[0].decode('utf-8')))
+        return prompts
+
+    def _load_catalog_snapshot(self, etag: str) -> None:
+        """Adopts the /tmp catalog snapshot if it was built from the current manifest."""
+        if self._catalog_snapshot is None:
+            return
+        snapshot = self._catalog_snapshot.load()
+        if snapshot is None or snapshot.validator != etag:
+            return
+        try:
+            prompts = json.loads(snapshot.sections["catalog"].decode('utf-8'))
+            self._catalog = {p['id']: p for p in prompts}
+            self._catalog_etag = etag
+            print(f"S3Service: Loaded catalog snapshot ({len(prompts)} prompts)")
+        except Exception as e:
+            print(f"S3Service: Ignoring unreadable catalog snapshot: {e}")
+            self._catalog_snapshot.discard()
+
+    def _save_catalog_snapshot(self) -> None:
+        if self._catalog_snapshot is None or self._catalog is None:
+            return
+        payload = json.dumps(list(self._catalog.values())).encode('utf-8')
+        self._catalog_snapshot.save(self._catalog_etag, {"catalog": payload})
+
+    def _update_cached_catalog(self, prompt_id: str, prompt_data: Optional[Dict[str, Any]]) -> None:
+        """Applies a local write to the cached catalog (None deletes) and records the new manifest ETag."""
+        self._update_cached_catalog_many({prompt_id: prompt_data})
+
+    def _update_cached_catalog_many(self, changes: Dict[str, Optional[Dict[str, Any]]]) -> None:
+        """
+        Applies several local writes with a single manifest update. If another
+        instance wrote since our last validation, the cached catalog is dropped
+        instead, so the next list_prompts crawls and picks up that write too.
+        """
+        if self.storage.native_prompt_queries or not changes:
+            return
+        with self._catalog_lock:
+            known_etag = self._catalog_etag if self._catalog is not None else None
+        current_etag = None
+        if known_etag:
+            try:
+                current_etag = self.storage.head(self.CATALOG_MANIFEST_KEY)
+            except Exception as e:
+                print(f"Error checking catalog manifest: {e}")
+        new_etag = self._touch_catalog_manifest()
+        with self._catalog_lock:
+            if self._catalog is None:
+                return
+            if not new_etag or current_etag != known_etag or self._catalog_etag != known_etag:
+                self._catalog = None
+                self._catalog_etag = None
+                return
+            for prompt_id, prompt_data in changes.items():
+                if prompt_data is None:
+                    self._catalog.pop(prompt_id, None)
+                else:
+                    self._catalog[prompt_id] = dict(prompt_data)
+            self._catalog_etag = new_etag
 
     def save_prompt(self, prompt_data: Dict[str, Any]) -> str:
-        """Saves prompt data to S3 or local memory and returns the key."""
+        """Saves prompt data to storage and returns the key."""
         prompt_id = str(uuid.uuid4())
         prompt_data['id'] = prompt_id
         prompt_data['created_at'] = datetime.now().isoformat()
         
-        if self.mock_mode:
-            self._local_storage.append(prompt_data)
-            print(f"S3Service (Mock): Saved prompt {prompt_id}")
-            return prompt_id
-        
-        key = f"prompts/{prompt_id}.json"
+        key = self._prompt_key(prompt_id)
         
         try:
-            self.s3.put_object(
-                Bucket=self.bucket_name,
-                Key=key,
-                Body=json.dumps(prompt_data),
-                ContentType='application/json'
-            )
+            self.storage.put(key, json.dumps(prompt_data))
+            self._update_cached_catalog(prompt_id, prompt_data)
             return prompt_id
         except Exception as e:
             print(f"Error saving to S3: {e}")
             raise e
 
+    def put_prompts(self, prompts: List[Dict[str, Any]], max_workers: int = 8) -> Dict[str, str]:
+        """
+        Writes prompts as-is (ids included) with bounded concurrency and one
+        manifest update for the whole batch. Returns {prompt_id: error} for
+        the prompts that failed.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        def put(prompt):
+            try:
+                self.storage.put(self._prompt_key(prompt['id']), json.dumps(prompt))
+                return None
+            except Exception as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            outcomes = list(pool.map(put, prompts))
+
+        errors = {p['id']: error for p, error in zip(prompts, outcomes) if error}
+        self._update_cached_catalog_many({p['id']: p for p in prompts if p['id'] not in errors})
+        return errors
+
+    def iter_prompts(self, prefetch: int = 16):
+        """
+        Yields every stored prompt without holding the whole catalog in memory.
+        Up to `prefetch` GETs are in flight at a time to hide S3 latency.
+        """
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+
+        def fetch(key):
+            obj = self.storage.get(key)
+            return json.loads(obj[0].decode('utf-8')) if obj is not None else None
+
+        with ThreadPoolExecutor(max_workers=max(1, prefetch)) as pool:
+            window = deque()
+            for key in self.storage.list_keys('prompts/'):
+                if not key.endswith('.json'):
+                    continue
+                window.append(pool.submit(fetch, key))
+                if len(window) >= prefetch:
+                    prompt = window.popleft().result()
+                    if prompt is not None:
+                        yield prompt
+            while window:
+                prompt = window.popleft().result()
+                if prompt is not None:
+                    yield prompt
+
     def update_prompt(self, prompt_id: str, prompt_data: Dict[str, Any]) -> None:
-        """Updates an existing prompt in S3 or local memory."""
+        """Updates an existing prompt in storage."""
         # Preserve created_at if updating
         if 'created_at' not in prompt_data:
             prompt_data['created_at'] = datetime.now().isoformat()
         
-        if self.mock_mode:
-            for i, p in enumerate(self._local_storage):
-                if p.get('id') == prompt_id:
-                    # Preserve original created_at
-                    if 'created_at' in p:
-                        prompt_data['created_at'] = p['created_at']
-                    self._local_storage[i] = prompt_data
-                    print(f"S3Service (Mock): Updated prompt {prompt_id}")
-                    return
-            raise Exception(f"Prompt {prompt_id} not found in mock storage")
-        
-        key = f"prompts/{prompt_id}.json"
+        key = self._prompt_key(prompt_id)
         
         try:
             # Try to get existing prompt to preserve created_at
             try:
-                obj_resp = self.s3.get_object(Bucket=self.bucket_name, Key=key)
-                existing_data = json.loads(obj_resp['Body'].read().decode('utf-8'))
-                if 'created_at' in existing_data:
-                    prompt_data['created_at'] = existing_data['created_at']
+                existing = self.storage.get(key)
+                if existing is not None:
+                    existing_data = json.loads(existing[0].decode('utf-8'))
+                    if 'created_at' in existing_data:
+                        prompt_data['created_at'] = existing_data['created_at']
             except:
                 pass  # If can't get existing, use new timestamp
             
-            self.s3.put_object(
-                Bucket=self.bucket_name,
-                Key=key,
-                Body=json.dumps(prompt_data),
-                ContentType='application/json'
-            )
+            self.storage.put(key, json.dumps(prompt_data))
+            self._update_cached_catalog(prompt_id, prompt_data)
         except Exception as e:
             print(f"Error updating S3: {e}")
             raise e
 
     def list_prompts(self) -> List[Dict[str, Any]]:
-        """Returns all prompts from S3 or local memory."""
-        if self.mock_mode:
-            return self._local_storage
+        """Returns all prompts from storage."""
+        if self.storage.native_prompt_queries:
+            return self.storage.query_prompts()
+
+        # Concurrent callers share one manifest check (and one crawl if it's stale)
+        prompts, _ = self._catalog_flight.do("catalog", self._load_catalog)
+        # Copies, because callers attach per-user context to the dicts
+        return [dict(p) for p in prompts]
 
+    def _load_catalog(self) -> List[Dict[str, Any]]:
+        """Validates the cached catalog against the manifest, crawling if it is stale."""
         try:
-            # List objects in the bucket
-            response = self.s3.list_objects_v2(Bucket=self.bucket_name, Prefix='prompts/')
-            prompts = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    if key.endswith('.json'):
-                        # Get each object (Note: Inefficient for large datasets, but fine for MVP)
-                        obj_resp = self.s3.get_object(Bucket=self.bucket_name, Key=key)
-                        content = obj_resp['Body'].read().decode('utf-8')
-                        prompts.append(json.loads(content))
+            etag = self._get_catalog_manifest_etag()
+
+            with self._catalog_lock:
+                if self._catalog is None and etag:
+                    self._load_catalog_snapshot(etag)
+                if self._catalog is not None and etag and etag == self._catalog_etag:
+                    return list(self._catalog.values())
+
+            # Cache is stale or unvalidated: full crawl
+            prompts = self._crawl_prompts()
+
+            if etag:
+                with self._catalog_lock:
+                    self._catalog = {p['id']: p for p in prompts if 'id' in p}
+                    self._catalog_etag = etag
+                    self._save_catalog_snapshot()
             return prompts
         except Exception as e:
             print(f"Error listing from S3: {e}")
@@ -277,90 +520,150 @@ class S3Service:
 
     def get_prompts_by_ids(self, prompt_ids: List[str]) -> List[Dict[str, Any]]:
         """Fetch specific prompts by their IDs (optimized for favorites)."""
-        if self.mock_mode:
-            return [p for p in self._local_storage if p['id'] in prompt_ids]
-
         prompts = []
         for prompt_id in prompt_ids:
-            try:
-                key = f"prompts/{prompt_id}.json"
-                obj_resp = self.s3.get_object(Bucket=self.bucket_name, Key=key)
-                content = obj_resp['Body'].read().decode('utf-8')
-                prompts.append(json.loads(content))
-            except ClientError as e:
-                if e.response['Error']['Code'] != 'NoSuchKey':
-                    print(f"Error fetching prompt {prompt_id}: {e}")
-                # Skip missing prompts (they may have been deleted)
-                continue
-            except Exception as e:
-                print(f"Error fetching prompt {prompt_id}: {e}")
-                continue
+            prompt = self.get_prompt_by_id(prompt_id)
+            # Skip missing prompts (they may have been deleted)
+            if prompt is not None:
+                prompts.append(prompt)
         
         return prompts
 
     def get_prompt_by_id(self, prompt_id: str) -> Optional[Dict[str, Any]]:
         """Fetch a single prompt by ID (optimized)."""
-        if self.mock_mode:
-            return next((p for p in self._local_storage if p['id'] == prompt_id), None)
-
         try:
-            key = f"prompts/{prompt_id}.json"
-            obj_resp = self.s3.get_object(Bucket=self.bucket_name, Key=key)
-            content = obj_resp['Body'].read().decode('utf-8')
-            return json.loads(content)
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchKey':
+            obj = self.storage.get(self._prompt_key(prompt_id))
+            if obj is None:
                 return None
-            print(f"Error fetching prompt {prompt_id}: {e}")
-            return None
+            return json.loads(obj[0].decode('utf-8'))
         except Exception as e:
             print(f"Error fetching prompt {prompt_id}: {e}")
             return None
 
     def delete_prompt(self, prompt_id: str) -> bool:
-        """Deletes a prompt from S3 or local memory."""
-        if self.mock_mode:
-            initial_len = len(self._local_storage)
-            self._local_storage = [p for p in self._local_storage if p['id'] != prompt_id]
-            if len(self._local_storage) < initial_len:
-                print(f"S3Service (Mock): Deleted prompt {prompt_id}")
-                return True
-            return False
-
-        key = f"prompts/{prompt_id}.json"
+        """Deletes a prompt from storage."""
+        key = self._prompt_key(prompt_id)
         try:
-            self.s3.delete_object(Bucket=self.bucket_name, Key=key)
-            print(f"Deleted prompt {prompt_id} from S3")
+            if self.storage.head(key) is None:
+                return False
+            if not self.storage.delete(key):
+                return False
+            self._update_cached_catalog(prompt_id, None)
+            print(f"Deleted prompt {prompt_id} from {self.storage.name} storage")
             return True
-        except ClientError as e:
+        except Exception as e:
             print(f"Error deleting from S3: {e}")
             return False
 
+    def list_prompts_by_tool(self, tool_name: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Prompts that list tool_name in tool_used (case-insensitive), newest first."""
+        if self.storage.native_prompt_queries:
+            return self.storage.query_prompts(tool=tool_name, limit=limit)
+
+        tool_prompts = []
+        for prompt in self.list_prompts():
+            tool_used = prompt.get("tool_used", [])
+            if isinstance(tool_used, str):
+                tool_used = [tool_used]
+            
+            # Check if tool matches by display name (case-insensitive)
+            if any(tool.lower() == tool_name.lower() for tool in tool_used):
+                tool_prompts.append(prompt)
+
+        # Sort by creation date (newest first)
+        tool_prompts.sort(key=lambda x: x.get("created_at", ""), reverse=True)
+        
+        # Apply limit if specified
+        if limit:
+            tool_prompts = tool_prompts[:limit]
+        
+        return tool_prompts
+
+    def search_text(self, query_text: str) -> Optional[List[Dict[str, Any]]]:
+        """Lexical search served by the backend, or None if it has no index."""
+        if self.storage.native_prompt_queries:
+            return self.storage.search_text(query_text)
+        return None
+
+    def add_upvote(self, prompt_id: str, user_email: str) -> Optional[int]:
+        """
+        Upvotes a prompt and returns the new count (None if the prompt doesn't exist).
+        Raises ValueError if the user already upvoted it.
+        """
+        if self.storage.native_prompt_queries:
+            return self.storage.add_upvote(prompt_id, user_email)
+
+        prompt = self.get_prompt_by_id(prompt_id)
+        if not prompt:
+            return None
+        
+        # Initialize upvote fields if not present
+        prompt.setdefault('upvotes', 0)
+        prompt.setdefault('upvoted_by', [])
+        
+        if user_email in prompt['upvoted_by']:
+            raise ValueError("Already upvoted")
+        
+        prompt['upvotes'] += 1
+        prompt['upvoted_by'].append(user_email)
+        self.update_prompt(prompt_id, prompt)
+        return prompt['upvotes']
+
+    def remove_upvote(self, prompt_id: str, user_email: str) -> Optional[int]:
+        """
+        Removes a user's upvote and returns the new count (None if the prompt doesn't exist).
+        Raises ValueError if the user has not upvoted it.
+        """
+        if self.storage.native_prompt_queries:
+            return self.storage.remove_upvote(prompt_id, user_email)
+
+        prompt = self.get_prompt_by_id(prompt_id)
+        if not prompt:
+            return None
+        
+        prompt.setdefault('upvotes', 0)
+        prompt.setdefault('upvoted_by', [])
+        
+        if user_email not in prompt['upvoted_by']:
+            raise ValueError("Not upvoted")
+        
+        prompt['upvotes'] = max(0, prompt['upvotes'] - 1)
+        prompt['upvoted_by'].remove(user_email)
+        self.update_prompt(prompt_id, prompt)
+        return prompt['upvotes']
+
     def get_user_favorites(self, user_email: str) -> List[str]:
-        """Get user's favorite prompt IDs (mock mode only)"""
-        if self.mock_mode:
-            return self._local_favorites.get(user_email, [])
-        return []
+        """Get user's favorite prompt IDs"""
+        if self.storage.native_prompt_queries:
+            return self.storage.get_favorites(user_email)
+        try:
+            obj = self.storage.get(self._favorites_key(user_email))
+            return json.loads(obj[0].decode('utf-8')) if obj else []
+        except Exception as e:
+            print(f"Error loading favorites for {user_email}: {e}")
+            return []
 
     def add_user_favorite(self, user_email: str, prompt_id: str) -> bool:
-        """Add a prompt to user's favorites (mock mode only)"""
-        if self.mock_mode:
-            if user_email not in self._local_favorites:
-                self._local_favorites[user_email] = []
-            if prompt_id not in self._local_favorites[user_email]:
-                self._local_favorites[user_email].append(prompt_id)
-                print(f"S3Service (Mock): Added prompt {prompt_id} to favorites for {user_email}")
-                return True
-        return False
+        """Add a prompt to user's favorites. Returns False if it was already there."""
+        if self.storage.native_prompt_queries:
+            return self.storage.add_favorite(user_email, prompt_id)
+        favorites = self.get_user_favorites(user_email)
+        if prompt_id in favorites:
+            return False
+        favorites.append(prompt_id)
+        self.storage.put(self._favorites_key(user_email), json.dumps(favorites))
+        return True
 
     def remove_user_favorite(self, user_email: str, prompt_id: str) -> bool:
-        """Remove a prompt from user's favorites (mock mode only)"""
-        if self.mock_mode:
-            if user_email in self._local_favorites and prompt_id in self._local_favorites[user_email]:
-                self._local_favorites[user_email].remove(prompt_id)
-                print(f"S3Service (Mock): Removed prompt {prompt_id} from favorites for {user_email}")
-                return True
-        return False
+        """Remove a prompt from user's favorites. Returns False if it was not there."""
+        if self.storage.native_prompt_queries:
+            return self.storage.remove_favorite(user_email, prompt_id)
+        favorites = self.get_user_favorites(user_email)
+        if prompt_id not in favorites:
+            return False
+        favorites.remove(prompt_id)
+        self.storage.put(self._favorites_key(user_email), json.dumps(favorites))
+        return True
 
 import time
 
@@ -375,9 +678,58 @@ class VectorService:
             return
 
         self.gemini_api_key = os.environ.get("GEMINI_API_KEY")
+        # Overridable so benchmarks and tests can point at a local stub
+        self.gemini_api_base = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com").rstrip("/")
+        self.storage = s3_service.storage
+        # Circuit breaker + adaptive concurrency limit around every Gemini call
+        self.gemini_guard = DependencyGuard("gemini")
+
+        # (ids, matrix, etag) of the last vectors.npy we saw, plus its /tmp snapshot
+        self._vectors_cache = None
+        self._vectors_lock = threading.Lock()
+        self._vectors_flight = SingleFlight("vectors")
+        self._vectors_snapshot = None
+        # Optional persistent local shard (e.g. /tmp or an EFS mount): vectors.npy is
+        # streamed to disk, memory-mapped read-only and searched in blocks of rows,
+        # so search memory stays flat as the corpus grows. It replaces the snapshot.
+        self.shard_dir = os.environ.get("VECTOR_SHARD_DIR") or None
+        self.shard_block_rows = int(os.environ.get("VECTOR_SHARD_BLOCK_ROWS", "4096"))
+        if self.storage.is_remote and snapshots_enabled() and not self.shard_dir:
+            self._vectors_snapshot = SnapshotStore("vectors")
+        # Optional multi-threaded scoring for large matrices (SEARCH_THREADS <= 1 keeps one core)
+        self.search_threads = int(os.environ.get("SEARCH_THREADS", "0"))
+        self.parallel_min_rows = int(os.environ.get("SEARCH_PARALLEL_MIN_ROWS", "50000"))
+        self._scoring_pool = None
+        self._scoring_pool_lock = threading.Lock()
         
-        if not self.mock_mode and not self.s3_service.mock_mode:
-            self.s3 = boto3.client('s3')
+        # /generate-details results by hash of (title, prompt_text, model); errors are never cached
+        self._details_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._details_lock = threading.Lock()
+        self._details_flight = SingleFlight("generate_details")
+        self.details_cache_size = int(os.environ.get("GENERATE_CACHE_SIZE", "256"))
+        self.details_cache_ttl = float(os.environ.get("GENERATE_CACHE_TTL_SECONDS", "3600"))
+
+        # Long searchable text is embedded as several chunks (0 = one vector per prompt).
+        # ids.json maps rows to prompts; a chunked prompt's rows are contiguous.
+        self.chunk_chars = int(os.environ.get("EMBEDDING_CHUNK_CHARS", "0"))
+        self.chunk_overlap = int(os.environ.get("EMBEDDING_CHUNK_OVERLAP", "200"))
+        self.max_chunks = int(os.environ.get("EMBEDDING_MAX_CHUNKS", "8"))
+        # How row scores become a prompt score: "max" (best chunk) or "mean"
+        self.chunk_aggregation = os.environ.get("EMBEDDING_CHUNK_AGGREGATION", "max").lower()
+        self._groups_cache = None
+
+        # Reduced-dimension primary index: writers with EMBEDDING_INDEX_DIM store the first
+        # dimensions of each unit vector, renormalized, as embeddings/vectors_{dim}.npy. Search
+        # loads only that matrix, picks EMBEDDING_RERANK_CANDIDATES rows and re-scores them with
+        # full vectors read by range from vectors.npy. Readers use a stored index unless it is 0.
+        configured_dim = os.environ.get("EMBEDDING_INDEX_DIM")
+        self.configured_index_dim = int(configured_dim) if configured_dim not in (None, "") else None
+        self.rerank_candidates = int(os.environ.get("EMBEDDING_RERANK_CANDIDATES", "100"))
+        self.rerank_fetch_threads = int(os.environ.get("EMBEDDING_RERANK_FETCH_THREADS", "16"))
+        self._rerank_pool = None
+        # (index.json etag, meta, memory-mapped reduced matrix) and (vectors etag, header size, dtype)
+        self._index_state = None
+        self._vectors_header = None
         
         if not self.gemini_api_key:
             print("WARNING: GEMINI_API_KEY missing. Semantic search will fallback to mock.")
@@ -392,100 +744,578 @@ class VectorService:
             
         return f"{title} {description} {prompt_text} {tools_str} {' '.join(tags)}"
 
-    def _get_embedding_rest(self, text: str):
-        """Generates embedding using Gemini REST API."""
+    def _gemini_post(self, url: str, payload: Dict[str, Any], timeout: float, stage_name: str,
+                     trace: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        POSTs to Gemini through the circuit breaker and returns the JSON body.
+        Raises DependencyUnavailable when the breaker or the concurrency limit
+        refuses the call. 4xx responses other than 429 don't count against Gemini.
+        """
+        import requests
+
+        client_error = None
+        with self.gemini_guard.call():
+            with stage(stage_name, trace):
+                response = requests.post(url, headers={"Content-Type": "application/json"}, json=payload, timeout=timeout)
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    client_error = response
+                else:
+                    response.raise_for_status()
+                    return response.json()
+        client_error.raise_for_status()
+
+    def _get_embedding_rest(self, text: str, trace: Optional[Dict[str, Any]] = None):
+        """
+        Generates embedding using Gemini REST API. Returns None on failure; if
+        the circuit breaker refused the call, trace["rejected"] says why.
+        """
         if not self.gemini_api_key:
             return None
-            
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent?key={self.gemini_api_key}"
-        headers = {"Content-Type": "application/json"}
+
+        url = f"{self.gemini_api_base}/v1beta/models/text-embedding-004:embedContent?key={self.gemini_api_key}"
         payload = {
             "model": "models/text-embedding-004",
             "content": {"parts": [{"text": text}]}
         }
         
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._gemini_post(url, payload, 10, "gemini.embed", trace)
             return data["embedding"]["values"]
+        except DependencyUnavailable as e:
+            if trace is not None:
+                trace["rejected"] = e.reason
+            return None
         except Exception as e:
             print(f"Error generating embedding via REST: {e}")
             return None
 
+    def _get_embeddings_batch(self, texts: List[str], trace: Optional[Dict[str, Any]] = None) -> List[Optional[list]]:
+        """
+        Embeds many texts with batchEmbedContents (up to 100 per request).
+        Returns one vector per text, None where a batch failed; if the circuit
+        breaker refused a request, trace["rejected"] says why.
+        """
+        if not self.gemini_api_key or not texts:
+            return [None] * len(texts)
+
+        url = f"{self.gemini_api_base}/v1beta/models/text-embedding-004:batchEmbedContents?key={self.gemini_api_key}"
+        vectors: List[Optional[list]] = []
+        for start in range(0, len(texts), 100):
+            chunk = texts[start:start + 100]
+            payload = {"requests": [
+                {"model": "models/text-embedding-004", "content": {"parts": [{"text": text}]}}
+                for text in chunk
+            ]}
+            try:
+                data = self._gemini_post(url, payload, 30, "gemini.embed_batch", trace)
+                vectors.extend(e["values"] for e in data["embeddings"])
+            except DependencyUnavailable as e:
+                print(f"Skipping batch embeddings: {e}")
+                if trace is not None:
+                    trace["rejected"] = e.reason
+                vectors.extend([None] * len(chunk))
+            except Exception as e:
+                print(f"Error generating batch embeddings via REST: {e}")
+                vectors.extend([None] * len(chunk))
+        return vectors
+
+    def _chunk_text(self, text: str) -> List[str]:
+        """
+        Splits text longer than EMBEDDING_CHUNK_CHARS into overlapping windows,
+        cut at whitespace. Returns [text] when chunking is off or the text fits.
+        """
+        size = self.chunk_chars
+        if size <= 0 or len(text) <= size:
+            return [text]
+
+        chunks = []
+        start = 0
+        while len(chunks) < self.max_chunks:
+            end = min(len(text), start + size)
+            if end < len(text):
+                cut = text.rfind(" ", start + size // 2, end)
+                if cut > start:
+                    end = cut
+            chunks.append(text[start:end].strip())
+            if end >= len(text):
+                break
+            start = max(end - self.chunk_overlap, start + 1)
+            space = text.find(" ", start, end)
+            if space != -1:
+                start = space + 1
+        return chunks
+
+    def embed_document(self, text: str):
+        """
+        Embeds one prompt's searchable text: a vector, a list of chunk vectors
+        when the text was chunked, or None on failure.
+        """
+        chunks = self._chunk_text(text)
+        if len(chunks) == 1:
+            return self._get_embedding_rest(text)
+        vectors = self._get_embeddings_batch(chunks)
+        return vectors if all(vectors) else None
+
+    def embed_documents(self, texts: List[str]) -> List[Any]:
+        """
+        Batch version of embed_document: every chunk of every text goes
+        through batchEmbedContents. None where any chunk of a text failed.
+        """
+        chunked = [self._chunk_text(text) for text in texts]
+        flat = self._get_embeddings_batch([chunk for chunks in chunked for chunk in chunks])
+        results = []
+        position = 0
+        for chunks in chunked:
+            vectors = flat[position:position + len(chunks)]
+            position += len(chunks)
+            if not all(vectors):
+                results.append(None)
+            else:
+                results.append(vectors[0] if len(vectors) == 1 else vectors)
+        return results
+
     def _normalize(self, vector):
         """Normalizes a vector to unit length."""
+        import numpy as np
         norm = np.linalg.norm(vector)
         if norm == 0:
             return vector
         return vector / norm
 
+    @staticmethod
+    def _normalize_rows(matrix):
+        """Normalizes each row of a 2-D array to unit length."""
+        import numpy as np
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _row_groups(self, ids: List[str], etag: Optional[str]):
+        """
+        (starts, prompt_ids) for a store where some prompt has several rows:
+        the first row of each prompt and its id. None when every prompt has
+        one row. Cached per vectors.npy ETag.
+        """
+        import numpy as np
+
+        cached = self._groups_cache
+        if etag and cached is not None and cached[0] == etag:
+            return cached[1]
+        if len(set(ids)) == len(ids):
+            groups = None
+        else:
+            starts = [0] + [i for i in range(1, len(ids)) if ids[i] != ids[i - 1]]
+            groups = (np.array(starts, dtype=np.intp), [ids[i] for i in starts])
+        if etag:
+            self._groups_cache = (etag, groups)
+        return groups
+
+    def _aggregate_rows(self, similarities, ids: List[str], etag: Optional[str]):
+        """
+        Collapses row scores (axis 0) to one score per prompt with a single
+        reduceat over the chunk groups (max-sim, or mean). Returns
+        (scores, prompt_ids); unchanged when no prompt is chunked.
+        """
+        import numpy as np
+
+        groups = self._row_groups(ids, etag)
+        if groups is None:
+            return similarities, ids
+        starts, prompt_ids = groups
+        if self.chunk_aggregation == "mean":
+            counts = np.diff(np.append(starts, len(ids)))
+            counts = counts.reshape((-1,) + (1,) * (similarities.ndim - 1))
+            return np.add.reduceat(similarities, starts, axis=0) / counts, prompt_ids
+        return np.maximum.reduceat(similarities, starts, axis=0), prompt_ids
+
+    def _prompt_matrix(self, ids: List[str], matrix, etag: Optional[str]):
+        """
+        (prompt_ids, matrix) with one unit row per prompt: a chunked prompt is
+        represented by the normalized mean of its chunk vectors.
+        """
+        import numpy as np
+
+        groups = self._row_groups(ids, etag)
+        if groups is None:
+            return ids, matrix
+        starts, prompt_ids = groups
+        return prompt_ids, self._normalize_rows(np.add.reduceat(matrix, starts, axis=0))
+
+    def _write_index(self, ids: List[str], matrix, vectors_etag: Optional[str]) -> None:
+        """
+        Stores the reduced-dimension index for vectors_etag: vectors_{dim}.npy
+        (the first EMBEDDING_INDEX_DIM columns, renormalized) and index.json,
+        which records the ids and the vectors.npy and index ETags it matches.
+        """
+        import numpy as np
+
+        dim = self.configured_index_dim or 0
+        if not vectors_etag or not 0 < dim < matrix.shape[1]:
+            return
+        with stage("numpy.reduce_index"):
+            reduced = np.empty((matrix.shape[0], dim), dtype=np.float32)
+            for start in range(0, matrix.shape[0], 8192):
+                reduced[start:start + 8192] = self._normalize_rows(np.asarray(matrix[start:start + 8192, :dim]))
+            buffer = io.BytesIO()
+            np.save(buffer, reduced)
+        index_etag = self.storage.put(f"embeddings/vectors_{dim}.npy", buffer.getvalue(),
+                                      content_type='application/octet-stream')
+        # A concurrent writer replaced vectors.npy in the meantime; its index is the one to keep
+        if self.storage.head("embeddings/vectors.npy") != vectors_etag:
+            return
+        self.storage.put("embeddings/index.json", json.dumps({
+            "index_dim": dim,
+            "full_dim": int(matrix.shape[1]),
+            "rows": int(matrix.shape[0]),
+            "vectors_etag": vectors_etag,
+            "index_etag": index_etag,
+            "ids": ids,
+            "recorded_at": datetime.now().isoformat(),
+        }))
+
+    def _load_index(self):
+        """
+        (meta, reduced) for the stored reduced-dimension index, or None when
+        there is none or EMBEDDING_INDEX_DIM is 0. index.json is a conditional
+        GET; vectors_{dim}.npy is downloaded only when it changed, and is
+        memory-mapped rather than read into memory.
+        """
+        if self.configured_index_dim == 0 or self.mock_mode:
+            return None
+        index, _ = self._vectors_flight.do("index", self._fetch_index)
+        return index
+
+    def _fetch_index(self):
+        import numpy as np
+
+        cached = self._index_state
+        obj = self.storage.get_if_changed("embeddings/index.json", cached[0] if cached else None)
+        if obj is NOT_MODIFIED:
+            return cached[1], cached[2]
+        self._index_state = None
+        if obj is None:
+            return None
+        meta = json.loads(obj[0].decode('utf-8'))
+
+        directory = self.shard_dir or tempfile.gettempdir()
+        os.makedirs(directory, exist_ok=True)
+        fd, downloaded = tempfile.mkstemp(dir=directory, prefix=".index-", suffix=".npy")
+        os.close(fd)
+        try:
+            index_etag = self.storage.download_to(f"embeddings/vectors_{meta['index_dim']}.npy", downloaded)
+            if index_etag != meta["index_etag"]:
+                print("VectorService: Reduced index does not match index.json (being rewritten?); not using it")
+                return None
+            # The mapping stays valid after the file is unlinked below, so nothing is left to clean up
+            reduced = np.load(downloaded, mmap_mode="r")
+        finally:
+            os.remove(downloaded)
+        if reduced.shape != (meta["rows"], meta["index_dim"]) or len(meta["ids"]) != meta["rows"]:
+            print(f"Warning: reduced index {reduced.shape} does not match index.json ({meta['rows']} rows); not using it")
+            return None
+        self._index_state = (obj[1], meta, reduced)
+        print(f"VectorService: Loaded reduced index ({meta['rows']} x {meta['index_dim']}, memory-mapped)")
+        return meta, reduced
+
+    def _get_rerank_pool(self):
+        """Thread pool for the re-ranking range reads, created on first use."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._scoring_pool_lock:
+            if self._rerank_pool is None:
+                self._rerank_pool = ThreadPoolExecutor(
+                    max_workers=self.rerank_fetch_threads, thread_name_prefix="rerank-fetch")
+            return self._rerank_pool
+
+    def _read_vector_rows(self, rows, meta: Dict[str, Any]):
+        """
+        The given rows (sorted) of vectors.npy as a (len(rows), D) float32 array,
+        read with conditional range GETs, one per run of nearby rows, in
+        parallel. None if vectors.npy can't be read by range; raises
+        PreconditionFailed if it is no longer meta["vectors_etag"].
+        """
+        import numpy as np
+
+        etag = meta["vectors_etag"]
+        header = self._vectors_header
+        if header is None or header[0] != etag:
+            head = self.storage.get_range("embeddings/vectors.npy", 0, 4096, etag)
+            if head is None:
+                return None
+            f = io.BytesIO(head)
+            read_header = {(1, 0): np.lib.format.read_array_header_1_0,
+                           (2, 0): np.lib.format.read_array_header_2_0}.get(np.lib.format.read_magic(f))
+            if read_header is None:
+                return None
+            shape, fortran_order, dtype = read_header(f)
+            if fortran_order or shape != (meta["rows"], meta["full_dim"]):
+                return None
+            header = self._vectors_header = (etag, f.tell(), dtype)
+        _, offset, dtype = header
+        row_bytes = dtype.itemsize * meta["full_dim"]
+
+        # Rows less than 64 KB apart share a request; the extra bytes cost less than a round trip
+        gap = max(1, 65536 // row_bytes)
+        breaks = np.flatnonzero(np.diff(rows) > gap) + 1
+        firsts = rows[np.concatenate([[0], breaks])]
+        lasts = rows[np.append(breaks - 1, len(rows) - 1)]
+
+        def fetch(span):
+            first, last = span
+            start = offset + int(first) * row_bytes
+            data = self.storage.get_range("embeddings/vectors.npy", start, start + int(last - first + 1) * row_bytes, etag)
+            return np.frombuffer(data, dtype=dtype).reshape(-1, meta["full_dim"])
+
+        blocks = list(self._get_rerank_pool().map(fetch, zip(firsts, lasts)))
+        span = np.searchsorted(firsts, rows, side="right") - 1
+        positions = np.concatenate([[0], np.cumsum(lasts - firsts + 1)[:-1]])[span] + rows - firsts[span]
+        return np.concatenate(blocks)[positions].astype(np.float32)
+
+    def _search_index(self, query_vector: List[float], limit: int, trace: Dict[str, Any]):
+        """
+        Top limit (indices, scores, prompt_ids) from the reduced-dimension index:
+        the best EMBEDDING_RERANK_CANDIDATES rows are picked in index_dim
+        dimensions, then every row of their prompts is scored with its full
+        vector, read by range from vectors.npy. None when there is no usable
+        index; the caller then searches the full vectors.
+        """
+        import numpy as np
+
+        try:
+            with stage("vectors.load_index", trace):
+                index = self._load_index()
+        except Exception as e:
+            print(f"VectorService: Ignoring unreadable reduced index: {e}")
+            return None
+        if index is None:
+            return None
+        meta, reduced = index
+        ids, dim = meta["ids"], meta["index_dim"]
+        if meta.get("stale") or not ids or len(query_vector) != meta["full_dim"]:
+            return None
+        query_vector = self._normalize(np.array(query_vector, dtype=np.float32))
+        trace["matrix_rows"] = int(reduced.shape[0])
+        trace["matrix_bytes"] = int(reduced.nbytes)
+
+        with stage("numpy.score", trace):
+            row_scores = reduced @ self._normalize(query_vector[:dim])
+            take = min(len(row_scores), max(limit, self.rerank_candidates))
+            candidates = np.argpartition(-row_scores, take - 1)[:take]
+
+            groups = self._row_groups(ids, meta["vectors_etag"])
+            if groups is None:
+                prompt_ids, members = ids, np.sort(candidates)
+                rows, starts = members, np.arange(len(members))
+            else:
+                group_starts, prompt_ids = groups
+                members = np.unique(np.searchsorted(group_starts, candidates, side="right") - 1)
+                ends = np.append(group_starts, len(ids))[members + 1]
+                sizes = ends - group_starts[members]
+                rows = np.concatenate([np.arange(group_starts[g], end) for g, end in zip(members, ends)])
+                starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        try:
+            with stage("vectors.read_rows", trace):
+                vectors = self._read_vector_rows(rows, meta)
+        except PreconditionFailed:
+            # Until index.json is rewritten (cached meta is replaced when it changes)
+            print("VectorService: vectors.npy changed after the reduced index was written; searching the full vectors")
+            meta["stale"] = True
+            return None
+        except Exception as e:
+            print(f"VectorService: Could not read candidate vectors, searching the full vectors: {e}")
+            return None
+        if vectors is None:
+            return None
+
+        with stage("numpy.rerank", trace):
+            scores = vectors @ query_vector
+            if self.chunk_aggregation == "mean":
+                scores = np.add.reduceat(scores, starts) / np.diff(np.append(starts, len(rows)))
+            else:
+                scores = np.maximum.reduceat(scores, starts)
+            order = np.argsort(-scores)[:limit]
+        trace["index_dim"] = dim
+        trace["rerank_rows"] = int(len(rows))
+        return members[order], scores[order], prompt_ids
+
+    def _load_vectors_snapshot(self) -> None:
+        """Seeds the in-memory vector cache from the /tmp snapshot (validated by the next conditional GET)."""
+        if self._vectors_snapshot is None:
+            return
+        snapshot = self._vectors_snapshot.load()
+        if snapshot is None:
+            return
+        try:
+            ids = json.loads(snapshot.sections["ids"].decode('utf-8'))
+            matrix = snapshot.sections["matrix"]
+            if len(ids) != matrix.shape[0]:
+                raise ValueError(f"{len(ids)} ids for {matrix.shape[0]} rows")
+            self._vectors_cache = (ids, matrix, snapshot.validator)
+            print(f"VectorService: Loaded vector snapshot ({len(ids)} vectors, memory-mapped)")
+        except Exception as e:
+            print(f"VectorService: Ignoring unreadable vector snapshot: {e}")
+            self._vectors_snapshot.discard()
+
+    def _shard_path(self, etag: str) -> str:
+        return os.path.join(self.shard_dir, f"vectors-{hashlib.sha256(etag.encode('utf-8')).hexdigest()[:16]}.npy")
+
+    def _load_shard_manifest(self) -> None:
+        """Seeds the in-memory vector cache from a shard left on disk (validated by the next conditional GET)."""
+        import numpy as np
+
+        try:
+            with open(os.path.join(self.shard_dir, "shard.json")) as f:
+                manifest = json.load(f)
+            matrix = np.load(self._shard_path(manifest["etag"]), mmap_mode="r")
+            if len(manifest["ids"]) != matrix.shape[0]:
+                raise ValueError(f"{len(manifest['ids'])} ids for {matrix.shape[0]} rows")
+            self._vectors_cache = (manifest["ids"], matrix, manifest["etag"])
+            print(f"VectorService: Opened vector shard ({matrix.shape[0]} vectors, memory-mapped)")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"VectorService: Ignoring unreadable vector shard: {e}")
+
+    def _install_shard(self, ids: List[str], etag: str, downloaded: Optional[str] = None, matrix=None):
+        """
+        Makes the vectors for etag the local shard, from a downloaded .npy file
+        or from an in-memory matrix, and returns it memory-mapped read-only.
+        Older shard files are unlinked; mappings still open stay valid.
+        """
+        import numpy as np
+
+        path = self._shard_path(etag)
+        if downloaded is not None:
+            os.replace(downloaded, path)
+        else:
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+            os.replace(path + ".tmp", path)
+        with open(os.path.join(self.shard_dir, "shard.json.tmp"), "w") as f:
+            json.dump({"etag": etag, "ids": ids}, f)
+        os.replace(os.path.join(self.shard_dir, "shard.json.tmp"), os.path.join(self.shard_dir, "shard.json"))
+        for name in os.listdir(self.shard_dir):
+            if name.startswith("vectors-") and name.endswith(".npy") and os.path.join(self.shard_dir, name) != path:
+                try:
+                    os.remove(os.path.join(self.shard_dir, name))
+                except OSError as e:
+                    print(f"VectorService: Could not remove old shard {name}: {e}")
+        return np.load(path, mmap_mode="r")
+
+    def _fetch_shard(self):
+        """_fetch_all_embeddings for shard mode: vectors.npy is streamed to disk, never read into memory."""
+        import numpy as np
+
+        with self._vectors_lock:
+            if self._vectors_cache is None:
+                self._load_shard_manifest()
+            cached = self._vectors_cache
+
+        os.makedirs(self.shard_dir, exist_ok=True)
+        fd, downloaded = tempfile.mkstemp(dir=self.shard_dir, prefix=".vectors-", suffix=".download")
+        os.close(fd)
+        try:
+            etag = self.storage.download_to("embeddings/vectors.npy", downloaded, cached[2] if cached else None)
+            if etag is NOT_MODIFIED:
+                ids, matrix, etag = cached
+                return list(ids), matrix, etag
+            if etag is None:
+                return [], np.empty((0, 768), dtype=np.float32), None
+
+            ids = []
+            ids_obj = self.storage.get("embeddings/ids.json")
+            if ids_obj is not None:
+                ids = json.loads(ids_obj[0].decode('utf-8'))
+            matrix = np.load(downloaded, mmap_mode="r")
+            if len(ids) != matrix.shape[0]:
+                # Searchable from the unlinked download, but not installed or cached
+                print(f"Warning: ids.json ({len(ids)}) and vectors.npy ({matrix.shape[0]}) are out of sync; not caching")
+                return ids, matrix, etag
+            matrix = self._install_shard(ids, etag, downloaded=downloaded)
+            with self._vectors_lock:
+                self._vectors_cache = (list(ids), matrix, etag)
+            return ids, matrix, etag
+        finally:
+            if os.path.exists(downloaded):
+                os.remove(downloaded)
+
+    def _remember_vectors(self, ids: List[str], matrix, etag: Optional[str]) -> None:
+        """Caches the current vector store in memory and persists it to the /tmp snapshot (or the shard)."""
+        if not etag:
+            return
+        if self.shard_dir:
+            try:
+                os.makedirs(self.shard_dir, exist_ok=True)
+                matrix = self._install_shard(list(ids), etag, matrix=matrix)
+            except Exception as e:
+                print(f"VectorService: Could not write vector shard, keeping vectors in memory: {e}")
+        with self._vectors_lock:
+            self._vectors_cache = (list(ids), matrix, etag)
+        if self._vectors_snapshot is not None:
+            self._vectors_snapshot.save(etag, {
+                "ids": json.dumps(ids).encode('utf-8'),
+                "matrix": matrix
+            })
+
     def _load_all_embeddings(self):
         """
-        Downloads vectors.npy and ids.json from S3.
+        Downloads vectors.npy and ids.json from storage.
         Returns (ids, matrix, etag_vectors).
-        matrix is memory-mapped.
+        The download is a conditional GET against the cached ETag, so an
+        unchanged store costs one request and is served from memory (or from
+        the memory-mapped /tmp snapshot after a fresh start).
         """
-        if self.mock_mode or self.s3_service.mock_mode:
+        if self.mock_mode:
             return [], None, None
 
+        # Concurrent callers share one conditional GET (and one download if it changed)
+        fetch = self._fetch_shard if self.shard_dir else self._fetch_all_embeddings
+        (ids, matrix, etag), _ = self._vectors_flight.do("vectors", fetch)
+        # Callers append to ids; the matrix is never modified in place
+        return list(ids), matrix, etag
+
+    def _fetch_all_embeddings(self):
+        import numpy as np
+
         try:
-            import tempfile
+            with self._vectors_lock:
+                if self._vectors_cache is None:
+                    self._load_vectors_snapshot()
+                cached = self._vectors_cache
             
-            # 1. Load IDs (Small, load into memory)
+            # 1. Load Vectors (Large), unless unchanged since we last saw them
+            obj = self.storage.get_if_changed("embeddings/vectors.npy", cached[2] if cached else None)
+            if obj is NOT_MODIFIED:
+                ids, matrix, etag = cached
+                return list(ids), matrix, etag
+
+            if obj is None:
+                matrix = np.empty((0, 768), dtype=np.float32)
+                etag = None
+            else:
+                content, etag = obj
+                # Loaded fully into RAM. An earlier version memory-mapped a temp file,
+                # but the mmap keeps the file open so it can't be deleted right after
+                # the search, and tracking it for cleanup is hard in Lambda; the temp
+                # files leaked. If the dataset gets huge, we'd need a different
+                # strategy (e.g. EFS or proper vector DB).
+                with stage("numpy.load"):
+                    matrix = np.load(io.BytesIO(content))
+
+            # 2. Load IDs (Small, load into memory)
             ids = []
             try:
-                response = self.s3.get_object(Bucket=self.bucket_name, Key="embeddings/ids.json")
-                ids = json.loads(response['Body'].read().decode('utf-8'))
-            except ClientError as e:
-                if e.response['Error']['Code'] != "NoSuchKey":
-                    print(f"Error loading IDs: {e}")
-            
-            # 2. Load Vectors (Large, mmap)
-            matrix = None
-            etag = None
-            temp_path = None
-            try:
-                # Create a temp file
-                # Use delete=False because we need to close it before numpy loads it (on Windows especially, but good practice)
-                # We will manually delete it in finally block
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.npy') as tmp:
-                    temp_path = tmp.name
-                
-                response = self.s3.get_object(Bucket=self.bucket_name, Key="embeddings/vectors.npy")
-                etag = response['ETag']
-                content = response['Body'].read()
-                with open(temp_path, 'wb') as f:
-                    f.write(content)
-                
-                # Load with mmap_mode
-                # Note: mmap keeps the file open. We can't easily delete it while in use.
-                # However, for this specific usage pattern (load -> search -> discard), 
-                # we might be leaking if we don't close the mmap.
-                # But numpy mmap is tricky to close explicitly.
-                # A better approach for "load all" might be to just load into RAM if it's not HUGE.
-                # Given the "memory leak" finding was about the temp file not being deleted:
-                
-                # If we use mmap_mode='r', the file is locked.
-                # We should probably load it into memory if we want to delete the file immediately,
-                # OR keep track of the file and delete it when the service shuts down (hard in Lambda).
-                # Let's switch to loading into memory for now to ensure we can delete the file.
-                # If dataset gets huge, we'd need a different strategy (e.g. EFS or proper vector DB).
-                
-                matrix = np.load(temp_path) # Load fully into RAM
-                
-            except ClientError as e:
-                if e.response['Error']['Code'] == "NoSuchKey":
-                    matrix = np.empty((0, 768), dtype=np.float32)
-                else:
-                    raise e
-            finally:
-                # Clean up temp file
-                if temp_path and os.path.exists(temp_path):
-                    try:
-                        os.remove(temp_path)
-                    except Exception as e:
-                        print(f"Warning: Failed to remove temp file {temp_path}: {e}")
+                ids_obj = self.storage.get("embeddings/ids.json")
+                if ids_obj is not None:
+                    ids = json.loads(ids_obj[0].decode('utf-8'))
+            except Exception as e:
+                print(f"Error loading IDs: {e}")
+
+            # Only cache a consistent pair (a concurrent writer may sit between the two GETs)
+            if len(ids) == matrix.shape[0]:
+                self._remember_vectors(ids, matrix, etag)
+            else:
+                print(f"Warning: ids.json ({len(ids)}) and vectors.npy ({matrix.shape[0]}) are out of sync; not caching")
             
             return ids, matrix, etag
             
@@ -493,91 +1323,100 @@ class VectorService:
             print(f"Error loading all embeddings: {e}")
             return [], np.empty((0, 768), dtype=np.float32), None
 
+    def _write_vectors(self, ids: List[str], matrix, etag: Optional[str]) -> Optional[str]:
+        """
+        Writes ids.json and vectors.npy. The matrix upload is conditional on etag
+        (Optimistic Locking), so a concurrent writer raises PreconditionFailed.
+        Returns the new ETag of vectors.npy.
+        """
+        import numpy as np
+
+        # Save IDs to JSON
+        self.storage.put("embeddings/ids.json", json.dumps(ids))
+
+        # Save Matrix to Buffer
+        buffer = io.BytesIO()
+        with stage("numpy.save"):
+            np.save(buffer, matrix)
+
+        # Upload Matrix with If-Match
+        new_etag = self.storage.put(
+            "embeddings/vectors.npy",
+            buffer.getvalue(),
+            content_type='application/octet-stream',
+            if_match=etag
+        )
+        self._remember_vectors(ids, matrix, new_etag)
+        try:
+            self._write_index(ids, matrix, new_etag)
+        except Exception as e:
+            # Readers notice the stale index.json and search the full vectors
+            print(f"VectorService: Could not write the reduced index: {e}")
+        return new_etag
+
     def _save_embedding_to_s3(self, prompt_id: str, embedding: list):
         """
-        Saves embedding to S3 by appending to vectors.npy and ids.json.
+        Saves embedding to storage by appending to vectors.npy and ids.json.
         Uses Optimistic Locking (ETag of vectors.npy) to handle concurrency.
         """
-        if self.mock_mode or self.s3_service.mock_mode:
+        if self.mock_mode:
             return
-        
-        import tempfile
+        self.upsert_many({prompt_id: embedding})
+        return True
+
+    def upsert_many(self, embeddings: Dict[str, Any]) -> int:
+        """
+        Updates or appends many embeddings ({prompt_id: vector}) with a single
+        download and a single conditional upload of vectors.npy, retried on
+        concurrent writes. Returns the number of vectors written.
+        """
+        if self.mock_mode or not embeddings:
+            return 0
+
         import random
-        
+        import numpy as np
+
         max_retries = 3
-        
-        # Normalize the new vector
-        new_vector = self._normalize(np.array(embedding, dtype=np.float32))
-        
+
+        # Normalize the new vectors once, outside the retry loop. A prompt may
+        # bring several rows (chunk vectors); they replace all of its old rows.
+        new_ids = list(embeddings)
+        blocks = [self._normalize_rows(np.atleast_2d(np.asarray(embeddings[pid], dtype=np.float32)))
+                  for pid in new_ids]
+        new_row_ids = [pid for pid, block in zip(new_ids, blocks) for _ in range(block.shape[0])]
+        new_vectors = np.vstack(blocks)
+        replaced = set(new_ids)
+
         for attempt in range(max_retries):
             try:
                 # 1. Load existing data
                 ids, matrix, etag = self._load_all_embeddings()
-                
-                # 2. Prepare data for modification
-                if hasattr(matrix, 'files'): # Handle np.load return types if any
-                    matrix = np.array(matrix)
-                else:
-                    # If it's mmap, copy to RAM to modify
-                    matrix = np.array(matrix)
-                
-                # 3. Check if ID exists and Update or Append
-                if prompt_id in ids:
-                    # Update existing
-                    idx = ids.index(prompt_id)
-                    matrix[idx] = new_vector
-                    print(f"Updated existing embedding for {prompt_id} at index {idx}")
-                else:
-                    # Append new
-                    ids.append(prompt_id)
-                    if matrix.shape[0] == 0:
-                        matrix = np.array([new_vector])
-                    else:
-                        matrix = np.vstack([matrix, new_vector])
-                    print(f"Appended new embedding for {prompt_id}")
-                
-                # 4. Save IDs to JSON
-                self.s3.put_object(
-                    Bucket=self.bucket_name,
-                    Key="embeddings/ids.json",
-                    Body=json.dumps(ids),
-                    ContentType='application/json'
-                )
-                
-                # 5. Save Matrix to Buffer
-                buffer = io.BytesIO()
-                np.save(buffer, matrix)
-                buffer.seek(0)
-                
-                # 6. Upload Matrix with If-Match
-                put_kwargs = {
-                    'Bucket': self.bucket_name,
-                    'Key': "embeddings/vectors.npy",
-                    'Body': buffer.getvalue(),
-                    'ContentType': 'application/octet-stream'
-                }
-                
-                if etag:
-                    put_kwargs['IfMatch'] = etag
-                
-                self.s3.put_object(**put_kwargs)
-                print(f"Successfully saved embedding for {prompt_id} (Attempt {attempt+1})")
-                return True
-                
-            except ClientError as e:
-                if e.response['Error']['Code'] == 'PreconditionFailed':
-                    print(f"Concurrency conflict saving embedding (Attempt {attempt+1}). Retrying...")
-                    time.sleep(random.uniform(0.1, 0.5)) # Jitter
-                    continue
-                else:
-                    print(f"Error saving embedding to S3: {e}")
-                    raise e # Propagate error
+
+                # 2. Drop the old rows of the updated prompts and append the new ones
+                # (indexing copies: the cached matrix may be a read-only memmap)
+                matrix = np.asarray(matrix, dtype=np.float32)
+                if matrix.ndim != 2 or matrix.shape[0] == 0:
+                    matrix = np.empty((0, new_vectors.shape[1]), dtype=np.float32)
+                keep = [i for i, pid in enumerate(ids) if pid not in replaced]
+                updated = len(replaced.intersection(ids))
+                matrix = np.vstack([matrix[keep], new_vectors])
+                ids = [ids[i] for i in keep] + new_row_ids
+
+                # 3. Save IDs and Matrix
+                self._write_vectors(ids, matrix, etag)
+                print(f"Saved {len(new_ids)} embeddings ({updated} updated, {len(new_ids) - updated} appended; attempt {attempt+1})")
+                return len(new_ids)
+
+            except PreconditionFailed:
+                print(f"Concurrency conflict saving embeddings (Attempt {attempt+1}). Retrying...")
+                time.sleep(random.uniform(0.1, 0.5)) # Jitter
+                continue
             except Exception as e:
-                print(f"Unexpected error saving embedding: {e}")
+                print(f"Unexpected error saving embeddings: {e}")
                 raise e # Propagate error
-        
-        print(f"Failed to save embedding after {max_retries} attempts due to concurrency.")
-        raise Exception(f"Failed to save embedding after {max_retries} attempts due to concurrency.")
+
+        print(f"Failed to save embeddings after {max_retries} attempts due to concurrency.")
+        raise Exception(f"Failed to save embeddings after {max_retries} attempts due to concurrency.")
 
     def add_point(self, text: str, metadata: dict):
         """Generates and saves embedding to S3."""
@@ -585,8 +1424,8 @@ class VectorService:
             print(f"VectorService (Mock): Added point for {metadata.get('title')}")
             return True
 
-        # 1. Get embedding
-        vector = self._get_embedding_rest(text)
+        # 1. Get embedding (one vector, or one per chunk of a long text)
+        vector = self.embed_document(text)
         if not vector:
             print("Skipping vector add: No embedding generated.")
             return False
@@ -594,16 +1433,17 @@ class VectorService:
         # 2. Save embedding to S3 (Optimized)
         prompt_id = metadata.get("id")
         self._save_embedding_to_s3(prompt_id, vector)
-        self._save_embedding_to_s3(prompt_id, vector)
         print(f"Successfully saved embedding for: {metadata.get('title')}")
         return True
 
     def delete_point(self, prompt_id: str) -> bool:
-        """Deletes an embedding from S3."""
+        """Deletes an embedding from storage."""
         if self.mock_mode:
             print(f"VectorService (Mock): Deleted point for {prompt_id}")
             return True
 
+        import numpy as np
+
         # 1. Load all embeddings
         ids, matrix, etag = self._load_all_embeddings()
         
@@ -611,47 +1451,14 @@ class VectorService:
             print(f"Prompt {prompt_id} not found in embeddings.")
             return False
             
-        # 2. Find index and remove
+        # 2. Remove its rows (several if it was embedded in chunks)
         try:
-            idx = ids.index(prompt_id)
-            
-            # Remove from IDs
-            ids.pop(idx)
-            
-            # Remove from Matrix
-            if hasattr(matrix, 'files'):
-                matrix = np.array(matrix)
-            
-            # Delete row at idx
-            matrix = np.delete(matrix, idx, axis=0)
+            keep = [i for i, pid in enumerate(ids) if pid != prompt_id]
+            ids = [ids[i] for i in keep]
+            matrix = np.asarray(matrix)[keep]
             
-            # 3. Save back to S3
-            import io
-            
-            # Save IDs
-            self.s3.put_object(
-                Bucket=self.bucket_name,
-                Key="embeddings/ids.json",
-                Body=json.dumps(ids),
-                ContentType='application/json'
-            )
-            
-            # Save Matrix
-            buffer = io.BytesIO()
-            np.save(buffer, matrix)
-            buffer.seek(0)
-            
-            put_kwargs = {
-                'Bucket': self.bucket_name,
-                'Key': "embeddings/vectors.npy",
-                'Body': buffer.getvalue(),
-                'ContentType': 'application/octet-stream'
-            }
-            
-            if etag:
-                put_kwargs['IfMatch'] = etag
-                
-            self.s3.put_object(**put_kwargs)
+            # 3. Save back to storage
+            self._write_vectors(ids, matrix, etag)
             print(f"Successfully deleted embedding for {prompt_id}")
             return True
             
@@ -659,80 +1466,236 @@ class VectorService:
             print(f"Error deleting embedding: {e}")
             return False
 
-    def search(self, query_text: str, limit: int = 5):
-        """Searches using S3-stored embeddings (Optimized Matrix Search)."""
+    def _get_scoring_pool(self):
+        """Thread pool shared by all parallel searches, created on first use."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._scoring_pool_lock:
+            if self._scoring_pool is None:
+                self._scoring_pool = ThreadPoolExecutor(
+                    max_workers=self.search_threads, thread_name_prefix="search-score")
+            return self._scoring_pool
+
+    def search(self, query_text: str, limit: int = 5, trace: Optional[Dict[str, Any]] = None):
+        """
+        Searches using S3-stored embeddings (Optimized Matrix Search).
+        If trace is given, it is filled with per-stage milliseconds, the
+        matrix size and the fallback reason (see slow_query_log.py).
+        """
+        if trace is None:
+            trace = {}
+        trace["fallback"] = None
+
         if self.mock_mode:
-            return self._mock_search(query_text)
+            trace["fallback"] = "mock_mode"
+            return self._mock_search(query_text, trace)
 
-        # 1. Get query embedding
-        query_vector = self._get_embedding_rest(query_text)
+        import numpy as np
+
+        # 1. Get query embedding (refused at once while Gemini's breaker is open)
+        query_vector = self._get_embedding_rest(query_text, trace)
         
         if not query_vector:
-            print("Fallback to mock search (no embedding)")
-            return self._mock_search(query_text)
+            trace["fallback"] = trace.pop("rejected", None) or "no_embedding"
+            print(f"Fallback to lexical search ({trace['fallback']})")
+            return self._mock_search(query_text, trace)
+
+        # Reduced-dimension index, when one is stored: vectors.npy is only read by range
+        ranked = self._search_index(query_vector, limit, trace)
+        if ranked is not None:
+            results = self._hydrate_results(*ranked, trace)
+            print(f"Found {len(results)} results for query: {query_text}")
+            return results
 
         # 2. Load all embeddings (Matrix)
-        ids, matrix, _ = self._load_all_embeddings()
+        with stage("vectors.load", trace):
+            ids, matrix, etag = self._load_all_embeddings()
+        if matrix is not None:
+            trace["matrix_rows"] = int(matrix.shape[0])
+            trace["matrix_bytes"] = int(matrix.nbytes)
         
         if not ids or matrix is None or len(ids) == 0:
             print("No embeddings found, falling back to mock search")
-            return self._mock_search(query_text)
+            trace["fallback"] = "no_vectors"
+            return self._mock_search(query_text, trace)
 
         # 3. Normalize query vector
         query_vector = self._normalize(np.array(query_vector, dtype=np.float32))
 
         # 4. Compute similarities (Dot Product)
         # Matrix shape: (N, D), Query shape: (D,) -> Result: (N,)
-        try:
-            similarities = np.dot(matrix, query_vector)
-        except ValueError as e:
-            print(f"Shape mismatch in dot product: {e}")
-            return []
-        
-        # 5. Sort and get top K
-        # Get indices of top K scores (unsorted)
-        if len(similarities) <= limit:
-            top_indices = np.arange(len(similarities))
-        else:
-            # argpartition is faster than argsort for top K
-            top_indices = np.argpartition(similarities, -limit)[-limit:]
-        
-        # Sort the top K indices by score descending
-        top_indices = top_indices[np.argsort(similarities[top_indices])[::-1]]
-        
-        # 6. Fetch metadata
-        results = []
-        all_prompts = self.s3_service.list_prompts()
-        prompt_dict = {p["id"]: p for p in all_prompts}
-        
-        for idx in top_indices:
-            if idx < len(ids):
-                prompt_id = ids[idx]
-                score = float(similarities[idx])
+        with stage("numpy.score", trace):
+            parallel = self.search_threads > 1 and matrix.shape[0] >= self.parallel_min_rows
+            if self.shard_dir or parallel:
+                groups = self._row_groups(ids, etag)
+                starts, prompt_ids = groups if groups is not None else (None, ids)
+                try:
+                    if parallel:
+                        # One range of rows per thread, scored in cache-sized blocks
+                        trace["score_threads"] = self.search_threads
+                        top_indices, top_scores = parallel_top_k(
+                            matrix, query_vector, limit, self._get_scoring_pool(), self.search_threads,
+                            cache_block_rows(matrix.shape[1]), starts, self.chunk_aggregation)
+                    else:
+                        # Memory-mapped shard: one block of rows at a time into a running top-k
+                        top_indices, top_scores = blocked_top_k(
+                            matrix, query_vector, limit, self.shard_block_rows, starts, self.chunk_aggregation)
+                except ValueError as e:
+                    print(f"Shape mismatch in dot product: {e}")
+                    return []
+            else:
+                try:
+                    similarities = np.dot(matrix, query_vector)
+                except ValueError as e:
+                    print(f"Shape mismatch in dot product: {e}")
+                    return []
+
+                # Chunked prompts: one score per prompt from its rows
+                similarities, prompt_ids = self._aggregate_rows(similarities, ids, etag)
+                
+                # 5. Sort and get top K
+                # Get indices of top K scores (unsorted)
+                if len(similarities) <= limit:
+                    top_indices = np.arange(len(similarities))
+                else:
+                    # argpartition is faster than argsort for top K
+                    top_indices = np.argpartition(similarities, -limit)[-limit:]
                 
-                if prompt_id in prompt_dict:
-                    result = prompt_dict[prompt_id].copy()
-                    result["score"] = score
-                    results.append(result)
+                # Sort the top K indices by score descending
+                top_indices = top_indices[np.argsort(similarities[top_indices])[::-1]]
+                top_scores = similarities[top_indices]
         
+        # 6. Fetch metadata
+        results = self._hydrate_results(top_indices, top_scores, prompt_ids, trace)
         print(f"Found {len(results)} results for query: {query_text}")
         return results
 
-    def _mock_search(self, query_text: str):
-        print("Performing MOCK search (substring match)")
-        all_prompts = self.s3_service.list_prompts()
+    def _hydrate_results(self, top_indices, top_scores, prompt_ids: List[str],
+                         trace: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The prompts for the top indices into prompt_ids, each with its score."""
         results = []
-        query_lower = query_text.lower()
-        for p in all_prompts:
-            # Simple substring match
-            if (query_lower in p.get('title', '').lower() or 
-                query_lower in p.get('description', '').lower() or
-                query_lower in p.get('prompt_text', '').lower()):
-                results.append(p)
+        with stage("search.hydrate", trace):
+            all_prompts = self.s3_service.list_prompts()
+            prompt_dict = {p["id"]: p for p in all_prompts}
+            
+            for idx, score in zip(top_indices, top_scores):
+                if idx < len(prompt_ids):
+                    prompt_id = prompt_ids[idx]
+                    
+                    if prompt_id in prompt_dict:
+                        result = prompt_dict[prompt_id].copy()
+                        result["score"] = float(score)
+                        results.append(result)
         return results
 
+    def search_batch(self, queries: List[str], limit: int = 5,
+                     trace: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Searches many queries at once: one batchEmbedContents call for all of
+        them and one (N, D) @ (D, Q) product, with top-k taken per column.
+        Returns {"results", "fallback"} per query, in order; queries that
+        couldn't be embedded fall back to lexical search individually.
+        """
+        if trace is None:
+            trace = {}
+        if self.mock_mode:
+            return [{"results": self._mock_search(q, trace), "fallback": "mock_mode"} for q in queries]
+
+        import numpy as np
+
+        vectors = self._get_embeddings_batch(queries, trace)
+        fallback = trace.pop("rejected", None) or "no_embedding"
+        embedded = [i for i, vector in enumerate(vectors) if vector]
+        answers: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+
+        if embedded:
+            with stage("vectors.load", trace):
+                ids, matrix, etag = self._load_all_embeddings()
+            if not ids or matrix is None or matrix.shape[0] == 0:
+                fallback = "no_vectors"
+            else:
+                trace["matrix_rows"] = int(matrix.shape[0])
+                query_matrix = self._normalize_rows(np.array([vectors[i] for i in embedded], dtype=np.float32))
+                with stage("numpy.score", trace):
+                    # (N, D) @ (D, Q) -> (N, Q), then one score per prompt for chunked stores
+                    scores, prompt_ids = self._aggregate_rows(matrix @ query_matrix.T, ids, etag)
+                    k = min(limit, scores.shape[0])
+                    # Top k of every column at once, then sorted within each column
+                    top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                    top_scores = np.take_along_axis(scores, top, axis=0)
+                    order = np.argsort(-top_scores, axis=0)
+                    top = np.take_along_axis(top, order, axis=0)
+                    top_scores = np.take_along_axis(top_scores, order, axis=0)
+
+                with stage("search.hydrate", trace):
+                    prompt_dict = {p["id"]: p for p in self.s3_service.list_prompts()}
+                    for column, query_index in enumerate(embedded):
+                        results = []
+                        for row, score in zip(top[:, column], top_scores[:, column]):
+                            prompt = prompt_dict.get(prompt_ids[row])
+                            if prompt is not None:
+                                result = prompt.copy()
+                                result["score"] = float(score)
+                                results.append(result)
+                        answers[query_index] = {"results": results, "fallback": None}
+
+        for i, query in enumerate(queries):
+            if answers[i] is None:
+                answers[i] = {"results": self._mock_search(query, trace), "fallback": fallback}
+        print(f"Batch search: {len(queries)} queries, {len(embedded)} embedded")
+        return answers
+
+    def near_duplicates(self, vector, threshold: float, limit: int = 3) -> List[tuple]:
+        """
+        Stored prompts whose cosine similarity to vector (one vector, or chunk
+        vectors) is at least threshold, as (prompt_id, score), best first.
+        Scored against the in-memory matrix; no embedding call.
+        """
+        if self.mock_mode or vector is None:
+            return []
+
+        import numpy as np
+
+        ids, matrix, etag = self._load_all_embeddings()
+        if not ids or matrix is None or matrix.shape[0] == 0:
+            return []
+        rows = self._normalize_rows(np.atleast_2d(np.asarray(vector, dtype=np.float32)))
+        candidate = self._normalize(rows.mean(axis=0))
+        with stage("numpy.score"):
+            scores, prompt_ids = self._aggregate_rows(matrix @ candidate, ids, etag)
+            above = np.flatnonzero(scores >= threshold)
+            above = above[np.argsort(-scores[above])][:limit]
+        return [(prompt_ids[i], float(scores[i])) for i in above]
+
+    def _mock_search(self, query_text: str, trace: Optional[Dict[str, Any]] = None):
+        with stage("search.lexical", trace):
+            lexical_results = self.s3_service.search_text(query_text)
+            if lexical_results is not None:
+                print("Performing lexical search (full-text index)")
+                return lexical_results
+
+            print("Performing MOCK search (substring match)")
+            all_prompts = self.s3_service.list_prompts()
+            results = []
+            query_lower = query_text.lower()
+            for p in all_prompts:
+                # Simple substring match
+                if (query_lower in p.get('title', '').lower() or 
+                    query_lower in p.get('description', '').lower() or
+                    query_lower in p.get('prompt_text', '').lower()):
+                    results.append(p)
+            return results
+
+    @staticmethod
+    def _details_cache_key(title: str, prompt_text: str, model: str) -> str:
+        return hashlib.sha256(json.dumps([title, prompt_text, model]).encode('utf-8')).hexdigest()
+
     def generate_details(self, title: str, prompt_text: str) -> Dict[str, Any]:
-        """Generates tags and description using Gemini."""
+        """
+        Generates tags and description using Gemini. Successful results are
+        cached per (title, prompt_text, model), and identical concurrent
+        requests share one upstream call.
+        """
         if self.mock_mode:
             return {
                 "tags": ["mock", "generated", "ai"],
@@ -742,8 +1705,28 @@ class VectorService:
         if not self.gemini_api_key:
             raise Exception("GEMINI_API_KEY not set")
 
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-lite:generateContent?key={self.gemini_api_key}"
-        headers = {"Content-Type": "application/json"}
+        key = self._details_cache_key(title, prompt_text, GENERATE_MODEL)
+        now = time.time()
+        with self._details_lock:
+            cached = self._details_cache.get(key)
+            if cached is not None and cached[0] > now:
+                self._details_cache.move_to_end(key)
+                GENERATE_CACHE.inc("hit")
+                return copy.deepcopy(cached[1])
+
+        (result, ok), shared = self._details_flight.do(key, lambda: self._generate_details_uncached(title, prompt_text))
+        GENERATE_CACHE.inc("shared" if shared else "miss")
+        if ok and not shared:
+            with self._details_lock:
+                self._details_cache[key] = (time.time() + self.details_cache_ttl, result)
+                self._details_cache.move_to_end(key)
+                while len(self._details_cache) > self.details_cache_size:
+                    self._details_cache.popitem(last=False)
+        return copy.deepcopy(result)
+
+    def _generate_details_uncached(self, title: str, prompt_text: str):
+        """Calls Gemini. Returns (details, ok); ok is False for the error fallback."""
+        url = f"{self.gemini_api_base}/v1beta/models/{GENERATE_MODEL}:generateContent?key={self.gemini_api_key}"
         
         # Construct a prompt for the model
         model_prompt = f"""
@@ -769,19 +1752,13 @@ class VectorService:
         }
 
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=15)
-            response.raise_for_status()
-            data = response.json()
+            data = self._gemini_post(url, payload, 15, "gemini.generate")
             
             # Extract text from response
             text_content = data["candidates"][0]["content"]["parts"][0]["text"]
-            return json.loads(text_content)
+            return json.loads(text_content), True
             
         except Exception as e:
             print(f"Error generating details: {e}")
             # Fallback
-            return {
-                "tags": ["error", "generation-failed"],
-                "description": "Failed to generate description. Please try again."
-            }
-
+            return copy.deepcopy(GENERATE_FALLBACK), False
@@ -0,0 +1,146 @@
+"""
+"More like this": the prompts nearest to a prompt's stored vector.
+
+No embedding call is made. Neighbour lists (the top SIMILAR_PROMPTS_K of
+every prompt) are precomputed in bulk with blocked matrix products (see
+similarity.py) and tied to the ETag of the vectors.npy they came from. They
+are saved to embeddings/neighbours.json so other instances and cold starts
+reuse them.
+
+When vectors.npy changes, lookups score the prompt's row against the current
+matrix directly (one matrix-vector product) while a background rebuild
+refreshes the lists, so an answer never comes from stale lists. The
+embedding-queue drain also refreshes them.
+"""
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import Counter, register, stage
+from .similarity import similarity_blocks, top_k_per_row
+from .single_flight import SingleFlight
+
+NEIGHBOURS_KEY = "embeddings/neighbours.json"
+
+SIMILAR_LOOKUPS = register(Counter(
+    "similar_prompts_lookups_total", "Similar-prompt lookups by source (precomputed, direct)", ("source",)))
+
+class SimilarPrompts:
+    def __init__(self, vector_service_getter: Callable[[], Any], k: Optional[int] = None,
+                 max_block_bytes: Optional[int] = None):
+        self._vector_service_getter = vector_service_getter
+        self.k = k or int(os.environ.get("SIMILAR_PROMPTS_K", "10"))
+        self.max_block_bytes = max_block_bytes
+        # (etag of vectors.npy, {prompt_id: [[neighbour_id, score], ...]})
+        self._index: Optional[Tuple[str, Dict[str, List[list]]]] = None
+        self._checked_etag: Optional[str] = None
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("similar_prompts")
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._rebuild: Optional[Future] = None
+
+    @property
+    def vector_service(self):
+        return self._vector_service_getter()
+
+    def build(self, ids: List[str], matrix, etag: Optional[str]) -> Dict[str, List[list]]:
+        """Top-k neighbour lists for every prompt, one block of rows at a time."""
+        prompt_ids, prompts = self.vector_service._prompt_matrix(ids, matrix, etag)
+        neighbours: Dict[str, List[list]] = {}
+        with stage("similar.build"):
+            for start, scores in similarity_blocks(prompts, self.max_block_bytes):
+                top, values = top_k_per_row(scores, self.k)
+                for offset in range(top.shape[0]):
+                    neighbours[prompt_ids[start + offset]] = [
+                        [prompt_ids[j], round(float(score), 6)]
+                        for j, score in zip(top[offset], values[offset]) if score > float("-inf")
+                    ]
+        return neighbours
+
+    def refresh(self) -> Optional[str]:
+        """
+        Rebuilds and saves the neighbour lists unless they already match the
+        current vectors.npy. Returns the ETag they match, or None without vectors.
+        """
+        vs = self.vector_service
+        if vs.mock_mode:
+            return None
+        ids, matrix, etag = vs._load_all_embeddings()
+        if not etag or not ids:
+            return None
+        with self._lock:
+            if self._index is not None and self._index[0] == etag:
+                return etag
+        if self._load_saved(etag):
+            return etag
+
+        neighbours = self.build(ids, matrix, etag)
+        with self._lock:
+            self._index = (etag, neighbours)
+        try:
+            vs.storage.put(NEIGHBOURS_KEY, json.dumps({"etag": etag, "k": self.k, "neighbours": neighbours}))
+        except Exception as e:
+            print(f"Error saving neighbour lists: {e}")
+        print(f"SimilarPrompts: Rebuilt neighbour lists for {len(neighbours)} prompts")
+        return etag
+
+    def _load_saved(self, etag: str) -> bool:
+        """Adopts the saved neighbour lists if they were built from this ETag."""
+        try:
+            obj = self.vector_service.storage.get(NEIGHBOURS_KEY)
+            if obj is None:
+                return False
+            saved = json.loads(obj[0].decode('utf-8'))
+        except Exception as e:
+            print(f"Error loading neighbour lists: {e}")
+            return False
+        if saved.get("etag") != etag or saved.get("k", 0) < self.k:
+            return False
+        with self._lock:
+            self._index = (etag, saved["neighbours"])
+        return True
+
+    def _schedule_refresh(self) -> None:
+        with self._lock:
+            if self._rebuild is not None and not self._rebuild.done():
+                return
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="similar-prompts")
+            self._rebuild = self._pool.submit(self._flight.do, "refresh", self.refresh)
+
+    def similar(self, prompt_id: str, limit: int = 5) -> Optional[List[Tuple[str, float]]]:
+        """
+        The prompts most similar to prompt_id as (prompt_id, score), best
+        first. None if the prompt has no stored vector.
+        """
+        vs = self.vector_service
+        if vs.mock_mode:
+            return None
+        ids, matrix, etag = vs._load_all_embeddings()
+        if not etag or prompt_id not in ids:
+            return None
+
+        with self._lock:
+            index = self._index
+            # Look for saved lists once per ETag (another instance may have built them)
+            check_saved = (index is None or index[0] != etag) and self._checked_etag != etag
+            self._checked_etag = etag
+        if check_saved and self._load_saved(etag):
+            with self._lock:
+                index = self._index
+        current = index is not None and index[0] == etag
+        if current and limit <= self.k:
+            SIMILAR_LOOKUPS.inc("precomputed")
+            return [(pid, score) for pid, score in index[1].get(prompt_id, [])[:limit]]
+
+        if not current:
+            self._schedule_refresh()
+        SIMILAR_LOOKUPS.inc("direct")
+        prompt_ids, prompts = vs._prompt_matrix(ids, matrix, etag)
+        row = prompt_ids.index(prompt_id)
+        scores = prompts @ prompts[row]
+        scores[row] = float("-inf")
+        top, values = top_k_per_row(scores[None, :], limit)
+        return [(prompt_ids[j], float(score)) for j, score in zip(top[0], values[0]) if score > float("-inf")]
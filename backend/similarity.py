@@ -0,0 +1,152 @@
+"""
+Blocked cosine similarity over matrices of unit rows.
+
+matrix @ matrix.T would materialise N*N scores at once. similarity_blocks()
+scores a block of rows at a time, sized so one block of scores stays under
+SIMILARITY_BLOCK_MB, and the caller reduces each block (top-k, pairs above
+a threshold) before the next one is computed.
+
+blocked_top_k() does the same for a single query against a matrix that may
+be memory-mapped: rows are read and scored one block at a time and merged
+into a running top-k heap, so peak memory is one block whatever the corpus.
+
+parallel_top_k() splits the rows into one range per worker and scores the
+ranges on a thread pool (numpy releases the GIL inside the product), in
+blocks sized to the CPU's L2 cache. Each worker keeps its own top k and
+the results are merged at the end.
+"""
+import heapq
+import os
+from typing import Iterator, List, Optional, Tuple
+
+def block_rows(n_columns: int, max_block_bytes: Optional[int] = None) -> int:
+    """Rows per block so that a (rows, n_columns) float32 block fits the budget."""
+    if max_block_bytes is None:
+        max_block_bytes = int(float(os.environ.get("SIMILARITY_BLOCK_MB", "32")) * 1024 * 1024)
+    return max(1, max_block_bytes // (4 * max(1, n_columns)))
+
+def cache_block_rows(n_columns: int, cache_bytes: Optional[int] = None) -> int:
+    """
+    Rows per block so that a block of float32 rows fits in the L2 cache
+    (SEARCH_BLOCK_KB, else the size Linux reports for cpu0, else 1 MB).
+    """
+    if cache_bytes is None:
+        configured = os.environ.get("SEARCH_BLOCK_KB")
+        if configured:
+            cache_bytes = int(configured) * 1024
+        else:
+            cache_bytes = 1024 * 1024
+            try:
+                with open("/sys/devices/system/cpu/cpu0/cache/index2/size") as f:
+                    size = f.read().strip().upper()
+                units = {"K": 1024, "M": 1024 * 1024}
+                cache_bytes = int(size[:-1]) * units[size[-1]] if size[-1] in units else int(size)
+            except (OSError, ValueError, IndexError):
+                pass
+    return max(64, cache_bytes // (4 * max(1, n_columns)))
+
+def similarity_blocks(matrix, max_block_bytes: Optional[int] = None) -> Iterator[Tuple[int, "object"]]:
+    """
+    Yields (start, scores) where scores = matrix[start:start+B] @ matrix.T,
+    with each row's similarity to itself set to -inf.
+    """
+    import numpy as np
+
+    n = matrix.shape[0]
+    rows = block_rows(n, max_block_bytes)
+    for start in range(0, n, rows):
+        end = min(n, start + rows)
+        scores = matrix[start:end] @ matrix.T
+        scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+        yield start, scores
+
+def top_k_per_row(scores, k: int):
+    """(indices, values) of the k highest scores in each row, sorted descending."""
+    import numpy as np
+
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.intp), empty
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-values, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+def row_blocks(n_rows: int, block_rows: int, starts=None) -> Iterator[Tuple[int, int]]:
+    """
+    (start, end) row ranges of about block_rows rows. With group starts (the
+    first row of each chunked prompt), a block is extended so that it never
+    splits a group.
+    """
+    import numpy as np
+
+    start = 0
+    while start < n_rows:
+        end = min(n_rows, start + max(1, block_rows))
+        if starts is not None and end < n_rows:
+            group = int(np.searchsorted(starts, end))
+            end = int(starts[group]) if group < len(starts) else n_rows
+        yield start, end
+        start = end
+
+def blocked_top_k(matrix, query, k: int, block_rows: int, starts=None,
+                  aggregation: str = "max") -> Tuple[List[int], List[float]]:
+    """
+    Top k (index, score) of matrix @ query, best first, computed one block of
+    rows at a time. With group starts, scores are per group (max or mean
+    over its rows) and indices refer to groups.
+    """
+    heap: List[Tuple[float, int]] = []
+    for start, end in row_blocks(matrix.shape[0], block_rows, starts):
+        for item in _block_top_k(matrix, query, k, start, end, starts, aggregation):
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    best = sorted(heap, reverse=True)
+    return [i for _, i in best], [score for score, _ in best]
+
+def _block_top_k(matrix, query, k: int, start: int, end: int, starts,
+                 aggregation: str, block_rows: Optional[int] = None) -> List[Tuple[float, int]]:
+    """
+    Up to k (score, index) pairs from rows start:end, unsorted. With
+    block_rows, the product is computed that many rows at a time.
+    """
+    import numpy as np
+
+    if block_rows is None:
+        scores = np.asarray(matrix[start:end] @ query)
+    else:
+        scores = np.empty(end - start, dtype=np.result_type(matrix.dtype, query.dtype))
+        for low, high in row_blocks(end - start, block_rows):
+            scores[low:high] = matrix[start + low:start + high] @ query
+    offset = start
+    if starts is not None:
+        first, last = np.searchsorted(starts, [start, end])
+        local = starts[first:last] - start
+        if aggregation == "mean":
+            counts = np.diff(np.append(local, end - start))
+            scores = np.add.reduceat(scores, local) / counts
+        else:
+            scores = np.maximum.reduceat(scores, local)
+        offset = int(first)
+    take = min(k, len(scores))
+    if take <= 0:
+        return []
+    top = np.argpartition(-scores, take - 1)[:take]
+    return [(float(scores[i]), offset + int(i)) for i in top]
+
+def parallel_top_k(matrix, query, k: int, executor, workers: int, block_rows: int,
+                   starts=None, aggregation: str = "max") -> Tuple[List[int], List[float]]:
+    """
+    Same result as blocked_top_k, with the rows split into one range per
+    worker and scored on executor (a ThreadPoolExecutor). Ranges never
+    split a group.
+    """
+    n = matrix.shape[0]
+    per_worker = -(-n // max(1, workers))
+    futures = [executor.submit(_block_top_k, matrix, query, k, start, end, starts, aggregation, block_rows)
+               for start, end in row_blocks(n, per_worker, starts)]
+    best = heapq.nlargest(k, (item for future in futures for item in future.result()))
+    return [i for _, i in best], [score for score, _ in best]
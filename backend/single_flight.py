@@ -0,0 +1,70 @@
+"""
+Single-flight deduplication: concurrent calls for the same key share one
+execution of the underlying function instead of each running it.
+
+Used for the expensive reads a burst of page loads would otherwise repeat
+(catalog load, vectors.npy load, tool statistics) and for /generate-details.
+Sync routes run in the threadpool and call do(); async code calls
+do_async(), which runs the function in the default executor and awaits it
+without blocking the event loop. Both share the same table of in-flight
+calls, so a thread and a task asking for the same key also share one call.
+"""
+import asyncio
+from concurrent.futures import Future
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from .metrics import Counter, register
+
+SINGLE_FLIGHT_SHARED = register(Counter(
+    "single_flight_shared_total", "Calls that waited for an identical in-flight call instead of running it", ("name",)))
+
+class SingleFlight:
+    """
+    The first caller for a key runs fn; callers arriving while it runs wait
+    and receive the same result (or exception). Nothing is remembered once the
+    call completes, so caching is left to the caller. The result object is
+    shared, so callers must copy it before mutating.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """Returns (future, leader); the leader must resolve the future via _run()."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                SINGLE_FLIGHT_SHARED.inc(self.name)
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _run(self, key: Hashable, future: Future, fn: Callable[[], Any]) -> Any:
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns (result, shared); shared is True when another caller's execution was reused."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        return self._run(key, future, fn), False
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """do() for coroutines: the blocking fn runs in the default executor."""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._run, key, future, fn), False
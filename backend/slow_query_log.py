@@ -0,0 +1,121 @@
+"""
+Slow-query log for /search.
+
+Searches slower than SLOW_QUERY_THRESHOLD_MS are kept in a bounded in-memory
+ring buffer with their per-stage breakdown (see VectorService.search's
+trace). With SLOW_QUERY_FLUSH=true, entries are also written to storage as
+JSONL batches under logs/slow-queries/{date}/ so the worst queries across
+Lambda instances can be pulled from one place.
+"""
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+LOG_PREFIX = "logs/slow-queries/"
+MAX_QUERY_CHARS = 200
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+class SlowQueryLog:
+    def __init__(self, storage_getter: Optional[Callable[[], Any]] = None,
+                 threshold_ms: Optional[float] = None, capacity: Optional[int] = None,
+                 flush: Optional[bool] = None, flush_batch: Optional[int] = None):
+        self.threshold_ms = threshold_ms if threshold_ms is not None else float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "1000"))
+        self.capacity = capacity or int(os.environ.get("SLOW_QUERY_LOG_SIZE", "200"))
+        self.flush_enabled = flush if flush is not None else os.environ.get("SLOW_QUERY_FLUSH", "false").lower() == "true"
+        self.flush_batch = flush_batch or int(os.environ.get("SLOW_QUERY_FLUSH_BATCH", "10"))
+        self._storage_getter = storage_getter
+        self._entries = deque(maxlen=self.capacity)
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, query: str, total_ms: float, trace: Dict[str, Any], result_count: int) -> Optional[Dict[str, Any]]:
+        """Logs the search if it was slower than the threshold. Returns the entry, or None."""
+        if total_ms < self.threshold_ms:
+            return None
+
+        entry = {
+            "id": uuid.uuid4().hex[:12],
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "query": query[:MAX_QUERY_CHARS],
+            "query_length": len(query),
+            "total_ms": _round(total_ms),
+            "embedding_ms": _round(trace.get("gemini.embed")),
+            "matrix_rows": trace.get("matrix_rows"),
+            "matrix_bytes": trace.get("matrix_bytes"),
+            "matrix_load_ms": _round(trace.get("vectors.load")),
+            "scoring_ms": _round(trace.get("numpy.score")),
+            "hydration_ms": _round(trace.get("search.hydrate")),
+            "lexical_ms": _round(trace.get("search.lexical")),
+            "result_count": result_count,
+            "fallback": trace.get("fallback") is not None,
+            "fallback_reason": trace.get("fallback"),
+        }
+        print(f"Slow search ({entry['total_ms']}ms, fallback={entry['fallback_reason']}): {entry['query'][:80]}")
+
+        with self._lock:
+            self._entries.append(entry)
+            if self.flush_enabled:
+                self._pending.append(entry)
+                should_flush = len(self._pending) >= self.flush_batch
+            else:
+                should_flush = False
+        if should_flush:
+            self.flush()
+        return entry
+
+    def flush(self) -> int:
+        """Writes pending entries to storage as one JSONL object. Returns the number written."""
+        if self._storage_getter is None:
+            return 0
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        now = datetime.now(timezone.utc)
+        key = f"{LOG_PREFIX}{now:%Y-%m-%d}/{now:%H%M%S}-{uuid.uuid4().hex[:8]}.jsonl"
+        body = "\n".join(json.dumps(entry) for entry in batch) + "\n"
+        try:
+            self._storage_getter().put(key, body, content_type='application/x-ndjson')
+            return len(batch)
+        except Exception as e:
+            print(f"Error flushing slow-query log to {key}: {e}")
+            # Keep them for the next attempt, within the ring buffer's bound
+            with self._lock:
+                self._pending = (batch + self._pending)[-self.capacity:]
+            return 0
+
+    def worst(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """The slowest logged searches on this instance."""
+        with self._lock:
+            entries = list(self._entries)
+        return sorted(entries, key=lambda e: e["total_ms"], reverse=True)[:limit]
+
+    def load_flushed(self, days: int = 1) -> List[Dict[str, Any]]:
+        """Reads the entries flushed to storage over the last `days` days (all instances)."""
+        if self._storage_getter is None:
+            return []
+        storage = self._storage_getter()
+        entries = []
+        today = datetime.now(timezone.utc).date()
+        for offset in range(days):
+            prefix = f"{LOG_PREFIX}{today - timedelta(days=offset):%Y-%m-%d}/"
+            for key in storage.list_keys(prefix):
+                obj = storage.get(key)
+                if obj is None:
+                    continue
+                for line in obj[0].decode('utf-8').splitlines():
+                    if line.strip():
+                        entries.append(json.loads(line))
+        return entries
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._pending = []
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+from typing import Dict, Any, Optional
+from datetime import datetime
+
+# File layout (little endian):
+#   magic (8 bytes) | header length (uint32) | header JSON | padding | sections...
+# Every section starts on a 64-byte boundary so array sections can be
+# memory-mapped directly. The header records offset, length and sha256 of
+# each section plus the S3 validator (ETag) the snapshot was built from.
+SNAPSHOT_MAGIC = b"PRSNAP01"
+SNAPSHOT_VERSION = 1
+SECTION_ALIGNMENT = 64
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(tempfile.gettempdir(), "prompt-repo-snapshots")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # Lambda /tmp defaults to 512MB
+
+def snapshots_enabled() -> bool:
+    return os.environ.get("SNAPSHOT_ENABLED", "true").lower() == "true"
+
+def _align(offset: int) -> int:
+    return (offset + SECTION_ALIGNMENT - 1) // SECTION_ALIGNMENT * SECTION_ALIGNMENT
+
+class Snapshot:
+    """A loaded snapshot: the validator it was built from and its sections."""
+    def __init__(self, validator: str, created_at: str, sections: Dict[str, Any]):
+        self.validator = validator
+        self.created_at = created_at
+        self.sections = sections
+
+class SnapshotStore:
+    """
+    Persists a validated snapshot of S3-derived state to local disk (/tmp on Lambda)
+    so a new execution environment on a warm host can skip the full S3 crawl.
+
+    Sections are either bytes (JSON payloads) or numpy arrays. Arrays are
+    memory-mapped read-only on load. Corrupt or oversized snapshots are discarded
+    and the caller rebuilds from S3.
+    """
+    def __init__(self, name: str, directory: str = None, max_bytes: int = None):
+        self.name = name
+        self.directory = directory or os.environ.get("SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR)
+        self.max_bytes = max_bytes or int(os.environ.get("SNAPSHOT_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.path = os.path.join(self.directory, f"{name}.snap")
+
+    def save(self, validator: str, sections: Dict[str, Any]) -> bool:
+        """Writes the snapshot atomically. Returns False if it was skipped."""
+        if not validator:
+            return False
+
+        header_sections = {}
+        payloads = []
+        offset = 0
+        for section_name, value in sections.items():
+            if isinstance(value, (bytes, bytearray)):
+                data = bytes(value)
+                meta = {"kind": "bytes"}
+            else:
+                import numpy as np
+                array = np.ascontiguousarray(value)
+                data = array.tobytes()
+                meta = {"kind": "array", "dtype": array.dtype.str, "shape": list(array.shape)}
+
+            offset = _align(offset)
+            meta.update({"offset": offset, "length": len(data), "sha256": hashlib.sha256(data).hexdigest()})
+            header_sections[section_name] = meta
+            payloads.append((offset, data))
+            offset += len(data)
+
+        header = json.dumps({
+            "version": SNAPSHOT_VERSION,
+            "validator": validator,
+            "created_at": datetime.now().isoformat(),
+            "sections": header_sections
+        }).encode("utf-8")
+
+        # Section offsets are relative to the (aligned) end of the header
+        data_start = _align(len(SNAPSHOT_MAGIC) + 4 + len(header))
+        total_size = data_start + offset
+        if total_size > self.max_bytes:
+            print(f"SnapshotStore: Skipping {self.name} snapshot ({total_size} bytes exceeds cap of {self.max_bytes})")
+            self.discard()
+            return False
+
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{self.name}-", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(struct.pack("<I", len(header)))
+                f.write(header)
+                for section_offset, data in payloads:
+                    f.seek(data_start + section_offset)
+                    f.write(data)
+                f.truncate(total_size)
+            os.replace(temp_path, self.path)
+            return True
+        except Exception as e:
+            print(f"SnapshotStore: Failed to write {self.name} snapshot: {e}")
+            if temp_path and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            return False
+
+    def load(self) -> Optional[Snapshot]:
+        """Loads and verifies the snapshot. Returns None if missing or corrupt."""
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                    raise ValueError("bad magic")
+                (header_len,) = struct.unpack("<I", f.read(4))
+                header = json.loads(f.read(header_len).decode("utf-8"))
+                if header.get("version") != SNAPSHOT_VERSION:
+                    raise ValueError(f"unsupported version {header.get('version')}")
+
+                data_start = _align(len(SNAPSHOT_MAGIC) + 4 + header_len)
+                file_size = os.fstat(f.fileno()).st_size
+
+                sections = {}
+                for section_name, meta in header["sections"].items():
+                    start = data_start + meta["offset"]
+                    if start + meta["length"] > file_size:
+                        raise ValueError(f"section {section_name} is truncated")
+
+                    if meta["kind"] == "bytes":
+                        f.seek(start)
+                        value = f.read(meta["length"])
+                        digest = hashlib.sha256(value).hexdigest()
+                    else:
+                        import numpy as np
+                        shape = tuple(meta["shape"])
+                        if meta["length"] == 0:
+                            value = np.empty(shape, dtype=np.dtype(meta["dtype"]))
+                        else:
+                            value = np.memmap(self.path, dtype=np.dtype(meta["dtype"]), mode="r", offset=start, shape=shape)
+                        digest = hashlib.sha256(value).hexdigest()
+
+                    if digest != meta["sha256"]:
+                        raise ValueError(f"checksum mismatch in section {section_name}")
+                    sections[section_name] = value
+
+            return Snapshot(header["validator"], header.get("created_at"), sections)
+        except Exception as e:
+            print(f"SnapshotStore: Discarding corrupt {self.name} snapshot: {e}")
+            self.discard()
+            return None
+
+    def discard(self) -> None:
+        """Removes the snapshot file if present."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"SnapshotStore: Failed to remove {self.path}: {e}")
@@ -0,0 +1,374 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from .storage import StorageBackend, PreconditionFailed, _to_bytes
+
+PROMPT_KEY = re.compile(r"^prompts/(?P<id>[^/]+)\.json$")
+FAVORITES_KEY = re.compile(r"^users/(?P<email>[^/]+)/favorites\.json$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    id TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    title TEXT,
+    username TEXT,
+    owner_email TEXT,
+    created_at TEXT,
+    upvotes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_prompts_created_at ON prompts(created_at);
+CREATE INDEX IF NOT EXISTS idx_prompts_upvotes ON prompts(upvotes);
+CREATE INDEX IF NOT EXISTS idx_prompts_owner_email ON prompts(owner_email);
+
+CREATE TABLE IF NOT EXISTS prompt_tools (
+    prompt_id TEXT NOT NULL,
+    tool TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (prompt_id, tool)
+);
+CREATE INDEX IF NOT EXISTS idx_prompt_tools_tool ON prompt_tools(tool);
+
+CREATE TABLE IF NOT EXISTS upvotes (
+    prompt_id TEXT NOT NULL,
+    user_email TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (prompt_id, user_email)
+);
+
+CREATE TABLE IF NOT EXISTS favorites (
+    user_email TEXT NOT NULL,
+    prompt_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (user_email, prompt_id)
+);
+
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    content_type TEXT,
+    etag TEXT NOT NULL
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+    id UNINDEXED, title, description, prompt_text, tools, tags,
+    tokenize = 'porter unicode61'
+);
+"""
+
+# Fields kept in their own tables rather than in the JSON body
+DERIVED_FIELDS = ("upvotes", "upvoted_by")
+
+PROMPT_COLUMNS = """
+    p.body, p.upvotes,
+    (SELECT json_group_array(user_email) FROM
+        (SELECT user_email FROM upvotes u WHERE u.prompt_id = p.id ORDER BY position)) AS upvoted_by
+"""
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.md5(body).hexdigest()}"'
+
+def _as_list(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    return [str(v) for v in value]
+
+class SQLiteStorageBackend(StorageBackend):
+    """
+    Single-node backend on an embedded SQLite database (WAL mode).
+
+    It speaks the same key layout as the other backends, but prompts and
+    favorites are stored in real tables, so listing, tool filtering, sorting,
+    upvote counters and favorites run as indexed queries with transactional
+    increments, and FTS5 serves lexical search. Keys that are not prompts or
+    favorites (embeddings, manifests) go to a generic objects table.
+    """
+    name = "sqlite"
+    native_prompt_queries = True
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers run alongside the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    # --- Prompt rows ---
+
+    @staticmethod
+    def _row_to_prompt(row) -> Dict[str, Any]:
+        prompt = json.loads(row["body"])
+        prompt["upvotes"] = row["upvotes"]
+        prompt["upvoted_by"] = json.loads(row["upvoted_by"]) if row["upvoted_by"] else []
+        return prompt
+
+    def _read_prompt(self, conn, prompt_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute(f"SELECT {PROMPT_COLUMNS} FROM prompts p WHERE p.id = ?", (prompt_id,)).fetchone()
+        return self._row_to_prompt(row) if row else None
+
+    def _write_prompt(self, conn, prompt_id: str, prompt: Dict[str, Any]) -> None:
+        body = {k: v for k, v in prompt.items() if k not in DERIVED_FIELDS}
+        upvoted_by = _as_list(prompt.get("upvoted_by"))
+        tools = _as_list(prompt.get("tool_used"))
+        tags = _as_list(prompt.get("tags"))
+
+        conn.execute(
+            """INSERT INTO prompts (id, body, title, username, owner_email, created_at, upvotes)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET
+                   body = excluded.body, title = excluded.title, username = excluded.username,
+                   owner_email = excluded.owner_email, created_at = excluded.created_at,
+                   upvotes = excluded.upvotes""",
+            (prompt_id, json.dumps(body), prompt.get("title"), prompt.get("username"),
+             prompt.get("owner_email"), prompt.get("created_at"), int(prompt.get("upvotes") or 0))
+        )
+        conn.execute("DELETE FROM prompt_tools WHERE prompt_id = ?", (prompt_id,))
+        conn.executemany("INSERT OR IGNORE INTO prompt_tools (prompt_id, tool) VALUES (?, ?)",
+                         [(prompt_id, tool) for tool in tools])
+        conn.execute("DELETE FROM upvotes WHERE prompt_id = ?", (prompt_id,))
+        conn.executemany("INSERT OR IGNORE INTO upvotes (prompt_id, user_email, position) VALUES (?, ?, ?)",
+                         [(prompt_id, email, i) for i, email in enumerate(upvoted_by)])
+        conn.execute("DELETE FROM prompts_fts WHERE id = ?", (prompt_id,))
+        conn.execute(
+            "INSERT INTO prompts_fts (id, title, description, prompt_text, tools, tags) VALUES (?, ?, ?, ?, ?, ?)",
+            (prompt_id, prompt.get("title") or "", prompt.get("description") or "",
+             prompt.get("prompt_text") or "", " ".join(tools), " ".join(tags))
+        )
+
+    def _delete_prompt(self, conn, prompt_id: str) -> None:
+        conn.execute("DELETE FROM prompts WHERE id = ?", (prompt_id,))
+        conn.execute("DELETE FROM prompt_tools WHERE prompt_id = ?", (prompt_id,))
+        conn.execute("DELETE FROM upvotes WHERE prompt_id = ?", (prompt_id,))
+        conn.execute("DELETE FROM prompts_fts WHERE id = ?", (prompt_id,))
+
+    # --- StorageBackend interface ---
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        with self._connection() as conn:
+            match = PROMPT_KEY.match(key)
+            if match:
+                prompt = self._read_prompt(conn, match["id"])
+                if prompt is None:
+                    return None
+                body = json.dumps(prompt).encode("utf-8")
+                return body, _etag(body)
+
+            match = FAVORITES_KEY.match(key)
+            if match:
+                favorites = self._read_favorites(conn, match["email"])
+                if not favorites:
+                    return None
+                body = json.dumps(favorites).encode("utf-8")
+                return body, _etag(body)
+
+            row = conn.execute("SELECT body, etag FROM objects WHERE key = ?", (key,)).fetchone()
+            return (bytes(row["body"]), row["etag"]) if row else None
+
+    def head(self, key: str) -> Optional[str]:
+        if PROMPT_KEY.match(key) or FAVORITES_KEY.match(key):
+            obj = self.get(key)
+            return obj[1] if obj else None
+        with self._connection() as conn:
+            row = conn.execute("SELECT etag FROM objects WHERE key = ?", (key,)).fetchone()
+            return row["etag"] if row else None
+
+    def put(self, key: str, body: bytes, content_type: str = 'application/json', if_match: Optional[str] = None) -> str:
+        body = _to_bytes(body)
+        with self._connection() as conn:
+            conn.begin_immediate()
+            if if_match and self._head_in(conn, key) != if_match:
+                raise PreconditionFailed(key)
+
+            match = PROMPT_KEY.match(key)
+            if match:
+                self._write_prompt(conn, match["id"], json.loads(body.decode("utf-8")))
+            elif FAVORITES_KEY.match(key):
+                self._write_favorites(conn, FAVORITES_KEY.match(key)["email"], json.loads(body.decode("utf-8")))
+            else:
+                conn.execute(
+                    """INSERT INTO objects (key, body, content_type, etag) VALUES (?, ?, ?, ?)
+                       ON CONFLICT(key) DO UPDATE SET body = excluded.body,
+                           content_type = excluded.content_type, etag = excluded.etag""",
+                    (key, body, content_type, _etag(body))
+                )
+            return self._head_in(conn, key)
+
+    def _head_in(self, conn, key: str) -> Optional[str]:
+        match = PROMPT_KEY.match(key)
+        if match:
+            prompt = self._read_prompt(conn, match["id"])
+            return _etag(json.dumps(prompt).encode("utf-8")) if prompt else None
+        match = FAVORITES_KEY.match(key)
+        if match:
+            favorites = self._read_favorites(conn, match["email"])
+            return _etag(json.dumps(favorites).encode("utf-8")) if favorites else None
+        row = conn.execute("SELECT etag FROM objects WHERE key = ?", (key,)).fetchone()
+        return row["etag"] if row else None
+
+    def delete(self, key: str) -> bool:
+        with self._connection() as conn:
+            conn.begin_immediate()
+            match = PROMPT_KEY.match(key)
+            if match:
+                self._delete_prompt(conn, match["id"])
+            elif FAVORITES_KEY.match(key):
+                conn.execute("DELETE FROM favorites WHERE user_email = ?", (FAVORITES_KEY.match(key)["email"],))
+            else:
+                conn.execute("DELETE FROM objects WHERE key = ?", (key,))
+        return True
+
+    def list_keys(self, prefix: str) -> Iterator[str]:
+        with self._connection() as conn:
+            keys = [f"prompts/{row['id']}.json" for row in conn.execute("SELECT id FROM prompts ORDER BY id")]
+            keys += [f"users/{row['user_email']}/favorites.json"
+                     for row in conn.execute("SELECT DISTINCT user_email FROM favorites ORDER BY user_email")]
+            keys += [row["key"] for row in conn.execute("SELECT key FROM objects ORDER BY key")]
+        return iter(sorted(k for k in keys if k.startswith(prefix)))
+
+    # --- Native queries used by S3Service ---
+
+    SORT_COLUMNS = {"created_at": "p.created_at", "upvotes": "p.upvotes", "title": "p.title"}
+
+    def query_prompts(self, tool: Optional[str] = None, owner_email: Optional[str] = None,
+                      sort: str = "created_at", descending: bool = True,
+                      limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """Lists prompts with optional tool/owner filters, using the indexes."""
+        clauses, params = [], []
+        if tool:
+            clauses.append("p.id IN (SELECT prompt_id FROM prompt_tools WHERE tool = ?)")
+            params.append(tool)
+        if owner_email:
+            clauses.append("p.owner_email = ?")
+            params.append(owner_email)
+
+        sql = f"SELECT {PROMPT_COLUMNS} FROM prompts p"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {self.SORT_COLUMNS.get(sort, 'p.created_at')} {'DESC' if descending else 'ASC'}"
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limit), int(offset)]
+
+        with self._connection() as conn:
+            return [self._row_to_prompt(row) for row in conn.execute(sql, params)]
+
+    def search_text(self, query_text: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """FTS5 lexical search ranked by bm25. All terms must match, falling back to any term."""
+        terms = re.findall(r"\w+", query_text.lower())
+        if not terms:
+            return []
+
+        with self._connection() as conn:
+            for operator in (" AND ", " OR "):
+                match = operator.join(f'"{term}"*' for term in terms)
+                rows = conn.execute(
+                    f"""SELECT {PROMPT_COLUMNS} FROM prompts_fts f JOIN prompts p ON p.id = f.id
+                        WHERE prompts_fts MATCH ? ORDER BY bm25(prompts_fts) LIMIT ?""",
+                    (match, limit)
+                ).fetchall()
+                if rows or len(terms) == 1:
+                    return [self._row_to_prompt(row) for row in rows]
+        return []
+
+    def add_upvote(self, prompt_id: str, user_email: str) -> Optional[int]:
+        """Records an upvote in one transaction. Returns the new count, None if the prompt is missing."""
+        with self._connection() as conn:
+            conn.begin_immediate()
+            if conn.execute("SELECT 1 FROM prompts WHERE id = ?", (prompt_id,)).fetchone() is None:
+                return None
+            inserted = conn.execute(
+                """INSERT OR IGNORE INTO upvotes (prompt_id, user_email, position)
+                   VALUES (?, ?, (SELECT COALESCE(MAX(position), -1) + 1 FROM upvotes WHERE prompt_id = ?))""",
+                (prompt_id, user_email, prompt_id)
+            ).rowcount
+            if not inserted:
+                raise ValueError("Already upvoted")
+            conn.execute("UPDATE prompts SET upvotes = upvotes + 1 WHERE id = ?", (prompt_id,))
+            return conn.execute("SELECT upvotes FROM prompts WHERE id = ?", (prompt_id,)).fetchone()["upvotes"]
+
+    def remove_upvote(self, prompt_id: str, user_email: str) -> Optional[int]:
+        """Removes an upvote in one transaction. Returns the new count, None if the prompt is missing."""
+        with self._connection() as conn:
+            conn.begin_immediate()
+            if conn.execute("SELECT 1 FROM prompts WHERE id = ?", (prompt_id,)).fetchone() is None:
+                return None
+            deleted = conn.execute("DELETE FROM upvotes WHERE prompt_id = ? AND user_email = ?",
+                                   (prompt_id, user_email)).rowcount
+            if not deleted:
+                raise ValueError("Not upvoted")
+            conn.execute("UPDATE prompts SET upvotes = MAX(0, upvotes - 1) WHERE id = ?", (prompt_id,))
+            return conn.execute("SELECT upvotes FROM prompts WHERE id = ?", (prompt_id,)).fetchone()["upvotes"]
+
+    def _read_favorites(self, conn, user_email: str) -> List[str]:
+        rows = conn.execute("SELECT prompt_id FROM favorites WHERE user_email = ? ORDER BY position", (user_email,))
+        return [row["prompt_id"] for row in rows]
+
+    def _write_favorites(self, conn, user_email: str, prompt_ids: List[str]) -> None:
+        conn.execute("DELETE FROM favorites WHERE user_email = ?", (user_email,))
+        conn.executemany("INSERT OR IGNORE INTO favorites (user_email, prompt_id, position) VALUES (?, ?, ?)",
+                         [(user_email, prompt_id, i) for i, prompt_id in enumerate(prompt_ids)])
+
+    def get_favorites(self, user_email: str) -> List[str]:
+        with self._connection() as conn:
+            return self._read_favorites(conn, user_email)
+
+    def add_favorite(self, user_email: str, prompt_id: str) -> bool:
+        with self._connection() as conn:
+            conn.begin_immediate()
+            return conn.execute(
+                """INSERT OR IGNORE INTO favorites (user_email, prompt_id, position)
+                   VALUES (?, ?, (SELECT COALESCE(MAX(position), -1) + 1 FROM favorites WHERE user_email = ?))""",
+                (user_email, prompt_id, user_email)
+            ).rowcount == 1
+
+    def remove_favorite(self, user_email: str, prompt_id: str) -> bool:
+        with self._connection() as conn:
+            conn.begin_immediate()
+            return conn.execute("DELETE FROM favorites WHERE user_email = ? AND prompt_id = ?",
+                                (user_email, prompt_id)).rowcount == 1
+
+class _Transaction:
+    """Context manager that commits on success and rolls back on error (autocommit connection)."""
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._began = False
+
+    def begin_immediate(self):
+        # Take the write lock up front so read-modify-write sequences are atomic
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._began = True
+
+    def execute(self, *args):
+        return self.conn.execute(*args)
+
+    def executemany(self, *args):
+        return self.conn.executemany(*args)
+
+    def executescript(self, script):
+        return self.conn.executescript(script)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._began:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,377 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from .metrics import stage
+
+# boto3 is imported on first client creation so that importing this module
+# stays cheap on a Lambda cold start.
+_boto3_session = None
+_boto3_clients: Dict[str, Any] = {}
+_boto3_lock = threading.Lock()
+
+def get_boto3_client(service_name: str):
+    """Returns a cached boto3 client created from one shared session."""
+    global _boto3_session
+    client = _boto3_clients.get(service_name)
+    if client is not None:
+        return client
+
+    # boto3 sessions are not thread-safe, so client creation is serialised
+    with _boto3_lock:
+        if service_name not in _boto3_clients:
+            import boto3
+            if _boto3_session is None:
+                _boto3_session = boto3.session.Session()
+            _boto3_clients[service_name] = _boto3_session.client(service_name)
+        return _boto3_clients[service_name]
+
+class PreconditionFailed(Exception):
+    """Raised when a conditional write (if_match) loses to a concurrent writer."""
+
+# Returned by get_if_changed when the stored ETag still matches
+NOT_MODIFIED = object()
+
+def _quoted_md5(body: bytes) -> str:
+    return f'"{hashlib.md5(body).hexdigest()}"'
+
+def _to_bytes(body) -> bytes:
+    return body.encode('utf-8') if isinstance(body, str) else bytes(body)
+
+class StorageBackend:
+    """
+    Object store used by S3Service and VectorService.
+
+    Keys follow the S3 bucket layout (prompts/{id}.json, embeddings/vectors.npy,
+    users/{email}/favorites.json, ...), values are bytes and every object has an
+    ETag so optimistic locking and conditional reads work the same everywhere.
+    """
+    name = "base"
+    # Remote backends benefit from in-memory caches and /tmp snapshots
+    is_remote = False
+    # Backends that answer prompt listing, filtering, upvotes, favorites and
+    # lexical search natively (see SQLiteStorageBackend)
+    native_prompt_queries = False
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Returns (body, etag), or None if the key does not exist."""
+        raise NotImplementedError
+
+    def get_if_changed(self, key: str, etag: Optional[str]):
+        """Like get(), but returns NOT_MODIFIED if the object's ETag equals etag."""
+        if etag is not None and self.head(key) == etag:
+            return NOT_MODIFIED
+        return self.get(key)
+
+    def download_to(self, key: str, path: str, etag: Optional[str] = None):
+        """
+        Writes the object to the file at path unless its ETag equals etag.
+        Returns the object's ETag, NOT_MODIFIED, or None if it does not exist.
+        Backends that can stream don't hold the whole object in memory.
+        """
+        obj = self.get_if_changed(key, etag)
+        if obj is NOT_MODIFIED or obj is None:
+            return obj
+        with open(path, 'wb') as f:
+            f.write(obj[0])
+        return obj[1]
+
+    def get_range(self, key: str, start: int, end: int, etag: Optional[str] = None) -> Optional[bytes]:
+        """
+        Bytes [start, end) of the object, or None if it does not exist.
+        Raises PreconditionFailed if etag is given and the object has changed.
+        """
+        obj = self.get(key)
+        if obj is None:
+            return None
+        if etag is not None and obj[1] != etag:
+            raise PreconditionFailed(key)
+        return obj[0][start:end]
+
+    def head(self, key: str) -> Optional[str]:
+        """Returns the ETag of key, or None if it does not exist."""
+        raise NotImplementedError
+
+    def put(self, key: str, body: bytes, content_type: str = 'application/json', if_match: Optional[str] = None) -> str:
+        """Writes key and returns its new ETag. Raises PreconditionFailed if if_match is stale."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        """Deletes key. Returns True if the request succeeded."""
+        raise NotImplementedError
+
+    def list_keys(self, prefix: str) -> Iterator[str]:
+        """Yields every key under prefix."""
+        raise NotImplementedError
+
+class S3StorageBackend(StorageBackend):
+    name = "s3"
+    is_remote = True
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self.s3 = get_boto3_client('s3')
+
+    # Each call is timed as an S3 stage. Expected misses (404, 304) are handled
+    # inside the stage so only real failures count in stage_errors_total.
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        with stage("s3.get"):
+            try:
+                response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+                return response['Body'].read(), response['ETag']
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'NoSuchKey':
+                    return None
+                raise
+
+    def get_if_changed(self, key: str, etag: Optional[str]):
+        # Conditional GET: one round trip whether or not the object changed
+        kwargs = {'Bucket': self.bucket_name, 'Key': key}
+        if etag:
+            kwargs['IfNoneMatch'] = etag
+        with stage("s3.get_if_changed"):
+            try:
+                response = self.s3.get_object(**kwargs)
+                return response['Body'].read(), response['ETag']
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code in ('304', 'NotModified'):
+                    return NOT_MODIFIED
+                if code == 'NoSuchKey':
+                    return None
+                raise
+
+    def download_to(self, key: str, path: str, etag: Optional[str] = None):
+        # Conditional GET streamed to disk in 1MB chunks
+        kwargs = {'Bucket': self.bucket_name, 'Key': key}
+        if etag:
+            kwargs['IfNoneMatch'] = etag
+        with stage("s3.download"):
+            try:
+                response = self.s3.get_object(**kwargs)
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code in ('304', 'NotModified'):
+                    return NOT_MODIFIED
+                if code == 'NoSuchKey':
+                    return None
+                raise
+            with open(path, 'wb') as f:
+                for chunk in response['Body'].iter_chunks(1024 * 1024):
+                    f.write(chunk)
+            return response['ETag']
+
+    def get_range(self, key: str, start: int, end: int, etag: Optional[str] = None) -> Optional[bytes]:
+        kwargs = {'Bucket': self.bucket_name, 'Key': key, 'Range': f"bytes={start}-{end - 1}"}
+        if etag:
+            kwargs['IfMatch'] = etag
+        with stage("s3.get_range"):
+            try:
+                return self.s3.get_object(**kwargs)['Body'].read()
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code in ('412', 'PreconditionFailed'):
+                    raise PreconditionFailed(key)
+                if code == 'NoSuchKey':
+                    return None
+                raise
+
+    def head(self, key: str) -> Optional[str]:
+        with stage("s3.head"):
+            try:
+                return self.s3.head_object(Bucket=self.bucket_name, Key=key)['ETag']
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                    return None
+                raise
+
+    def put(self, key: str, body: bytes, content_type: str = 'application/json', if_match: Optional[str] = None) -> str:
+        put_kwargs = {
+            'Bucket': self.bucket_name,
+            'Key': key,
+            'Body': body,
+            'ContentType': content_type
+        }
+        if if_match:
+            put_kwargs['IfMatch'] = if_match
+        with stage("s3.put"):
+            try:
+                return self.s3.put_object(**put_kwargs).get('ETag')
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'PreconditionFailed':
+                    raise PreconditionFailed(key)
+                raise
+
+    def delete(self, key: str) -> bool:
+        with stage("s3.delete"):
+            try:
+                self.s3.delete_object(Bucket=self.bucket_name, Key=key)
+                return True
+            except ClientError as e:
+                print(f"Error deleting {key} from S3: {e}")
+                return False
+
+    def list_keys(self, prefix: str) -> Iterator[str]:
+        pages = iter(self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket_name, Prefix=prefix))
+        while True:
+            # Pages are fetched lazily, so each one is timed as it arrives
+            with stage("s3.list_page"):
+                page = next(pages, None)
+            if page is None:
+                return
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Filesystem backend using the bucket's key layout under a root directory.
+    Writes go to a temp file and are renamed into place, so readers never see
+    a partial object. Conditional writes are serialised per process.
+    """
+    name = "local"
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._write_lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root_dir, key))
+        if not path.startswith(self.root_dir + os.sep):
+            raise ValueError(f"Invalid key: {key}")
+        return path
+
+    @staticmethod
+    def _etag_from_stat(st) -> str:
+        # Derived from stat so HEAD never reads the object
+        return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+    def _etag(self, path: str) -> Optional[str]:
+        try:
+            return self._etag_from_stat(os.stat(path))
+        except FileNotFoundError:
+            return None
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read(), self._etag_from_stat(os.fstat(f.fileno()))
+        except FileNotFoundError:
+            return None
+
+    def download_to(self, key: str, path: str, etag: Optional[str] = None):
+        try:
+            with open(self._path(key), 'rb') as src:
+                current = self._etag_from_stat(os.fstat(src.fileno()))
+                if etag is not None and current == etag:
+                    return NOT_MODIFIED
+                with open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                return current
+        except FileNotFoundError:
+            return None
+
+    def get_range(self, key: str, start: int, end: int, etag: Optional[str] = None) -> Optional[bytes]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                if etag is not None and self._etag_from_stat(os.fstat(f.fileno())) != etag:
+                    raise PreconditionFailed(key)
+                f.seek(start)
+                return f.read(max(0, end - start))
+        except FileNotFoundError:
+            return None
+
+    def head(self, key: str) -> Optional[str]:
+        return self._etag(self._path(key))
+
+    def put(self, key: str, body: bytes, content_type: str = 'application/json', if_match: Optional[str] = None) -> str:
+        body = _to_bytes(body)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._write_lock:
+            if if_match and self._etag(path) != if_match:
+                raise PreconditionFailed(key)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(body)
+                os.replace(temp_path, path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            return self._etag(path)
+
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def list_keys(self, prefix: str) -> Iterator[str]:
+        # Walk only the directory part of the prefix
+        base = os.path.join(self.root_dir, os.path.dirname(prefix))
+        for dirpath, _, filenames in os.walk(base):
+            for filename in sorted(filenames):
+                if filename.startswith(".tmp-"):
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, filename), self.root_dir).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    yield key
+
+class MemoryStorageBackend(StorageBackend):
+    """In-process backend: a dict indexed by key, so every lookup is O(1)."""
+    name = "memory"
+
+    def __init__(self):
+        self._objects: Dict[str, Tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        return self._objects.get(key)
+
+    def head(self, key: str) -> Optional[str]:
+        obj = self._objects.get(key)
+        return obj[1] if obj else None
+
+    def put(self, key: str, body: bytes, content_type: str = 'application/json', if_match: Optional[str] = None) -> str:
+        body = _to_bytes(body)
+        with self._lock:
+            if if_match and self.head(key) != if_match:
+                raise PreconditionFailed(key)
+            etag = _quoted_md5(body)
+            self._objects[key] = (body, etag)
+            return etag
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            self._objects.pop(key, None)
+        return True
+
+    def list_keys(self, prefix: str) -> Iterator[str]:
+        return iter(sorted(k for k in list(self._objects) if k.startswith(prefix)))
+
+def create_storage_backend(bucket_name: str) -> StorageBackend:
+    """
+    Picks the backend from STORAGE_BACKEND (s3, local, memory or sqlite).
+    Defaults to memory in MOCK_MODE and s3 otherwise.
+    """
+    mock_mode = os.environ.get("MOCK_MODE", "false").lower() == "true"
+    backend = os.environ.get("STORAGE_BACKEND", "memory" if mock_mode else "s3").lower()
+
+    if backend == "s3":
+        return S3StorageBackend(bucket_name)
+    if backend == "local":
+        return LocalStorageBackend(os.environ.get("LOCAL_STORAGE_DIR", "./data"))
+    if backend == "memory":
+        return MemoryStorageBackend()
+    if backend == "sqlite":
+        from .sqlite_storage import SQLiteStorageBackend
+        return SQLiteStorageBackend(os.environ.get("SQLITE_PATH", "./data/prompts.db"))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
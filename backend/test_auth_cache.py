@@ -0,0 +1,45 @@
+"""
+Tests for the verified-token cache.
+Run this with: python3 -m pytest backend/test_auth_cache.py
+"""
+import datetime
+
+import jwt
+
+from backend import auth_utils
+from backend.auth_utils import VerifiedTokenCache, create_magic_link_token, create_session_token
+
+def make_token(email, token_type="session", expires_in=60):
+    exp = datetime.datetime.utcnow() + datetime.timedelta(seconds=expires_in)
+    return jwt.encode({"sub": email, "type": token_type, "exp": exp}, auth_utils.SECRET_KEY, algorithm=auth_utils.ALGORITHM)
+
+def test_matches_verify_token_and_serves_repeats_from_cache():
+    cache = VerifiedTokenCache(capacity=2)
+    token = create_session_token("a@pega.com")
+    assert cache.verify(token, "session") == "a@pega.com"
+    assert cache.verify(token, "session") == "a@pega.com"
+    assert cache.hits == 1
+
+    # Same answers as verify_token for the wrong type, a bad signature and garbage
+    assert cache.verify(token, "magic_link") is None
+    assert cache.verify(create_magic_link_token("a@pega.com"), "session") is None
+    assert cache.verify(token[:-2] + "xx", "session") is None
+    assert cache.verify("not-a-jwt", "session") is None
+    assert len(cache) == 1
+
+def test_expired_entries_and_revocation():
+    cache = VerifiedTokenCache()
+    token = make_token("a@pega.com")
+    assert cache.verify(token, "session") == "a@pega.com"
+    # Pretend the token's exp has passed
+    key = next(iter(cache._entries))
+    cache._entries[key] = ("a@pega.com", 0.0)
+    assert cache.verify(make_token("b@pega.com", expires_in=-10), "session") is None
+    assert cache.verify(token, "session") == "a@pega.com"
+    assert cache.misses == 3
+
+    cache.revoke(token)
+    assert len(cache) == 0
+    cache.verify(token, "session")
+    cache.clear()
+    assert len(cache) == 0
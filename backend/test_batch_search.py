@@ -0,0 +1,62 @@
+"""
+Tests for batched multi-query search.
+Run this with: python3 -m pytest backend/test_batch_search.py
+"""
+import numpy as np
+import pytest
+
+from backend.circuit_breaker import DependencyGuard
+from backend.services import S3Service, VectorService
+from backend.storage import MemoryStorageBackend
+
+@pytest.fixture
+def vector_service(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    s3_service = S3Service("test-bucket", storage=MemoryStorageBackend())
+    s3_service.put_prompts([
+        {"id": f"p{i}", "title": f"prompt {i}", "description": "", "prompt_text": f"text {i}"} for i in range(20)
+    ])
+    vector_service = VectorService(s3_service)
+    rng = np.random.default_rng(7)
+    vector_service.upsert_many({f"p{i}": rng.standard_normal(16) for i in range(20)})
+    return vector_service
+
+def query_vector(text):
+    return np.random.default_rng(sum(map(ord, text))).standard_normal(16).tolist()
+
+def test_batch_matches_one_search_per_query(vector_service, monkeypatch):
+    batch_calls = []
+
+    def embed_batch(texts, trace=None):
+        batch_calls.append(list(texts))
+        return [query_vector(t) for t in texts]
+    monkeypatch.setattr(vector_service, "_get_embeddings_batch", embed_batch)
+    monkeypatch.setattr(vector_service, "_get_embedding_rest", lambda text, trace=None: query_vector(text))
+
+    queries = ["refactor code", "write tests", "summarise a meeting"]
+    answers = vector_service.search_batch(queries, limit=4)
+    assert batch_calls == [queries]
+    for query, answer in zip(queries, answers):
+        single = vector_service.search(query, limit=4)
+        assert answer["fallback"] is None
+        assert [r["id"] for r in answer["results"]] == [r["id"] for r in single]
+        assert [r["score"] for r in answer["results"]] == pytest.approx([r["score"] for r in single])
+
+def test_unembedded_queries_fall_back_to_lexical(vector_service, monkeypatch):
+    monkeypatch.setattr(vector_service, "_get_embeddings_batch",
+                        lambda texts, trace=None: [None if "prompt" in t else query_vector(t) for t in texts])
+    answers = vector_service.search_batch(["prompt 3", "anything"], limit=2)
+    assert answers[0]["fallback"] == "no_embedding"
+    assert [r["id"] for r in answers[0]["results"]] == ["p3"]
+    assert answers[1]["fallback"] is None and len(answers[1]["results"]) == 2
+
+def test_open_breaker_answers_every_query_lexically(vector_service):
+    vector_service.gemini_guard = DependencyGuard("test", failure_threshold=1, cooldown=60)
+    with pytest.raises(RuntimeError):
+        with vector_service.gemini_guard.call():
+            raise RuntimeError("upstream error")
+    answers = vector_service.search_batch(["prompt 1", "prompt 2"])
+    assert [a["fallback"] for a in answers] == ["circuit_open", "circuit_open"]
+    assert [a["results"][0]["id"] for a in answers] == ["p1", "p2"]
@@ -0,0 +1,51 @@
+"""
+Tests for the bulk migration framework.
+Run this with: python3 -m pytest backend/test_bulk_migration.py
+"""
+import numpy as np
+import pytest
+
+from backend.bulk_migration import BulkMigration, legacy_tools_transform
+from backend.services import S3Service, VectorService
+from backend.testing import CountingPuts
+
+pytestmark = pytest.mark.usefixtures("real_mode")
+
+def make_services(n=25):
+    storage = CountingPuts()
+    s3_service = S3Service("test-bucket", storage=storage)
+    s3_service.put_prompts([
+        {"id": f"p{i:03d}", "title": f"Prompt {i}", "prompt_text": "text", "tags": [],
+         "tool_used": "ChatGPT" if i % 2 == 0 else ["Claude"]}
+        for i in range(n)
+    ])
+    vector_service = VectorService(s3_service)
+    vector_service._get_embeddings_batch = lambda texts: [np.ones(768).tolist() for _ in texts]
+    storage.puts.clear()
+    return storage, s3_service, vector_service
+
+def test_dry_run_writes_nothing():
+    storage, s3_service, vector_service = make_services()
+    result = BulkMigration("tools", legacy_tools_transform, s3_service, vector_service, reembed=True).run(dry_run=True)
+    assert result["status"] == "complete" and result["updated_count"] == 13
+    assert storage.puts == []
+
+def test_migration_commits_vectors_once_and_resumes_after_time_budget():
+    storage, s3_service, vector_service = make_services()
+    migration = BulkMigration("tools", legacy_tools_transform, s3_service, vector_service,
+                              reembed=True, batch_size=10, time_budget=0)
+
+    # A zero budget still processes one batch per call
+    first = migration.run()
+    assert first["status"] == "partial" and first["total_scanned"] == 10
+    migration.time_budget = 60
+    second = migration.run()
+    assert second["status"] == "complete" and second["resumed_from"] == "p009"
+    assert second["total_scanned"] == 25 and second["updated_count"] == 13
+    # One vector commit per invocation, not one per prompt
+    assert storage.puts.count("embeddings/vectors.npy") == 2
+    assert all(isinstance(p["tool_used"], list) for p in s3_service.list_prompts())
+
+    # Re-running is a no-op
+    again = migration.run()
+    assert again["updated_count"] == 0 and again["vectors_written"] == 0
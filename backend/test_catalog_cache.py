@@ -0,0 +1,36 @@
+"""
+Tests for the manifest-validated prompt catalog cache.
+Run this with: python3 -m pytest backend/test_catalog_cache.py
+"""
+import pytest
+
+from backend.services import S3Service
+from backend.storage import MemoryStorageBackend
+
+@pytest.fixture(autouse=True)
+def real_mode(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+
+def test_foreign_write_before_a_local_write_is_not_lost():
+    storage = MemoryStorageBackend()
+    first = S3Service("test-bucket", storage=storage)
+    second = S3Service("test-bucket", storage=storage)
+    first.put_prompts([{"id": "a", "title": "a"}])
+    assert [p["id"] for p in first.list_prompts()] == ["a"]
+
+    # Another instance writes, then this one writes before listing again
+    second.put_prompts([{"id": "b", "title": "b"}])
+    first.put_prompts([{"id": "c", "title": "c"}])
+
+    assert sorted(p["id"] for p in first.list_prompts()) == ["a", "b", "c"]
+    assert sorted(p["id"] for p in second.list_prompts()) == ["a", "b", "c"]
+
+def test_local_writes_keep_the_cache_without_a_crawl():
+    service = S3Service("test-bucket", storage=MemoryStorageBackend())
+    service.put_prompts([{"id": "a", "title": "a"}])
+    service.list_prompts()
+    service.put_prompts([{"id": "b", "title": "b"}])
+
+    service._crawl_prompts = lambda: pytest.fail("unexpected crawl")
+    assert sorted(p["id"] for p in service.list_prompts()) == ["a", "b"]
@@ -0,0 +1,68 @@
+"""
+Tests for chunked multi-vector embeddings.
+Run this with: python3 -m pytest backend/test_chunked_embeddings.py
+"""
+import numpy as np
+import pytest
+
+from backend.services import S3Service, VectorService
+from backend.storage import MemoryStorageBackend
+
+@pytest.fixture
+def vector_service(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("EMBEDDING_CHUNK_CHARS", "100")
+    monkeypatch.setenv("EMBEDDING_CHUNK_OVERLAP", "20")
+    s3_service = S3Service("test-bucket", storage=MemoryStorageBackend())
+    s3_service.put_prompts([{"id": pid, "title": pid, "prompt_text": "text"} for pid in ("a", "b", "c")])
+    return VectorService(s3_service)
+
+def basis(i, dim=8):
+    v = np.zeros(dim)
+    v[i] = 1.0
+    return v
+
+def test_long_text_is_split_into_overlapping_chunks(vector_service):
+    text = " ".join(f"word{i:03d}" for i in range(60))
+    chunks = vector_service._chunk_text(text)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    # Each chunk starts on a word that the previous chunk already covered
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.split()[0] in previous.split()
+    assert chunks[-1].endswith("word059")
+    assert vector_service._chunk_text("short text") == ["short text"]
+
+def test_chunked_prompts_score_by_their_best_chunk(vector_service, monkeypatch):
+    vector_service.upsert_many({
+        "a": [basis(0), basis(1), basis(2)],
+        "b": basis(3),
+        "c": [basis(4), 0.6 * basis(1) + 0.8 * basis(5)],
+    })
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    assert ids == ["a", "a", "a", "b", "c", "c"] and matrix.shape == (6, 8)
+
+    monkeypatch.setattr(vector_service, "_get_embedding_rest", lambda text, trace=None: basis(1).tolist())
+    results = vector_service.search("query", limit=3)
+    assert [r["id"] for r in results] == ["a", "c", "b"]
+    assert results[0]["score"] == pytest.approx(1.0)
+    assert results[1]["score"] == pytest.approx(0.6)
+
+    vector_service.chunk_aggregation = "mean"
+    vector_service._groups_cache = None
+    results = vector_service.search("query", limit=1)
+    assert results[0]["id"] == "a" and results[0]["score"] == pytest.approx(1 / 3)
+
+def test_update_and_delete_replace_every_row_of_a_prompt(vector_service):
+    vector_service.upsert_many({"a": [basis(0), basis(1)], "b": basis(2)})
+    vector_service.upsert_many({"a": basis(3)})
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    assert ids == ["b", "a"]
+    assert np.allclose(matrix[1], basis(3))
+
+    vector_service.upsert_many({"b": [basis(4), basis(5)]})
+    assert vector_service.delete_point("b")
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    assert ids == ["a"] and matrix.shape == (1, 8)
@@ -0,0 +1,72 @@
+"""
+Tests for the Gemini circuit breaker and adaptive concurrency limit.
+Run this with: python3 -m pytest backend/test_circuit_breaker.py
+"""
+import time
+
+import pytest
+import requests
+
+from backend.circuit_breaker import CLOSED, HALF_OPEN, OPEN, DependencyGuard, DependencyUnavailable
+from backend.services import S3Service, VectorService
+from backend.storage import MemoryStorageBackend
+
+def fail(guard):
+    with pytest.raises(RuntimeError):
+        with guard.call():
+            raise RuntimeError("upstream error")
+
+def test_breaker_opens_then_recovers_through_a_trial_call():
+    guard = DependencyGuard("test", failure_threshold=3, cooldown=0.05, max_concurrency=4)
+    for _ in range(3):
+        fail(guard)
+    assert guard.state == OPEN
+    with pytest.raises(DependencyUnavailable) as excinfo:
+        guard.acquire()
+    assert excinfo.value.reason == "circuit_open"
+
+    time.sleep(0.06)
+    assert guard.available() and guard.state == HALF_OPEN
+    with guard.call():
+        # Only the trial call goes through while half-open
+        with pytest.raises(DependencyUnavailable):
+            guard.acquire()
+    assert guard.state == CLOSED
+
+def test_limit_shrinks_on_slow_calls_and_refuses_excess():
+    guard = DependencyGuard("test", max_concurrency=8, target_latency=0.1, slow_call=10)
+    for _ in range(6):
+        guard.release(True, 1.0, guard.acquire())
+    assert guard.limit < 1.5 and guard.state == CLOSED
+
+    trial = guard.acquire()
+    with pytest.raises(DependencyUnavailable) as excinfo:
+        guard.acquire()
+    assert excinfo.value.reason == "overloaded"
+    guard.release(True, 0.01, trial)
+
+def test_search_goes_lexical_while_the_circuit_is_open(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    s3_service = S3Service("test-bucket", storage=MemoryStorageBackend())
+    s3_service.put_prompts([{"id": "p1", "title": "Refactor helper", "description": "", "prompt_text": "text"}])
+    vector_service = VectorService(s3_service)
+    vector_service.gemini_guard = DependencyGuard("test", failure_threshold=2, cooldown=60)
+
+    calls = []
+    def timeout(*args, **kwargs):
+        calls.append(1)
+        raise requests.Timeout("slow")
+    monkeypatch.setattr(requests, "post", timeout)
+
+    for _ in range(2):
+        trace = {}
+        vector_service.search("refactor", trace=trace)
+        assert trace["fallback"] == "no_embedding"
+    trace = {}
+    results = vector_service.search("refactor", trace=trace)
+    assert trace["fallback"] == "circuit_open"
+    assert [r["id"] for r in results] == ["p1"]
+    # The open breaker answered without calling Gemini
+    assert len(calls) == 2
@@ -0,0 +1,81 @@
+"""
+Cold-start regression tests for backend.main.
+Run this with: python3 -m pytest backend/test_cold_start.py -s
+
+The import-time report is printed so the breakdown shows up in CI logs.
+"""
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported on the code paths that need them
+DEFERRED_MODULES = ["numpy", "requests", "boto3"]
+
+def import_time_report(module: str):
+    """Imports a module in a fresh interpreter with -X importtime and parses the output."""
+    env = dict(os.environ, MOCK_MODE="true")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+        env=env,
+    )
+    assert proc.returncode == 0, proc.stderr
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|").split("|")]
+        entries.append({"name": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return entries
+
+def test_import_time_report():
+    """Importing backend.main must not pull in numpy, requests or boto3"""
+    entries = import_time_report("backend.main")
+    imported = {entry["name"] for entry in entries}
+
+    print("\nTop 15 imports by cumulative time (us):")
+    for entry in sorted(entries, key=lambda e: e["cumulative_us"], reverse=True)[:15]:
+        print(f"  {entry['cumulative_us']:>9}  {entry['name']}")
+
+    for module in DEFERRED_MODULES:
+        assert module not in imported, f"{module} is imported when backend.main loads"
+
+LAZY_SERVICES_SCRIPT = """
+from fastapi.testclient import TestClient
+from backend import main
+
+assert not main.s3_service.is_initialized
+assert not main.vector_service.is_initialized
+assert not main.ses_service.is_initialized
+
+client = TestClient(main.app)
+assert client.get("/auth/me").status_code == 401
+assert client.get("/tools").status_code == 200
+assert not main.s3_service.is_initialized
+
+assert client.get("/prompts").status_code == 200
+assert main.s3_service.is_initialized
+"""
+
+def test_services_are_lazy():
+    """Services are only constructed on first use"""
+    env = dict(os.environ, MOCK_MODE="true")
+    proc = subprocess.run(
+        [sys.executable, "-c", LAZY_SERVICES_SCRIPT],
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+        env=env,
+    )
+    assert proc.returncode == 0, proc.stderr
+
+    print("✓ Test passed: Services are constructed on demand")
+
+if __name__ == "__main__":
+    test_import_time_report()
+    test_services_are_lazy()
@@ -0,0 +1,62 @@
+"""
+Tests for near-duplicate detection.
+Run this with: python3 -m pytest backend/test_duplicates.py
+"""
+import numpy as np
+import pytest
+
+from backend.draft_embeddings import DraftEmbeddings
+from backend.duplicates import duplicate_clusters
+from backend.embedding_queue import EmbeddingQueue
+from backend.services import S3Service, VectorService
+from backend.storage import MemoryStorageBackend
+
+@pytest.fixture
+def vector_service(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    vector_service = VectorService(S3Service("test-bucket", storage=MemoryStorageBackend()))
+    rng = np.random.default_rng(5)
+    base = rng.standard_normal((30, 64))
+    vectors = {f"p{i}": base[i] for i in range(30)}
+    # Two clusters: p30 ~ p31 ~ p2 (chained) and p32 ~ p7
+    vectors["p30"] = base[2] + 0.05 * rng.standard_normal(64)
+    vectors["p31"] = vectors["p30"] + 0.05 * rng.standard_normal(64)
+    vectors["p32"] = base[7] + 0.05 * rng.standard_normal(64)
+    vector_service.upsert_many(vectors)
+    return vector_service
+
+def test_blocked_pass_finds_the_clusters(vector_service):
+    clusters = duplicate_clusters(vector_service, threshold=0.95, max_block_bytes=5 * 33 * 4)
+    assert [sorted(c["prompt_ids"]) for c in clusters] == [["p2", "p30", "p31"], ["p32", "p7"]]
+    assert clusters[0]["pairs"] == 3 and clusters[0]["max_score"] >= 0.95
+    # Same answer when everything fits in one block
+    single = duplicate_clusters(vector_service, threshold=0.95)
+    assert [(c["prompt_ids"], c["pairs"]) for c in single] == [(c["prompt_ids"], c["pairs"]) for c in clusters]
+
+def test_near_duplicates_of_a_candidate(vector_service):
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    candidate = matrix[ids.index("p7")] * 3
+    matches = vector_service.near_duplicates(candidate, 0.95)
+    assert [pid for pid, _ in matches] == ["p7", "p32"]
+    assert matches[0][1] == pytest.approx(1.0)
+    assert vector_service.near_duplicates(np.ones(64), 0.95) == []
+
+@pytest.mark.parametrize("speculative", [True, False])
+def test_checked_embedding_is_reused_by_the_save(vector_service, speculative):
+    calls = []
+
+    def embed(text, trace=None):
+        calls.append(text)
+        return np.ones(64).tolist()
+    vector_service._get_embedding_rest = embed
+    drafts = DraftEmbeddings(lambda: vector_service, enabled=speculative)
+    queue = EmbeddingQueue(lambda: vector_service, mode="sync", vector_lookup=drafts.take)
+
+    vector = drafts.embedding_for("new prompt text")
+    vector_service.near_duplicates(vector, 0.95)
+    assert queue.enqueue("p99", "new prompt text", vector=vector) == "done"
+    assert calls == ["new prompt text"]
+    # Checked embeddings are handed over directly; nothing is written under drafts/
+    assert list(vector_service.storage.list_keys("drafts/")) == []
@@ -0,0 +1,108 @@
+"""
+Tests for the write-behind embedding queue.
+Run this with: python3 -m pytest backend/test_embedding_queue.py
+"""
+import json
+import time
+
+import numpy as np
+import pytest
+
+from backend.draft_embeddings import DraftEmbeddings
+from backend.embedding_queue import EmbeddingQueue, MARKER_PREFIX
+from backend.services import S3Service, VectorService
+from backend.storage import MemoryStorageBackend
+from backend.testing import CountingPuts
+
+pytestmark = pytest.mark.usefixtures("real_mode")
+
+def make_vector_service(storage, fail=False):
+    vector_service = VectorService(S3Service("test-bucket", storage=storage))
+    vector_service.batch_calls = []
+
+    def embed_batch(texts):
+        vector_service.batch_calls.append(list(texts))
+        if fail:
+            return [None] * len(texts)
+        return [np.random.default_rng(len(t)).standard_normal(768).tolist() for t in texts]
+    vector_service._get_embeddings_batch = embed_batch
+    return vector_service
+
+def test_queued_saves_are_coalesced_into_one_vector_write():
+    storage = CountingPuts()
+    vector_service = make_vector_service(storage)
+    queue = EmbeddingQueue(lambda: vector_service, mode="background", window=0.2)
+
+    statuses = [queue.enqueue(f"p{i}", f"text {i}") for i in range(5)]
+    # A second update to p0 replaces its queued text
+    queue.enqueue("p0", "newer text for p0")
+    assert statuses == ["pending"] * 5
+    assert storage.get(f"{MARKER_PREFIX}p3.json") is not None
+
+    deadline = time.time() + 5
+    while queue.stats()["queued"] or queue.stats()["in_flight"]:
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+    assert len(vector_service.batch_calls) == 1
+    assert "newer text for p0" in vector_service.batch_calls[0]
+    assert storage.puts.count("embeddings/vectors.npy") == 1
+    assert list(storage.list_keys(MARKER_PREFIX)) == []
+    assert queue.status("p3")["embedding_status"] == "done"
+    assert queue.status("unknown")["embedding_status"] == "missing"
+
+def test_failed_jobs_keep_a_marker_and_drain_recovers_them():
+    storage = MemoryStorageBackend()
+    queue = EmbeddingQueue(lambda: make_vector_service(storage, fail=True), mode="sync", max_attempts=2)
+    # Retried once in the same pass, then marked failed
+    assert queue.enqueue("p1", "some text") == "failed"
+    marker = json.loads(storage.get(f"{MARKER_PREFIX}p1.json")[0])
+    assert marker["status"] == "failed" and marker["attempts"] == 2
+
+    # A fresh instance (e.g. after a Lambda recycle) with a working embedder
+    healthy = make_vector_service(storage)
+    fresh = EmbeddingQueue(lambda: healthy, mode="sync")
+    assert fresh.status("p1")["embedding_status"] == "failed"
+    result = fresh.drain(include_failed=True)
+    assert result["recovered"] == 1 and result["committed"] == 1
+    assert fresh.status("p1")["embedding_status"] == "done"
+
+def test_skipped_without_gemini_key(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY")
+    storage = MemoryStorageBackend()
+    vector_service = VectorService(S3Service("test-bucket", storage=storage))
+    queue = EmbeddingQueue(lambda: vector_service)
+    assert queue.enqueue("p1", "text") == "skipped"
+    assert list(storage.list_keys(MARKER_PREFIX)) == []
+
+def test_save_reuses_speculative_draft_embedding():
+    storage = MemoryStorageBackend()
+    vector_service = make_vector_service(storage)
+    vector_service._get_embedding_rest = lambda text: np.ones(768).tolist()
+    drafts = DraftEmbeddings(lambda: vector_service)
+    queue = EmbeddingQueue(lambda: vector_service, mode="sync", vector_lookup=drafts.take)
+
+    key = drafts.start("draft text")
+    other_key = drafts.start("text before the edit")
+    other_draft = drafts._in_flight.get(other_key)
+    assert queue.enqueue("p1", "draft text", draft_key=key) == "done"
+    # The draft key no longer matches the saved text
+    assert queue.enqueue("p2", "edited text", draft_key=other_key) == "done"
+    # Only the edited prompt needed an embedding call
+    assert vector_service.batch_calls == [["edited text"]]
+    # The unused draft is still stored once its background embedding finishes
+    if other_draft is not None:
+        other_draft.result(timeout=5)
+    assert list(storage.list_keys("drafts/")) == [f"drafts/embeddings/{other_key}.json"]
+
+def test_saves_without_a_draft_key_never_probe_storage():
+    storage = CountingPuts()
+    vector_service = make_vector_service(storage)
+    drafts = DraftEmbeddings(lambda: vector_service)
+    queue = EmbeddingQueue(lambda: vector_service, mode="sync", vector_lookup=drafts.take)
+    reads = []
+    original_get = storage.get
+    storage.get = lambda key: reads.append(key) or original_get(key)
+
+    assert queue.enqueue("p1", "some text") == "done"
+    assert not [key for key in reads if key.startswith("drafts/")]
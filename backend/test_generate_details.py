@@ -0,0 +1,55 @@
+"""
+Tests for the /generate-details cache and single-flight deduplication.
+Run this with: python3 -m pytest backend/test_generate_details.py
+"""
+import threading
+import time
+
+import pytest
+
+from backend.services import S3Service, VectorService
+from backend.storage import MemoryStorageBackend
+
+@pytest.fixture
+def vector_service(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    service = VectorService(S3Service("test-bucket", storage=MemoryStorageBackend()))
+    service.upstream_calls = 0
+    service.fail = False
+
+    def fake_upstream(title, prompt_text):
+        service.upstream_calls += 1
+        time.sleep(0.1)
+        if service.fail:
+            return {"tags": ["error"], "description": "Failed"}, False
+        return {"tags": ["a", "b"], "description": f"About {title}"}, True
+    service._generate_details_uncached = fake_upstream
+    return service
+
+def test_identical_concurrent_requests_share_one_call_and_are_cached(vector_service):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(vector_service.generate_details("T", "text")))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert vector_service.upstream_calls == 1
+    assert all(r == {"tags": ["a", "b"], "description": "About T"} for r in results)
+
+    # Cached, and callers can't mutate the cached copy
+    results[0]["tags"].append("mutated")
+    assert vector_service.generate_details("T", "text")["tags"] == ["a", "b"]
+    assert vector_service.upstream_calls == 1
+
+    vector_service.generate_details("T", "other text")
+    assert vector_service.upstream_calls == 2
+
+def test_error_fallback_is_not_cached(vector_service):
+    vector_service.fail = True
+    assert vector_service.generate_details("T", "text")["tags"] == ["error"]
+    vector_service.fail = False
+    assert vector_service.generate_details("T", "text")["tags"] == ["a", "b"]
+    assert vector_service.upstream_calls == 2
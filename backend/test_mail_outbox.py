@@ -0,0 +1,108 @@
+"""
+Tests for the SES identity-status cache and the magic-link outbox.
+Run this with: python3 -m pytest backend/test_mail_outbox.py
+"""
+import json
+
+from botocore.exceptions import ClientError
+
+from backend import mail_outbox as mail_outbox_module
+from backend.mail_outbox import MailOutbox
+from backend.services import SESService
+from backend.storage import MemoryStorageBackend
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "SendEmail")
+
+def link_for(email):
+    return f"http://link/{email}"
+
+class FakeSES:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.sent = []
+
+    def deliver_magic_link(self, recipient_email, magic_link):
+        if self.failures:
+            raise client_error(self.failures.pop(0))
+        self.sent.append(magic_link)
+
+def test_transient_failures_are_retried_and_recorded():
+    ses = FakeSES(failures=["Throttling"])
+    storage = MemoryStorageBackend()
+    outbox = MailOutbox(lambda: ses, link_for, lambda: storage, attempts=3, backoff=0)
+    delivery_id = outbox.enqueue("someone@pega.com")
+    assert outbox.status(delivery_id)["status"] == "queued"
+
+    assert outbox.deliver(delivery_id, "someone@pega.com")
+    assert ses.sent == ["http://link/someone@pega.com"]
+    record = outbox.status(delivery_id)
+    assert record["status"] == "sent" and record["attempts"] == 2
+    assert record["recipient"] == "s***@pega.com"
+    # Another instance reads the persisted record, which doesn't contain the link
+    other = MailOutbox(lambda: ses, link_for, lambda: storage)
+    assert other.status(delivery_id)["status"] == "sent"
+    assert b"http://link" not in storage.get(f"mail-outbox/{delivery_id}.json")[0]
+
+def test_rejections_fail_without_retrying():
+    ses = FakeSES(failures=["MessageRejected", "MessageRejected"])
+    outbox = MailOutbox(lambda: ses, link_for, None, attempts=3, backoff=0)
+    delivery_id = outbox.enqueue("someone@pega.com")
+    assert not outbox.deliver(delivery_id, "someone@pega.com")
+    record = outbox.status(delivery_id)
+    assert record["status"] == "failed" and record["attempts"] == 1
+    assert record["error"].startswith("MessageRejected")
+
+def test_lambda_hands_the_send_to_an_async_invocation(monkeypatch):
+    ses = FakeSES()
+    storage = MemoryStorageBackend()
+    invocations = []
+
+    class FakeLambda:
+        def invoke(self, **kwargs):
+            invocations.append(kwargs)
+    monkeypatch.setattr(mail_outbox_module, "get_boto3_client", lambda name: FakeLambda())
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "prompt-api")
+
+    class Tasks:
+        def add_task(self, *args):
+            raise AssertionError("sent inside the login invocation")
+    def no_link_here(email):
+        raise AssertionError("the link was minted by the login invocation")
+    login_instance = MailOutbox(lambda: ses, no_link_here, lambda: storage, backoff=0)
+    delivery_id = login_instance.enqueue("someone@pega.com")
+    assert login_instance.dispatch(delivery_id, "someone@pega.com", Tasks()) == "lambda"
+    assert invocations[0]["FunctionName"] == "prompt-api" and invocations[0]["InvocationType"] == "Event"
+    assert ses.sent == []
+    # The event AWS queues carries no login token
+    assert b"link" not in invocations[0]["Payload"]
+
+    # The async invocation (another environment) mints the link and sends it; the login instance sees the outcome
+    event = json.loads(invocations[0]["Payload"])
+    worker = MailOutbox(lambda: ses, link_for, lambda: storage, backoff=0)
+    assert worker.handle_event(event) == {"delivery_id": delivery_id, "sent": True}
+    assert ses.sent == ["http://link/someone@pega.com"]
+    assert login_instance.status(delivery_id)["status"] == "sent"
+    assert worker.handle_event({"httpMethod": "GET"}) is None
+
+def test_identity_status_is_cached_until_verification(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    service = SESService()
+    calls = []
+
+    class FakeClient:
+        def get_identity_verification_attributes(self, Identities):
+            calls.append(Identities)
+            return {"VerificationAttributes": {Identities[0]: {"VerificationStatus": "Success"}}}
+
+        def verify_email_identity(self, EmailAddress):
+            pass
+    service.ses = FakeClient()
+
+    assert service.get_identity_status("a@pega.com") == "Success"
+    assert service.get_identity_status("a@pega.com") == "Success"
+    assert len(calls) == 1
+    service.verify_email("a@pega.com")
+    service.get_identity_status("a@pega.com")
+    assert len(calls) == 2
@@ -0,0 +1,46 @@
+"""
+Tests for the latency histograms, /metrics rendering and the Server-Timing middleware.
+Run this with: python3 -m pytest backend/test_metrics.py
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.metrics import Histogram, MetricsMiddleware, REQUEST_LATENCY, render_metrics, stage
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("demo_seconds", "Demo", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5.0, "a")
+
+    lines = histogram.render()
+    assert 'demo_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{stage="a"} 3' in lines
+
+def test_middleware_adds_server_timing_and_route_labels():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: str):
+        # Sync routes run in the threadpool; their stages still reach the header
+        with stage("test.lookup"):
+            pass
+        with stage("test.lookup"):
+            pass
+        return {"id": item_id}
+
+    client = TestClient(app)
+    response = client.get("/items/42")
+
+    timing = response.headers["server-timing"]
+    assert 'test.lookup;dur=' in timing and 'desc="2x"' in timing
+    assert timing.split(", ")[-1].startswith("total;dur=")
+    # Labelled by route template, not by the concrete path
+    assert REQUEST_LATENCY.snapshot()[("GET", "/items/{item_id}", "200")][2] == 1
+
+    client.get("/missing")
+    assert ("GET", "unmatched", "404") in REQUEST_LATENCY.snapshot()
+    assert 'stage_duration_seconds_count{stage="test.lookup"}' in render_metrics()
@@ -0,0 +1,53 @@
+"""
+Tests for multi-threaded blocked scoring.
+Run this with: python3 -m pytest backend/test_parallel_search.py
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from backend.services import S3Service, VectorService
+from backend.similarity import blocked_top_k, parallel_top_k
+from backend.storage import MemoryStorageBackend
+
+def test_parallel_top_k_matches_the_sequential_scorer():
+    rng = np.random.default_rng(3)
+    matrix = rng.standard_normal((5000, 32)).astype(np.float32)
+    query = rng.standard_normal(32).astype(np.float32)
+    sizes = rng.integers(1, 4, size=2000)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rows = int(sizes.sum())
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for workers in (1, 3, 4):
+            top, scores = parallel_top_k(matrix, query, 10, pool, workers, block_rows=100)
+            expected_top, expected_scores = blocked_top_k(matrix, query, 10, block_rows=5000)
+            assert top == expected_top and scores == pytest.approx(expected_scores, abs=1e-5)
+            for aggregation in ("max", "mean"):
+                grouped = parallel_top_k(matrix[:rows], query, 10, pool, workers, 100, starts, aggregation)
+                assert grouped[0] == blocked_top_k(matrix[:rows], query, 10, rows, starts, aggregation)[0]
+        # Fewer rows than k
+        top, _ = parallel_top_k(matrix[:3], query, 10, pool, 4, block_rows=100)
+        assert sorted(top) == [0, 1, 2]
+
+def test_search_uses_the_thread_pool_above_the_row_threshold(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("SEARCH_THREADS", "3")
+    monkeypatch.setenv("SEARCH_PARALLEL_MIN_ROWS", "100")
+    s3_service = S3Service("test-bucket", storage=MemoryStorageBackend())
+    s3_service.put_prompts([{"id": f"p{i}", "title": f"t{i}"} for i in range(500)])
+    vector_service = VectorService(s3_service)
+    rng = np.random.default_rng(8)
+    vector_service.upsert_many({f"p{i}": rng.standard_normal(16) for i in range(500)})
+    query = rng.standard_normal(16)
+    vector_service._get_embedding_rest = lambda text, trace=None: query.tolist()
+
+    trace = {}
+    results = vector_service.search("query", limit=5, trace=trace)
+    assert trace["score_threads"] == 3
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    full = matrix @ (query / np.linalg.norm(query))
+    assert [r["id"] for r in results] == [ids[i] for i in np.argsort(-full)[:5]]
+    assert [r["score"] for r in results] == pytest.approx(sorted(full, reverse=True)[:5], abs=1e-5)
@@ -0,0 +1,51 @@
+"""
+Tests for the admin-triggered request profiler.
+Run this with: python3 -m pytest backend/test_profiling.py
+"""
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.profiling import ProfilingMiddleware, get_recent_profile
+
+def busy_scoring_loop(seconds: float) -> int:
+    total, deadline = 0, time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+def make_client(saved):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, on_report=lambda pid, report: saved.update({pid: report}))
+
+    @app.get("/slow")
+    def slow():
+        # Sync route: runs in the threadpool, not on the middleware's thread
+        return {"total": busy_scoring_loop(0.1)}
+
+    return TestClient(app)
+
+def test_requests_without_admin_secret_are_not_profiled(monkeypatch):
+    monkeypatch.setenv("ADMIN_SECRET_KEY", "s3cret")
+    saved = {}
+    client = make_client(saved)
+
+    assert "x-profile-id" not in client.get("/slow").headers
+    assert "x-profile-id" not in client.get("/slow", headers={"X-Profile": "1", "X-Admin-Secret": "wrong"}).headers
+    assert saved == {}
+
+def test_admin_request_is_sampled_in_the_worker_thread(monkeypatch):
+    monkeypatch.setenv("ADMIN_SECRET_KEY", "s3cret")
+    saved = {}
+    client = make_client(saved)
+
+    response = client.get("/slow", headers={"X-Profile": "1", "X-Admin-Secret": "s3cret"})
+    profile_id = response.headers["x-profile-id"]
+
+    report = get_recent_profile(profile_id)
+    assert saved[profile_id] is report
+    assert report["path"] == "/slow" and report["status"] == 200
+    assert report["stack_samples"] > 0
+    assert any("busy_scoring_loop" in row["function"] for row in report["top_cumulative"])
+    assert "busy_scoring_loop" in report["collapsed"]
@@ -0,0 +1,115 @@
+"""
+Tests for the reduced-dimension primary index with full-dimension re-ranking.
+Run this with: python3 -m pytest backend/test_reduced_index.py
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from backend.services import S3Service, VectorService
+from backend.storage import LocalStorageBackend, MemoryStorageBackend
+
+def make_vectors(rng, count, dim=128):
+    # Like Matryoshka embeddings: the leading dimensions carry most of the signal
+    return rng.standard_normal((count, dim)) * np.exp(-np.arange(dim) / 24.0)
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("EMBEDDING_RERANK_CANDIDATES", "20")
+    return monkeypatch
+
+def exact_top(vector_service, query, limit):
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    prompt_ids, scores = ids, matrix @ (query / np.linalg.norm(query))
+    groups = vector_service._row_groups(ids, None)
+    if groups is not None:
+        prompt_ids = groups[1]
+        scores = np.maximum.reduceat(scores, groups[0])
+    order = np.argsort(-scores)[:limit]
+    return [prompt_ids[i] for i in order], scores[order]
+
+def never_download_full_vectors(monkeypatch, storage):
+    """Fails the test if vectors.npy is fetched whole; range reads are counted."""
+    ranges = []
+    for name in ("get", "get_if_changed", "download_to"):
+        original = getattr(storage, name)
+
+        def guarded(key, *args, _original=original, **kwargs):
+            assert key != "embeddings/vectors.npy", "the full matrix was downloaded"
+            return _original(key, *args, **kwargs)
+        monkeypatch.setattr(storage, name, guarded)
+    original_range = storage.get_range
+
+    def get_range(key, start, end, etag=None):
+        ranges.append((key, end - start))
+        return original_range(key, start, end, etag)
+    monkeypatch.setattr(storage, "get_range", get_range)
+    return ranges
+
+def test_search_loads_only_the_reduced_matrix(env, tmp_path):
+    env.setenv("EMBEDDING_INDEX_DIM", "32")
+    storage = LocalStorageBackend(str(tmp_path))
+    s3_service = S3Service("test-bucket", storage=storage)
+    s3_service.put_prompts([{"id": f"p{i}", "title": f"t{i}"} for i in range(3000)])
+    rng = np.random.default_rng(6)
+    vectors = make_vectors(rng, 3000)
+    # p0 has three chunk rows
+    VectorService(s3_service).upsert_many({**{f"p{i}": vectors[i] for i in range(1, 3000)},
+                                           "p0": make_vectors(rng, 3)})
+
+    stored = json.loads(storage.get("embeddings/index.json")[0])
+    assert stored["index_dim"] == 32 and stored["full_dim"] == 128 and stored["rows"] == 3002
+    assert stored["vectors_etag"] == storage.head("embeddings/vectors.npy")
+    assert stored["index_etag"] == storage.head("embeddings/vectors_32.npy")
+
+    # A reader without EMBEDDING_INDEX_DIM uses the stored index
+    env.delenv("EMBEDDING_INDEX_DIM")
+    reader = VectorService(s3_service)
+    queries = [vectors[17] + 0.1 * make_vectors(rng, 1)[0], vectors[200]]
+    searches = []
+    with pytest.MonkeyPatch.context() as patch:
+        ranges = never_download_full_vectors(patch, storage)
+        for query in queries:
+            reader._get_embedding_rest = lambda text, trace=None, query=query: query.tolist()
+            trace = {}
+            searches.append((reader.search("query", limit=5, trace=trace), trace))
+    # Only the header and runs around the candidates' rows of vectors.npy were read
+    assert sum(size for _, size in ranges) < 0.5 * os.path.getsize(tmp_path / "embeddings" / "vectors.npy")
+
+    for query, (results, trace) in zip(queries, searches):
+        assert trace["index_dim"] == 32 and trace["rerank_rows"] <= 22
+        assert trace["matrix_bytes"] == 3002 * 32 * 4
+        expected_ids, expected_scores = exact_top(VectorService(s3_service), query, 5)
+        assert [r["id"] for r in results] == expected_ids
+        assert [r["score"] for r in results] == pytest.approx(list(expected_scores), abs=1e-5)
+
+def test_a_stale_index_falls_back_to_the_full_vectors(env):
+    storage = MemoryStorageBackend()
+    s3_service = S3Service("test-bucket", storage=storage)
+    s3_service.put_prompts([{"id": f"p{i}", "title": f"t{i}"} for i in range(60)])
+    rng = np.random.default_rng(9)
+    vectors = make_vectors(rng, 60)
+    env.setenv("EMBEDDING_INDEX_DIM", "16")
+    VectorService(s3_service).upsert_many({f"p{i}": vectors[i] for i in range(50)})
+
+    # A writer without the setting adds vectors; index.json still names the old vectors.npy
+    env.delenv("EMBEDDING_INDEX_DIM")
+    VectorService(s3_service).upsert_many({f"p{i}": vectors[i] for i in range(50, 60)})
+
+    reader = VectorService(s3_service)
+    reader._get_embedding_rest = lambda text, trace=None: vectors[55].tolist()
+    for _ in range(2):
+        trace = {}
+        results = reader.search("query", limit=3, trace=trace)
+        assert "index_dim" not in trace
+        assert results[0]["id"] == "p55"
+    assert reader._index_state[1]["stale"]
+
+    # EMBEDDING_INDEX_DIM=0 ignores a stored index
+    env.setenv("EMBEDDING_INDEX_DIM", "0")
+    assert VectorService(s3_service)._load_index() is None
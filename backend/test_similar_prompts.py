@@ -0,0 +1,66 @@
+"""
+Tests for blocked neighbour lists and the "similar prompts" lookup.
+Run this with: python3 -m pytest backend/test_similar_prompts.py
+"""
+import numpy as np
+import pytest
+
+from backend.services import S3Service, VectorService
+from backend.similar_prompts import NEIGHBOURS_KEY, SimilarPrompts
+from backend.similarity import similarity_blocks, top_k_per_row
+from backend.storage import MemoryStorageBackend
+
+@pytest.fixture
+def vector_service(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    vector_service = VectorService(S3Service("test-bucket", storage=MemoryStorageBackend()))
+    rng = np.random.default_rng(3)
+    vector_service.upsert_many({f"p{i}": rng.standard_normal(16) for i in range(40)})
+    # Never embed in these tests
+    vector_service._get_embedding_rest = None
+    return vector_service
+
+def brute_force(vector_service, prompt_id, k):
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    scores = matrix @ matrix[ids.index(prompt_id)]
+    scores[ids.index(prompt_id)] = -np.inf
+    return [ids[j] for j in np.argsort(-scores)[:k]]
+
+def test_blocks_cover_every_row_without_self_matches():
+    matrix = np.eye(10, dtype=np.float32)
+    starts = []
+    for start, scores in similarity_blocks(matrix, max_block_bytes=3 * 10 * 4):
+        starts.append(start)
+        assert scores.shape[0] <= 3
+        assert np.all(np.isneginf(scores[np.arange(scores.shape[0]), np.arange(start, start + scores.shape[0])]))
+    assert starts == [0, 3, 6, 9]
+    top, values = top_k_per_row(np.array([[0.1, 0.9, 0.5]]), 2)
+    assert top.tolist() == [[1, 2]] and values.tolist() == [[0.9, 0.5]]
+
+def test_precomputed_lists_match_brute_force(vector_service):
+    similar = SimilarPrompts(lambda: vector_service, k=5, max_block_bytes=7 * 40 * 4)
+    etag = similar.refresh()
+    assert etag is not None
+    for prompt_id in ("p0", "p17", "p39"):
+        assert [pid for pid, _ in similar.similar(prompt_id, 5)] == brute_force(vector_service, prompt_id, 5)
+
+    # A fresh instance adopts the saved lists instead of rebuilding
+    fresh = SimilarPrompts(lambda: vector_service, k=5)
+    fresh.build = None
+    assert fresh.similar("p17", 3) == similar.similar("p17", 3)
+    assert vector_service.storage.get(NEIGHBOURS_KEY) is not None
+    assert fresh.similar("missing") is None
+
+def test_changed_vectors_are_scored_directly_until_rebuilt(vector_service):
+    similar = SimilarPrompts(lambda: vector_service, k=5)
+    similar.refresh()
+    # p40 is a copy of p3, so it must be p3's nearest neighbour straight away
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    vector_service.upsert_many({"p40": matrix[ids.index("p3")]})
+    assert similar.similar("p3", 1)[0][0] == "p40"
+
+    similar._rebuild.result(timeout=5)
+    assert similar._index[0] == vector_service._load_all_embeddings()[2]
+    assert similar.similar("p40", 1)[0][0] == "p3"
@@ -0,0 +1,91 @@
+"""
+Tests for server-side single-flight deduplication.
+Run this with: python3 -m pytest backend/test_single_flight.py
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.services import S3Service
+from backend.single_flight import SingleFlight
+from backend.storage import MemoryStorageBackend
+
+def slow_counter():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"value": 42}
+    return calls, fn
+
+def test_threads_and_tasks_share_one_call():
+    flight = SingleFlight("test")
+    calls, fn = slow_counter()
+
+    async def tasks():
+        return await asyncio.gather(*(flight.do_async("k", fn) for _ in range(5)))
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        thread_results = [pool.submit(flight.do, "k", fn) for _ in range(5)]
+        time.sleep(0.05)
+        task_results = asyncio.run(tasks())
+        thread_results = [f.result() for f in thread_results]
+
+    assert len(calls) == 1
+    results = thread_results + task_results
+    assert all(result == {"value": 42} for result, _ in results)
+    assert sum(1 for _, shared in results if not shared) == 1
+
+    # Nothing is cached once the call completes
+    flight.do("k", fn)
+    assert len(calls) == 2
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight("test")
+
+    def boom():
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    errors = []
+    def call():
+        try:
+            flight.do("k", boom)
+        except ValueError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(errors) == 4
+
+class SlowListing(MemoryStorageBackend):
+    def __init__(self):
+        super().__init__()
+        self.crawls = 0
+
+    def list_keys(self, prefix):
+        if prefix == "prompts/":
+            self.crawls += 1
+            time.sleep(0.1)
+        return super().list_keys(prefix)
+
+def test_concurrent_catalog_loads_share_one_crawl(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    storage = SlowListing()
+    s3_service = S3Service("test-bucket", storage=storage)
+    s3_service.put_prompts([{"id": f"p{i}", "title": "t"} for i in range(3)])
+    s3_service._catalog = None
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: s3_service.list_prompts(), range(8)))
+
+    assert storage.crawls == 1
+    assert all(len(r) == 3 for r in results)
+    # Each caller gets its own dicts
+    results[0][0]["user_context"] = {}
+    assert "user_context" not in results[1][0]
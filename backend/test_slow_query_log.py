@@ -0,0 +1,39 @@
+"""
+Tests for the /search slow-query log.
+Run this with: python3 -m pytest backend/test_slow_query_log.py
+"""
+import json
+
+from backend.slow_query_log import SlowQueryLog, LOG_PREFIX
+from backend.storage import MemoryStorageBackend
+
+TRACE = {"fallback": None, "gemini.embed": 900.0, "vectors.load": 250.0, "matrix_rows": 10000,
+         "matrix_bytes": 30720000, "numpy.score": 4.0, "search.hydrate": 60.0}
+
+def test_only_slow_queries_are_kept_and_worst_first():
+    log = SlowQueryLog(threshold_ms=500, capacity=3, flush=False)
+    assert log.record("fast", 20.0, TRACE, 5) is None
+
+    for total in (600.0, 1500.0, 800.0, 2000.0):
+        log.record(f"query {total}", total, TRACE, 5)
+
+    worst = log.worst(10)
+    # Ring buffer of 3 dropped the oldest (600ms) entry
+    assert [e["total_ms"] for e in worst] == [2000.0, 1500.0, 800.0]
+    assert worst[0]["embedding_ms"] == 900.0 and worst[0]["matrix_rows"] == 10000
+    assert worst[0]["query_length"] == len("query 2000.0") and worst[0]["fallback"] is False
+
+def test_entries_are_flushed_to_storage_as_jsonl():
+    storage = MemoryStorageBackend()
+    log = SlowQueryLog(lambda: storage, threshold_ms=0, flush=True, flush_batch=2)
+
+    log.record("a", 10.0, {"fallback": "no_embedding", "search.lexical": 8.0}, 1)
+    assert list(storage.list_keys(LOG_PREFIX)) == []
+    log.record("b", 20.0, TRACE, 2)
+
+    keys = list(storage.list_keys(LOG_PREFIX))
+    assert len(keys) == 1 and keys[0].endswith(".jsonl")
+    lines = storage.get(keys[0])[0].decode("utf-8").splitlines()
+    assert [json.loads(line)["query"] for line in lines] == ["a", "b"]
+    assert json.loads(lines[0])["fallback_reason"] == "no_embedding"
+    assert {e["query"] for e in log.load_flushed()} == {"a", "b"}
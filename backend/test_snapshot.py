@@ -0,0 +1,44 @@
+"""
+Tests for the /tmp snapshot store.
+Run this with: python3 -m pytest backend/test_snapshot.py
+"""
+import json
+import tempfile
+
+import numpy as np
+
+from backend.snapshot import SnapshotStore
+
+def test_round_trip_memory_maps_arrays():
+    """Sections come back intact and arrays are memory-mapped"""
+    store = SnapshotStore("vectors", directory=tempfile.mkdtemp())
+    matrix = np.random.rand(5, 768).astype(np.float32)
+    ids = [f"id-{i}" for i in range(5)]
+
+    assert store.save('"etag-1"', {"ids": json.dumps(ids).encode("utf-8"), "matrix": matrix})
+
+    snapshot = store.load()
+    assert snapshot.validator == '"etag-1"'
+    assert json.loads(snapshot.sections["ids"]) == ids
+    assert isinstance(snapshot.sections["matrix"], np.memmap)
+    assert np.array_equal(snapshot.sections["matrix"], matrix)
+
+def test_corrupt_snapshot_is_discarded():
+    """A checksum mismatch discards the file so the caller rebuilds from S3"""
+    store = SnapshotStore("catalog", directory=tempfile.mkdtemp())
+    store.save('"etag-1"', {"catalog": b'[{"id": "dummy-1"}]'})
+
+    with open(store.path, "r+b") as f:
+        f.seek(-3, 2)
+        f.write(b"XXX")
+
+    assert store.load() is None
+    assert store.load() is None  # file was removed
+
+def test_size_cap():
+    """Snapshots larger than the cap are not written"""
+    store = SnapshotStore("vectors", directory=tempfile.mkdtemp(), max_bytes=4096)
+    matrix = np.zeros((10, 768), dtype=np.float32)
+
+    assert not store.save('"etag-1"', {"matrix": matrix})
+    assert store.load() is None
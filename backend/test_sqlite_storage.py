@@ -0,0 +1,65 @@
+"""
+Tests for the SQLite storage backend and the migration tool.
+Run this with: python3 -m pytest backend/test_sqlite_storage.py
+"""
+import json
+import os
+import tempfile
+
+import pytest
+
+from backend.storage import MemoryStorageBackend, PreconditionFailed
+from backend.sqlite_storage import SQLiteStorageBackend
+from backend.migrate_to_sqlite import migrate
+
+def make_prompt(prompt_id, title, tools, created_at):
+    return {
+        "id": prompt_id, "title": title, "description": f"{title} description",
+        "prompt_text": f"Please {title.lower()}", "tool_used": tools, "tags": [],
+        "owner_email": "a@pega.com", "upvotes": 0, "upvoted_by": [], "created_at": created_at,
+    }
+
+@pytest.fixture
+def storage():
+    return SQLiteStorageBackend(os.path.join(tempfile.mkdtemp(), "prompts.db"))
+
+def test_prompt_queries_and_fts(storage):
+    """Prompts written through the object interface are indexed for listing and search"""
+    storage.put("prompts/p1.json", json.dumps(make_prompt("p1", "Summarize meeting notes", ["ChatGPT"], "2024-01-01")))
+    storage.put("prompts/p2.json", json.dumps(make_prompt("p2", "Refactor Python code", ["Cursor", "chatgpt"], "2024-01-02")))
+
+    assert [p["id"] for p in storage.query_prompts()] == ["p2", "p1"]
+    assert [p["id"] for p in storage.query_prompts(tool="ChatGPT")] == ["p2", "p1"]
+    assert [p["id"] for p in storage.search_text("meeting")] == ["p1"]
+    assert json.loads(storage.get("prompts/p1.json")[0])["title"] == "Summarize meeting notes"
+
+    assert storage.delete("prompts/p1.json")
+    assert storage.search_text("meeting") == []
+
+def test_upvotes_and_favorites_are_transactional(storage):
+    storage.put("prompts/p1.json", json.dumps(make_prompt("p1", "Draft email", ["Claude"], "2024-01-01")))
+    assert storage.add_upvote("p1", "a@pega.com") == 1
+    with pytest.raises(ValueError):
+        storage.add_upvote("p1", "a@pega.com")
+    assert storage.remove_upvote("p1", "a@pega.com") == 0
+
+    storage.add_favorite("a@pega.com", "p1")
+    assert storage.get_favorites("a@pega.com") == ["p1"]
+
+    etag = storage.head("prompts/p1.json")
+    storage.put("prompts/p1.json", json.dumps(make_prompt("p1", "Draft reply", ["Claude"], "2024-01-01")), if_match=etag)
+    with pytest.raises(PreconditionFailed):
+        storage.put("prompts/p1.json", b"{}", if_match=etag)
+
+def test_migration_copies_bucket_layout(storage):
+    source = MemoryStorageBackend()
+    source.put("prompts/p1.json", json.dumps(make_prompt("p1", "Draft email", ["Claude"], "2024-01-01")))
+    source.put("users/a@pega.com/favorites.json", b'["p1"]')
+    source.put("embeddings/ids.json", b'["p1"]')
+    source.put("catalog/manifest.json", b'{}')
+
+    counts = migrate(source, storage)
+
+    assert counts == {"prompts/": 1, "users/": 1, "embeddings/": 1}
+    assert storage.get_favorites("a@pega.com") == ["p1"]
+    assert storage.get("embeddings/ids.json")[0] == b'["p1"]'
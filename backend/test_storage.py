@@ -0,0 +1,57 @@
+"""
+Tests for the local-disk and in-memory storage backends.
+Run this with: python3 -m pytest backend/test_storage.py
+"""
+import os
+import tempfile
+
+import pytest
+
+from backend.storage import LocalStorageBackend, MemoryStorageBackend, PreconditionFailed, NOT_MODIFIED
+
+def make_backends():
+    return [LocalStorageBackend(tempfile.mkdtemp()), MemoryStorageBackend()]
+
+@pytest.mark.parametrize("storage", make_backends(), ids=lambda b: b.name)
+def test_round_trip_and_listing(storage):
+    """Objects keep the S3 key layout and can be listed by prefix"""
+    etag = storage.put("prompts/dummy-1.json", '{"id": "dummy-1"}')
+    storage.put("prompts/dummy-2.json", b'{"id": "dummy-2"}')
+    storage.put("users/a@pega.com/favorites.json", b'["dummy-1"]')
+
+    body, read_etag = storage.get("prompts/dummy-1.json")
+    assert body == b'{"id": "dummy-1"}'
+    assert read_etag == etag == storage.head("prompts/dummy-1.json")
+    assert list(storage.list_keys("prompts/")) == ["prompts/dummy-1.json", "prompts/dummy-2.json"]
+
+    assert storage.delete("prompts/dummy-1.json")
+    assert storage.get("prompts/dummy-1.json") is None
+    assert storage.head("prompts/dummy-1.json") is None
+
+@pytest.mark.parametrize("storage", make_backends(), ids=lambda b: b.name)
+def test_conditional_operations(storage):
+    """If-Match writes and If-None-Match reads behave like S3"""
+    etag = storage.put("embeddings/vectors.npy", b"v1", content_type="application/octet-stream")
+    assert storage.get_if_changed("embeddings/vectors.npy", etag) is NOT_MODIFIED
+
+    new_etag = storage.put("embeddings/vectors.npy", b"v2-longer", if_match=etag)
+    with pytest.raises(PreconditionFailed):
+        storage.put("embeddings/vectors.npy", b"v3", if_match=etag)
+
+    assert storage.get_if_changed("embeddings/vectors.npy", etag) == (b"v2-longer", new_etag)
+
+    # Conditional range reads
+    assert storage.get_range("embeddings/vectors.npy", 3, 7, new_etag) == b"long"
+    with pytest.raises(PreconditionFailed):
+        storage.get_range("embeddings/vectors.npy", 0, 2, etag)
+    assert storage.get_range("embeddings/missing.npy", 0, 2) is None
+
+def test_local_writes_are_atomic_renames():
+    """No temp files are left behind and keys cannot escape the root"""
+    root = tempfile.mkdtemp()
+    storage = LocalStorageBackend(root)
+    storage.put("prompts/dummy-1.json", b"{}")
+
+    assert os.listdir(os.path.join(root, "prompts")) == ["dummy-1.json"]
+    with pytest.raises(ValueError):
+        storage.put("../outside.json", b"{}")
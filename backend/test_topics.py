@@ -0,0 +1,69 @@
+"""
+Tests for topic clusters.
+Run this with: python3 -m pytest backend/test_topics.py
+"""
+import numpy as np
+import pytest
+
+from backend import topics as topics_module
+from backend.services import S3Service, VectorService
+from backend.storage import MemoryStorageBackend
+from backend.topics import TopicIndex
+
+GROUP_TAGS = [["sql", "data"], ["email", "writing"], ["python", "testing"]]
+
+@pytest.fixture
+def services(monkeypatch):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    s3_service = S3Service("test-bucket", storage=MemoryStorageBackend())
+    vector_service = VectorService(s3_service)
+    rng = np.random.default_rng(11)
+    centres = rng.standard_normal((3, 32)) * 5
+    prompts, vectors = [], {}
+    for i in range(60):
+        group = i % 3
+        # "prompt" is on every prompt, so it is too generic to label a topic
+        prompts.append({"id": f"p{i}", "title": f"prompt {i}", "tags": GROUP_TAGS[group] + ["prompt"]})
+        vectors[f"p{i}"] = centres[group] + rng.standard_normal(32)
+    s3_service.put_prompts(prompts)
+    vector_service.upsert_many(vectors)
+    return s3_service, vector_service, centres
+
+def test_kmeans_recovers_the_groups_and_labels_them_from_tags(services):
+    s3_service, vector_service, _ = services
+    index = TopicIndex(lambda: vector_service, lambda: s3_service)
+    summary = index.rebuild(k=3)
+    assert summary["topics"] == 3 and summary["prompts"] == 60
+
+    topics = index.topics()["topics"]
+    assert sorted(t["size"] for t in topics) == [20, 20, 20]
+    assert sorted(t["label"] for t in topics) == ["email / writing", "python / testing", "sql / data"]
+    for topic in topics:
+        members = index.topic(topic["id"])["prompt_ids"]
+        assert len({int(pid[1:]) % 3 for pid in members}) == 1
+    assert index.topic(99) is None
+
+def test_new_prompts_join_the_nearest_topic_without_retraining(services, monkeypatch):
+    s3_service, vector_service, centres = services
+    TopicIndex(lambda: vector_service, lambda: s3_service).rebuild(k=3)
+
+    # Another instance reads the saved model and must not run k-means again
+    monkeypatch.setattr(topics_module, "mini_batch_kmeans", None)
+    index = TopicIndex(lambda: vector_service, lambda: s3_service)
+    s3_service.put_prompts([{"id": "new", "title": "new", "tags": ["sql"]}])
+    vector_service.upsert_many({"new": centres[0]})
+
+    storage = vector_service.storage
+    saved = {key: storage.head(key) for key in ("topics/model.json", "topics/centroids.npy")}
+    sql_topic = next(t for t in index.topics()["topics"] if t["label"] == "sql / data")
+    assert sql_topic["size"] == 21
+    assert "new" in index.topic(sql_topic["id"])["prompt_ids"]
+
+    # Deleted prompts drop out; only the new rows are scored, and reads never write the model
+    vector_service.delete_point("p0")
+    topics = index.topics()["topics"]
+    members = [pid for t in topics for pid in index.topic(t["id"])["prompt_ids"]]
+    assert sum(t["size"] for t in topics) == len(members) == 60 and "p0" not in members
+    assert {key: storage.head(key) for key in saved} == saved
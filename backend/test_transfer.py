@@ -0,0 +1,78 @@
+"""
+Tests for the NDJSON export and bulk import.
+Run this with: python3 -m pytest backend/test_transfer.py
+"""
+import json
+
+import numpy as np
+import pytest
+
+from backend.services import S3Service, VectorService
+from backend.storage import MemoryStorageBackend
+from backend.testing import CountingPuts
+from backend.transfer import BulkImporter, export_lines
+
+def make_services(storage):
+    s3_service = S3Service("test-bucket", storage=storage)
+    return s3_service, VectorService(s3_service)
+
+@pytest.fixture(autouse=True)
+def no_gemini_key(real_mode):
+    real_mode.delenv("GEMINI_API_KEY")
+
+def test_export_then_import_round_trips_prompts_and_vectors():
+    source_s3, source_vectors = make_services(MemoryStorageBackend())
+    rng = np.random.default_rng(0)
+    prompts = [{"id": f"p{i}", "title": f"Prompt {i}", "prompt_text": "text", "tags": []} for i in range(5)]
+    source_s3.put_prompts(prompts)
+    source_vectors.upsert_many({p["id"]: rng.standard_normal(768) for p in prompts})
+
+    lines = list(export_lines(source_s3, source_vectors, include_vectors=True))
+    assert json.loads(lines[0])["type"] == "meta"
+    assert len(lines) == 6
+
+    storage = CountingPuts()
+    s3_service, vector_service = make_services(storage)
+    importer = BulkImporter(s3_service, vector_service, batch_size=2)
+    for line in lines:
+        if importer.add_line(line):
+            importer.flush_batch()
+    summary = importer.finish()
+
+    assert summary["imported"] == 5 and summary["vectors_written"] == 5 and summary["error_count"] == 0
+    # Every vector is committed in one write
+    assert storage.puts.count("embeddings/vectors.npy") == 1
+    assert sorted(p["id"] for p in s3_service.list_prompts()) == [p["id"] for p in prompts]
+
+    src_ids, src_matrix, _ = source_vectors._load_all_embeddings()
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    order = [ids.index(pid) for pid in src_ids]
+    assert np.allclose(matrix[order], src_matrix, atol=1e-6)
+
+def test_import_reports_bad_lines_and_keeps_going():
+    s3_service, vector_service = make_services(MemoryStorageBackend())
+    importer = BulkImporter(s3_service, vector_service, embed=False)
+    for line in [b'{"title": "ok", "prompt_text": "x"}', b"not json", b'{"title": "no text"}', b""]:
+        importer.add_line(line)
+    summary = importer.finish()
+
+    assert summary["imported"] == 1
+    assert summary["status"] == "partial"
+    assert [e["line"] for e in summary["errors"]] == [2, 3]
+
+def test_import_normalises_null_tags_and_rejects_malformed_ones():
+    s3_service, vector_service = make_services(MemoryStorageBackend())
+    vector_service._get_embeddings_batch = lambda texts, trace=None: [[0.1] * 768 for _ in texts]
+    importer = BulkImporter(s3_service, vector_service)
+    importer.embed = True
+    for line in [b'{"id": "a", "title": "t", "prompt_text": "x", "tags": null, "tool_used": null}',
+                 b'{"id": "b", "title": "t", "prompt_text": "x", "tags": "one,two"}',
+                 b'{"id": "c", "title": "t", "prompt_text": "x", "tags": [1, 2]}',
+                 b'{"id": "d", "title": "t", "prompt_text": "x", "tool_used": "ChatGPT"}']:
+        importer.add_line(line)
+    summary = importer.finish()
+
+    assert summary["imported"] == 2 and summary["embedded"] == 2
+    assert [(e["line"], e["id"]) for e in summary["errors"]] == [(2, "b"), (3, "c")]
+    stored = {p["id"]: p for p in s3_service.list_prompts()}
+    assert stored["a"]["tags"] == [] and stored["a"]["tool_used"] == []
@@ -0,0 +1,88 @@
+"""
+Tests for the memory-mapped local vector shard and blocked top-k scoring.
+Run this with: python3 -m pytest backend/test_vector_shard.py
+"""
+import os
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from backend.services import S3Service, VectorService
+from backend.similarity import blocked_top_k
+from backend.storage import MemoryStorageBackend
+
+def test_blocked_top_k_matches_a_full_sort():
+    rng = np.random.default_rng(1)
+    matrix = rng.standard_normal((1000, 16)).astype(np.float32)
+    query = rng.standard_normal(16).astype(np.float32)
+    full = matrix @ query
+    top, scores = blocked_top_k(matrix, query, 7, block_rows=64)
+    assert top == list(np.argsort(-full)[:7])
+    assert scores == pytest.approx(sorted(full, reverse=True)[:7])
+
+    # Groups of 1-4 rows; blocks must not split them
+    sizes = rng.integers(1, 5, size=300)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rows = int(sizes.sum())
+    grouped = np.maximum.reduceat(full[:rows], starts)
+    top, scores = blocked_top_k(matrix[:rows], query, 5, block_rows=50, starts=starts)
+    assert top == list(np.argsort(-grouped)[:5])
+    mean = np.add.reduceat(full[:rows], starts) / sizes
+    top, _ = blocked_top_k(matrix[:rows], query, 5, block_rows=50, starts=starts, aggregation="mean")
+    assert top == list(np.argsort(-mean)[:5])
+
+@pytest.fixture
+def shard_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("MOCK_MODE", "false")
+    monkeypatch.setenv("SNAPSHOT_ENABLED", "false")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("VECTOR_SHARD_DIR", str(tmp_path))
+    monkeypatch.setenv("VECTOR_SHARD_BLOCK_ROWS", "256")
+    return tmp_path
+
+def test_search_reads_the_memory_mapped_shard(shard_env, monkeypatch):
+    storage = MemoryStorageBackend()
+    s3_service = S3Service("test-bucket", storage=storage)
+    s3_service.put_prompts([{"id": f"p{i}", "title": f"t{i}"} for i in range(2000)])
+    vector_service = VectorService(s3_service)
+    rng = np.random.default_rng(2)
+    vector_service.upsert_many({f"p{i}": rng.standard_normal(256) for i in range(2000)})
+    query = rng.standard_normal(256)
+
+    # A new process opens the shard from disk; the store is unchanged, so nothing is downloaded
+    fresh = VectorService(s3_service)
+    with monkeypatch.context() as m:
+        m.setattr(storage, "get", lambda key: pytest.fail(f"unexpected GET {key}"))
+        ids, matrix, _ = fresh._load_all_embeddings()
+    assert isinstance(matrix, np.memmap) and len(ids) == 2000
+
+    fresh._get_embedding_rest = lambda text, trace=None: query.tolist()
+    results = fresh.search("query", limit=5)
+    full = np.asarray(matrix) @ (query / np.linalg.norm(query))
+    assert [r["id"] for r in results] == [ids[i] for i in np.argsort(-full)[:5]]
+
+def test_download_and_scoring_never_hold_the_matrix(shard_env, monkeypatch):
+    storage = MemoryStorageBackend()
+    writer = VectorService(S3Service("test-bucket", storage=storage))
+    rng = np.random.default_rng(4)
+    writer.upsert_many({f"p{i}": rng.standard_normal(256) for i in range(2000)})
+
+    monkeypatch.setenv("VECTOR_SHARD_DIR", str(shard_env / "other-instance"))
+    reader = VectorService(S3Service("test-bucket", storage=storage))
+    tracemalloc.start()
+    ids, matrix, _ = reader._load_all_embeddings()
+    blocked_top_k(matrix, rng.standard_normal(256).astype(np.float32), 5, reader.shard_block_rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert isinstance(matrix, np.memmap) and len(ids) == 2000
+    assert peak < matrix.nbytes / 2
+
+def test_updates_replace_the_shard_file(shard_env):
+    vector_service = VectorService(S3Service("test-bucket", storage=MemoryStorageBackend()))
+    vector_service.upsert_many({"a": np.ones(8)})
+    vector_service.upsert_many({"b": np.ones(8)})
+    shards = [name for name in os.listdir(shard_env) if name.startswith("vectors-")]
+    assert len(shards) == 1
+    ids, matrix, _ = vector_service._load_all_embeddings()
+    assert ids == ["a", "b"] and isinstance(matrix, np.memmap)
@@ -0,0 +1,15 @@
+"""
+Helpers shared by the backend tests (fixtures live in conftest.py).
+"""
+from backend.storage import MemoryStorageBackend
+
+class CountingPuts(MemoryStorageBackend):
+    """In-memory storage that records the key of every put."""
+
+    def __init__(self):
+        super().__init__()
+        self.puts = []
+
+    def put(self, key, body, **kwargs):
+        self.puts.append(key)
+        return super().put(key, body, **kwargs)
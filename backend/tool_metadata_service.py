@@ -1,13 +1,17 @@
+import copy
 import json
 import os
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
+from .single_flight import SingleFlight
 
 class ToolMetadataService:
     def __init__(self, s3_service):
         self.s3_service = s3_service
         self.mock_mode = os.environ.get("MOCK_MODE", "false").lower() == "true"
+        # A page load fires one stats request per tool card; identical ones share the work
+        self._stats_flight = SingleFlight("tool_statistics")
         
         # Load tools metadata from the frontend tools.json structure
         self._tools_metadata = self._load_tools_metadata()
@@ -333,8 +337,10 @@ class ToolMetadataService:
 
     def get_tool_statistics(self, tool_id: str) -> Dict[str, Any]:
         """Calculate usage statistics for a specific tool"""
-        all_prompts = self.s3_service.list_prompts()
-        
+        stats, _ = self._stats_flight.do(tool_id, lambda: self._compute_tool_statistics(tool_id))
+        return copy.deepcopy(stats)
+
+    def _compute_tool_statistics(self, tool_id: str) -> Dict[str, Any]:
         # Find tool metadata
         tool_metadata = self.get_tool_by_id(tool_id)
         if not tool_metadata:
@@ -358,15 +364,7 @@ class ToolMetadataService:
         display_name = tool_metadata["displayName"]
         
         # Filter prompts for this tool
-        tool_prompts = []
-        for prompt in all_prompts:
-            tool_used = prompt.get("tool_used", [])
-            if isinstance(tool_used, str):
-                tool_used = [tool_used]
-            
-            # Check if tool matches by display name (case-insensitive)
-            if any(tool.lower() == display_name.lower() for tool in tool_used):
-                tool_prompts.append(prompt)
+        tool_prompts = self.s3_service.list_prompts_by_tool(display_name)
 
         # Calculate statistics
         prompt_count = len(tool_prompts)
@@ -423,8 +421,6 @@ class ToolMetadataService:
 
     def get_prompts_by_tool(self, tool_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Get all prompts that use a specific tool"""
-        all_prompts = self.s3_service.list_prompts()
-        
         # Find tool metadata
         tool_metadata = self.get_tool_by_id(tool_id)
         if not tool_metadata:
@@ -433,27 +429,8 @@ class ToolMetadataService:
         if not tool_metadata:
             return []
 
-        display_name = tool_metadata["displayName"]
-        
-        # Filter prompts for this tool
-        tool_prompts = []
-        for prompt in all_prompts:
-            tool_used = prompt.get("tool_used", [])
-            if isinstance(tool_used, str):
-                tool_used = [tool_used]
-            
-            # Check if tool matches by display name (case-insensitive)
-            if any(tool.lower() == display_name.lower() for tool in tool_used):
-                tool_prompts.append(prompt)
-
-        # Sort by creation date (newest first)
-        tool_prompts.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-        
-        # Apply limit if specified
-        if limit:
-            tool_prompts = tool_prompts[:limit]
-        
-        return tool_prompts
+        # Filtered, sorted newest first and limited by the storage layer
+        return self.s3_service.list_prompts_by_tool(tool_metadata["displayName"], limit)
 
     def get_categories(self) -> Dict[str, Dict[str, Any]]:
         """Get all tool categories with metadata"""
@@ -0,0 +1,254 @@
+"""
+Browse-by-topic clusters over the stored embeddings.
+
+POST /admin/topics/rebuild runs mini-batch k-means over the stored vectors,
+using cosine similarity with unit centroids. It gives each prompt a topic
+and labels each topic from its most frequent tags. Tags that appear on more
+than half of all prompts are skipped. The model is stored as
+topics/model.json (topics and assignments) plus topics/centroids.npy.
+
+GET /topics and GET /topics/{id}/prompts are lookups in that model. When
+vectors.npy has changed since the model was saved, prompts missing from the
+assignments get their nearest stored centroid and deleted ones are dropped,
+in memory only (no retraining, nothing written). New prompts appear under a
+topic without another k-means run. Only rebuild() writes the model.
+"""
+import io
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import stage
+from .single_flight import SingleFlight
+from .storage import NOT_MODIFIED
+
+MODEL_KEY = "topics/model.json"
+CENTROIDS_KEY = "topics/centroids.npy"
+
+def mini_batch_kmeans(matrix, k: int, batch_size: int = 256, iterations: int = 100, seed: int = 0):
+    """
+    Spherical mini-batch k-means (Sculley, 2010) on unit rows, seeded with
+    k-means++ on a sample. Each centroid moves toward the mean of its batch
+    members with a per-centroid learning rate of 1/count. Returns unit
+    centroids of shape (k, D).
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    k = min(k, n)
+
+    # k-means++: each next seed is drawn with probability ~ squared cosine distance
+    sample = matrix[rng.choice(n, size=min(n, max(batch_size, 20 * k)), replace=False)]
+    centroids = [sample[rng.integers(len(sample))]]
+    distance = np.full(len(sample), np.inf)
+    for _ in range(1, k):
+        distance = np.minimum(distance, 1.0 - sample @ centroids[-1])
+        weights = np.clip(distance, 0, None) ** 2
+        total = weights.sum()
+        choice = rng.choice(len(sample), p=weights / total) if total > 0 else rng.integers(len(sample))
+        centroids.append(sample[choice])
+    centroids = np.array(centroids, dtype=np.float32)
+    counts = np.zeros(k)
+    for _ in range(iterations):
+        batch = matrix[rng.choice(n, size=min(batch_size, n), replace=False)]
+        nearest = np.argmax(batch @ centroids.T, axis=1)
+        members = np.bincount(nearest, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, nearest, batch)
+        counts += members
+        rate = (members / np.maximum(counts, 1))[:, None]
+        centroids = (1 - rate) * centroids + rate * (sums / np.maximum(members, 1)[:, None])
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids = centroids / np.where(norms == 0, 1, norms)
+    return centroids.astype(np.float32)
+
+class TopicIndex:
+    def __init__(self, vector_service_getter: Callable[[], Any], s3_service_getter: Callable[[], Any]):
+        self._vector_service_getter = vector_service_getter
+        self._s3_service_getter = s3_service_getter
+        # (model etag, model dict, centroids)
+        self._model = None
+        # ((model etag, vectors etag), model extended with the prompts added since it was built)
+        self._extended = None
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("topics")
+
+    @property
+    def vector_service(self):
+        return self._vector_service_getter()
+
+    @property
+    def storage(self):
+        return self._vector_service_getter().storage
+
+    def _topic_count(self, n: int) -> int:
+        configured = int(os.environ.get("TOPIC_COUNT", "0"))
+        if configured > 0:
+            return min(configured, n)
+        # About sqrt(n/2) topics when not configured
+        return max(2, min(50, int(round((n / 2) ** 0.5))))
+
+    def _label_topics(self, assignments: Dict[str, int], k: int) -> List[Dict[str, Any]]:
+        """Topic summaries (id, label, top tags, size) from the prompts' tags."""
+        tags_by_id = {p["id"]: [t.strip().lower() for t in (p.get("tags") or []) if t.strip()]
+                      for p in self._s3_service_getter().list_prompts()}
+        document_frequency = Counter(t for tags in tags_by_id.values() for t in set(tags))
+        generic = {t for t, count in document_frequency.items() if count > len(tags_by_id) / 2}
+
+        tag_counts = [Counter() for _ in range(k)]
+        sizes = [0] * k
+        for prompt_id, topic in assignments.items():
+            sizes[topic] += 1
+            tag_counts[topic].update(t for t in tags_by_id.get(prompt_id, []) if t not in generic)
+
+        topics = []
+        for topic in range(k):
+            if sizes[topic] == 0:
+                continue
+            top_tags = [t for t, _ in tag_counts[topic].most_common(5)]
+            topics.append({
+                "id": topic,
+                "label": " / ".join(top_tags[:3]) if top_tags else f"Topic {topic + 1}",
+                "tags": top_tags,
+                "size": sizes[topic],
+            })
+        topics.sort(key=lambda t: -t["size"])
+        return topics
+
+    def _assign(self, ids: List[str], matrix, etag: Optional[str], centroids) -> Dict[str, int]:
+        """Nearest centroid for every prompt."""
+        import numpy as np
+
+        prompt_ids, prompts = self.vector_service._prompt_matrix(ids, matrix, etag)
+        if len(prompt_ids) == 0:
+            return {}
+        nearest = np.argmax(prompts @ centroids.T, axis=1)
+        return {pid: int(topic) for pid, topic in zip(prompt_ids, nearest)}
+
+    def _save(self, model: Dict[str, Any], centroids) -> None:
+        import numpy as np
+
+        buffer = io.BytesIO()
+        np.save(buffer, centroids)
+        self.storage.put(CENTROIDS_KEY, buffer.getvalue(), content_type='application/octet-stream')
+        model_etag = self.storage.put(MODEL_KEY, json.dumps(model))
+        with self._lock:
+            self._model = (model_etag, model, centroids)
+
+    def rebuild(self, k: Optional[int] = None) -> Dict[str, Any]:
+        """Runs k-means over the stored vectors and saves the model. Returns a summary."""
+        vs = self.vector_service
+        if vs.mock_mode:
+            return {"topics": 0, "prompts": 0}
+        ids, matrix, etag = vs._load_all_embeddings()
+        prompt_ids, prompts = vs._prompt_matrix(ids, matrix, etag)
+        if len(prompt_ids) < 2:
+            return {"topics": 0, "prompts": len(prompt_ids)}
+
+        k = min(k, len(prompt_ids)) if k else self._topic_count(len(prompt_ids))
+        with stage("topics.kmeans"):
+            centroids = mini_batch_kmeans(
+                prompts, k,
+                batch_size=int(os.environ.get("TOPIC_BATCH_SIZE", "256")),
+                iterations=int(os.environ.get("TOPIC_ITERATIONS", "100")))
+        assignments = self._assign(ids, matrix, etag, centroids)
+        model = {
+            "built_at": datetime.now().isoformat(),
+            "vectors_etag": etag,
+            "k": int(centroids.shape[0]),
+            "topics": self._label_topics(assignments, centroids.shape[0]),
+            "assignments": assignments,
+        }
+        self._save(model, centroids)
+        print(f"TopicIndex: Built {len(model['topics'])} topics over {len(assignments)} prompts")
+        return {"topics": len(model["topics"]), "prompts": len(assignments), "built_at": model["built_at"]}
+
+    def _load(self):
+        """The stored model, re-read only when topics/model.json changed."""
+        import numpy as np
+
+        with self._lock:
+            cached = self._model
+        obj = self.storage.get_if_changed(MODEL_KEY, cached[0] if cached else None)
+        if obj is NOT_MODIFIED:
+            return cached
+        if obj is None:
+            return None
+        content, model_etag = obj
+        centroids_obj = self.storage.get(CENTROIDS_KEY)
+        if centroids_obj is None:
+            return None
+        loaded = (model_etag, json.loads(content.decode('utf-8')), np.load(io.BytesIO(centroids_obj[0])))
+        with self._lock:
+            self._model = loaded
+        return loaded
+
+    def _extend(self, model: Dict[str, Any], centroids, ids: List[str], matrix, etag: Optional[str]) -> Dict[str, Any]:
+        """
+        The model with prompts added since it was built assigned to their
+        nearest centroid and deleted prompts dropped. Labels are kept, sizes
+        recounted.
+        """
+        import numpy as np
+
+        prompt_ids, prompts = self.vector_service._prompt_matrix(ids, matrix, etag)
+        present = set(prompt_ids)
+        assignments = {pid: topic for pid, topic in model["assignments"].items() if pid in present}
+        missing = [i for i, pid in enumerate(prompt_ids) if pid not in assignments]
+        if missing:
+            nearest = np.argmax(np.asarray(prompts[missing]) @ centroids.T, axis=1)
+            assignments.update({prompt_ids[i]: int(topic) for i, topic in zip(missing, nearest)})
+        sizes = Counter(assignments.values())
+        topics = [dict(t, size=sizes[t["id"]]) for t in model["topics"] if sizes[t["id"]]]
+        topics.sort(key=lambda t: -t["size"])
+        return dict(model, vectors_etag=etag, assignments=assignments, topics=topics)
+
+    def _current_model(self) -> Optional[Dict[str, Any]]:
+        loaded = self._load()
+        if loaded is None:
+            return None
+        model_etag, model, centroids = loaded
+        ids, matrix, etag = self.vector_service._load_all_embeddings()
+        if not etag or etag == model.get("vectors_etag"):
+            return model
+
+        version = (model_etag, etag)
+        with self._lock:
+            extended = self._extended
+        if extended is not None and extended[0] == version:
+            return extended[1]
+
+        def extend():
+            updated = self._extend(model, centroids, ids, matrix, etag)
+            with self._lock:
+                self._extended = (version, updated)
+            return updated
+        # Vectors changed: assign the new prompts, shared by concurrent callers
+        updated, _ = self._flight.do(f"{model_etag}:{etag}", extend)
+        return updated
+
+    def topics(self) -> Dict[str, Any]:
+        """Topic summaries, largest first."""
+        if self.vector_service.mock_mode:
+            return {"topics": [], "built_at": None}
+        model = self._current_model()
+        if model is None:
+            return {"topics": [], "built_at": None}
+        return {"topics": model["topics"], "built_at": model["built_at"]}
+
+    def topic(self, topic_id: int) -> Optional[Dict[str, Any]]:
+        """{"topic": summary, "prompt_ids": [...]}, or None if there is no such topic."""
+        if self.vector_service.mock_mode:
+            return None
+        model = self._current_model()
+        if model is None:
+            return None
+        summary = next((t for t in model["topics"] if t["id"] == topic_id), None)
+        if summary is None:
+            return None
+        prompt_ids = [pid for pid, topic in model["assignments"].items() if topic == topic_id]
+        return {"topic": summary, "prompt_ids": prompt_ids}
@@ -0,0 +1,189 @@
+"""
+Streaming NDJSON export and bulk import of the prompt corpus.
+
+Format: one JSON object per line. The first line is a meta record
+({"type": "meta", ...}); every other line is
+{"type": "prompt", "prompt": {...}, "vector": [...]} with the vector only
+when it was requested (export) or is already known (import). Import also
+accepts bare prompt objects, one per line.
+"""
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+EXPORT_FORMAT = "prompt-repository-export"
+EXPORT_VERSION = 1
+# text-embedding-004; imported vectors of any other size are re-embedded
+EMBEDDING_DIM = 768
+MAX_REPORTED_ERRORS = 50
+
+def export_lines(s3_service, vector_service, include_vectors: bool = False) -> Iterator[bytes]:
+    """
+    Yields the corpus as NDJSON lines, fetching prompts one window at a time.
+    With include_vectors, vectors.npy is loaded once (it is a single object)
+    and each prompt's row is attached ("vectors" for a chunked prompt's rows).
+    """
+    rows_by_id: Dict[str, List[int]] = {}
+    matrix = None
+    if include_vectors and not vector_service.mock_mode:
+        ids, matrix, _ = vector_service._load_all_embeddings()
+        for row, pid in enumerate(ids):
+            rows_by_id.setdefault(pid, []).append(row)
+
+    yield (json.dumps({
+        "type": "meta",
+        "format": EXPORT_FORMAT,
+        "version": EXPORT_VERSION,
+        "exported_at": datetime.now().isoformat(),
+        "vector_dim": int(matrix.shape[1]) if matrix is not None and matrix.ndim == 2 else None,
+    }) + "\n").encode("utf-8")
+
+    for prompt in s3_service.iter_prompts():
+        record = {"type": "prompt", "prompt": prompt}
+        rows = rows_by_id.get(prompt.get("id"))
+        if rows:
+            vectors = [[round(v, 7) for v in matrix[row].tolist()] for row in rows]
+            if len(vectors) == 1:
+                record["vector"] = vectors[0]
+            else:
+                record["vectors"] = vectors
+        yield (json.dumps(record) + "\n").encode("utf-8")
+
+def _string_list(value: Any) -> Optional[List[str]]:
+    """value as a list of strings (null is an empty list), or None if it is anything else."""
+    if value is None:
+        return []
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return value
+    return None
+
+class BulkImporter:
+    """
+    Accumulates NDJSON lines and writes them in batches: prompts go out with
+    bounded concurrency, prompts without a vector are embedded with batch
+    calls, and all vectors are committed to the vector store once in finish().
+    """
+    def __init__(self, s3_service, vector_service, embed: bool = True,
+                 batch_size: Optional[int] = None, concurrency: Optional[int] = None):
+        self.s3_service = s3_service
+        self.vector_service = vector_service
+        self.embed = embed and not vector_service.mock_mode
+        self.batch_size = batch_size or int(os.environ.get("IMPORT_BATCH_SIZE", "200"))
+        self.concurrency = concurrency or int(os.environ.get("IMPORT_CONCURRENCY", "8"))
+
+        self._batch: List[Dict[str, Any]] = []
+        self._batch_vectors: Dict[str, list] = {}
+        self._vectors: Dict[str, list] = {}
+        self.line_number = 0
+        self.imported = 0
+        self.embedded = 0
+        self.vectors_written = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.error_count = 0
+
+    def _error(self, message: str, prompt_id: Optional[str] = None) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": self.line_number, "id": prompt_id, "error": message})
+
+    def add_line(self, line: bytes) -> bool:
+        """Parses one NDJSON line. Returns True when a batch is ready for flush_batch()."""
+        self.line_number += 1
+        line = line.strip()
+        if not line:
+            return False
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            self._error(f"Invalid JSON: {e}")
+            return False
+        if not isinstance(record, dict) or record.get("type") == "meta":
+            return False
+
+        prompt = record.get("prompt") if "prompt" in record else record
+        if not isinstance(prompt, dict) or not prompt.get("title") or not prompt.get("prompt_text"):
+            self._error("Missing title or prompt_text", prompt.get("id") if isinstance(prompt, dict) else None)
+            return False
+
+        # Same shapes as the Prompt model; tool_used may also be a single (legacy) string
+        tags = _string_list(prompt.get("tags"))
+        tool_used = prompt.get("tool_used")
+        tool_used = tool_used if isinstance(tool_used, str) else _string_list(tool_used)
+        if tags is None or tool_used is None:
+            self._error("tags and tool_used must be lists of strings", prompt.get("id"))
+            return False
+
+        prompt = dict(prompt, tags=tags, tool_used=tool_used)
+        prompt.pop("score", None)
+        prompt.pop("user_context", None)
+        prompt.setdefault("id", str(uuid.uuid4()))
+        prompt.setdefault("created_at", datetime.now().isoformat())
+        self._batch.append(prompt)
+        vector = record.get("vector")
+        vectors = record.get("vectors")
+        if isinstance(vectors, list) and vectors and all(
+                isinstance(v, list) and len(v) == EMBEDDING_DIM for v in vectors):
+            self._batch_vectors[prompt["id"]] = vectors
+        elif isinstance(vector, list) and len(vector) == EMBEDDING_DIM:
+            self._batch_vectors[prompt["id"]] = vector
+        return len(self._batch) >= self.batch_size
+
+    def flush_batch(self) -> None:
+        """Writes the buffered prompts and embeds the ones without a vector (blocking)."""
+        batch, self._batch = self._batch, []
+        known_vectors, self._batch_vectors = self._batch_vectors, {}
+        if not batch:
+            return
+
+        failed = self.s3_service.put_prompts(batch, max_workers=self.concurrency)
+        for prompt_id, error in failed.items():
+            self._error(error, prompt_id)
+        written = [p for p in batch if p["id"] not in failed]
+        self.imported += len(written)
+
+        if self.vector_service.mock_mode:
+            return
+
+        import numpy as np
+
+        # Held as float32 until finish(): ~3KB per prompt instead of a list of floats
+        to_embed = []
+        for prompt in written:
+            if prompt["id"] in known_vectors:
+                self._vectors[prompt["id"]] = np.asarray(known_vectors[prompt["id"]], dtype=np.float32)
+            elif self.embed:
+                to_embed.append(prompt)
+        if to_embed:
+            texts = [
+                self.vector_service._construct_searchable_text(
+                    p.get("title", ""), p.get("description", ""), p.get("prompt_text", ""),
+                    p.get("tool_used", ""), p.get("tags", []))
+                for p in to_embed
+            ]
+            for prompt, vector in zip(to_embed, self.vector_service.embed_documents(texts)):
+                if vector:
+                    self._vectors[prompt["id"]] = np.asarray(vector, dtype=np.float32)
+                    self.embedded += 1
+                else:
+                    self._error("Embedding failed", prompt["id"])
+
+    def finish(self) -> Dict[str, Any]:
+        """Flushes the last batch, commits every vector in one write and returns the summary."""
+        self.flush_batch()
+        if self._vectors:
+            self.vectors_written = self.vector_service.upsert_many(self._vectors)
+            self._vectors = {}
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "status": "success" if self.error_count == 0 else "partial",
+            "lines": self.line_number,
+            "imported": self.imported,
+            "embedded": self.embedded,
+            "vectors_written": self.vectors_written,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
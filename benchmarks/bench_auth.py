@@ -0,0 +1,80 @@
+"""
+Auth overhead per request: verify_token (jwt.decode every time) against the
+verified-token cache, as a microbenchmark and through GET /auth/me.
+
+Run this from the repo root with:
+    python3 -m benchmarks.bench_auth --iterations 20000 --requests 500 --output auth.json
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ["MOCK_MODE"] = "true"
+os.environ.setdefault("SNAPSHOT_ENABLED", "false")
+
+from fastapi.testclient import TestClient
+
+from backend import auth_utils, main
+
+from .harness import latency_stats
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return round((time.perf_counter() - start) / iterations * 1e6, 3)
+
+def micro(iterations: int):
+    token = auth_utils.create_session_token("bench@pega.com")
+    cache = auth_utils.VerifiedTokenCache()
+    fresh = [auth_utils.create_session_token(f"user{i}@pega.com") for i in range(min(iterations, 5000))]
+    misses = iter(fresh)
+    return {
+        "verify_token_us": per_call_us(lambda: auth_utils.verify_token(token, "session"), iterations),
+        "cached_hit_us": per_call_us(lambda: cache.verify(token, "session"), iterations),
+        # A cold cache: every call decodes and inserts
+        "cached_miss_us": per_call_us(lambda: cache.verify(next(misses), "session"), len(fresh)),
+    }
+
+def endpoint_latency(count: int):
+    client = TestClient(main.app)
+    client.cookies.set("session_token", auth_utils.create_session_token("bench@pega.com"))
+
+    def run():
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.get("/auth/me")
+            samples.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+        return latency_stats(samples)
+
+    results = {"cached": run()}
+    original = main.verify_token_cached
+    main.verify_token_cached = auth_utils.verify_token
+    try:
+        results["uncached"] = run()
+    finally:
+        main.verify_token_cached = original
+    return results
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    report = {"micro": micro(args.iterations), "GET /auth/me": endpoint_latency(args.requests)}
+    for name, value in report["micro"].items():
+        print(f"{name:<18} {value:>9}us")
+    for mode, stats in report["GET /auth/me"].items():
+        print(f"GET /auth/me {mode:<9} p50={stats['p50_ms']:>8}ms  p95={stats['p95_ms']:>8}ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main_cli()
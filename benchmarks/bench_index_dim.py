@@ -0,0 +1,134 @@
+"""
+Recall and search time of the reduced-dimension primary index
+(EMBEDDING_INDEX_DIM) against an exact full-dimension search, on our own
+stored vectors and queries. Each index is written to an in-memory store the
+way _write_vectors does, and searched through the same path as /search: the
+memory-mapped vectors_{dim}.npy, then range reads of the candidates' rows.
+
+Run this from the repo root with:
+    python3 -m benchmarks.bench_index_dim --queries queries.txt --dims 128 256 384 --output index-dim.json
+
+The vectors come from the configured store (STORAGE_BACKEND, S3_BUCKET_NAME).
+--queries is a text file with one search per line, embedded through Gemini
+(GEMINI_API_KEY). Without it, every --sample'th stored vector is used as a
+query and excluded from its own ground truth. --synthetic N runs on random
+vectors instead; random vectors have no leading-dimension structure, so
+their recall understates what real embeddings get.
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ["MOCK_MODE"] = "false"
+os.environ.setdefault("SNAPSHOT_ENABLED", "false")
+
+from backend.services import S3Service, VectorService
+from backend.storage import MemoryStorageBackend
+
+from .corpus import generate_vectors
+from .harness import CountingStorage, latency_stats
+
+def timed(fn, queries):
+    samples, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        samples.append(time.perf_counter() - start)
+    return results, latency_stats(samples)
+
+def main_cli():
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", help="Text file with one query per line")
+    parser.add_argument("--sample", type=int, default=50,
+                        help="Without --queries, use every Nth stored vector as a query")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N random vectors instead of the store")
+    parser.add_argument("--dims", type=int, nargs="+", default=[128, 256, 384])
+    parser.add_argument("--candidates", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    vector_service = VectorService(S3Service())
+    if args.synthetic:
+        matrix = generate_vectors(args.synthetic)
+        ids = [f"v{i}" for i in range(len(matrix))]
+    else:
+        ids, matrix, _ = vector_service._load_all_embeddings()
+    if not len(ids):
+        raise SystemExit("No stored vectors; pass --synthetic N")
+    matrix = np.asarray(matrix, dtype=np.float32)
+
+    exclude = None
+    if args.queries:
+        with open(args.queries) as f:
+            texts = [line.strip() for line in f if line.strip()]
+        vectors = [v for v in vector_service._get_embeddings_batch(texts) if v is not None]
+        if not vectors:
+            raise SystemExit("Could not embed the queries (is GEMINI_API_KEY set?)")
+        queries = vector_service._normalize_rows(np.array(vectors, dtype=np.float32))
+    else:
+        exclude = np.arange(0, len(matrix), max(1, args.sample))
+        queries = matrix[exclude]
+
+    # Prompt-level ground truth; each leave-one-out query skips its own prompt
+    groups = vector_service._row_groups(ids, None)
+    prompt_of = np.arange(len(ids)) if groups is None else np.searchsorted(groups[0], np.arange(len(ids)), "right") - 1
+    prompts = len(ids) if groups is None else len(groups[1])
+    k = min(args.k, prompts - 1)
+    limit = k + (exclude is not None)
+
+    def exact(query):
+        scores, _ = vector_service._aggregate_rows(matrix @ query, ids, None)
+        return np.argpartition(-scores, limit - 1)[:limit]
+
+    def recall_of(found):
+        hits = []
+        for i, (top, expected) in enumerate(zip(found, truth)):
+            own = prompt_of[exclude[i]] if exclude is not None else None
+            got = [int(p) for p in top if p != own][:k]
+            want = [int(p) for p in expected if p != own][:k]
+            hits.append(len(set(want).intersection(got)) / k)
+        return round(float(np.mean(hits)), 4)
+
+    truth, full_stats = timed(exact, queries)
+    report = {"rows": len(matrix), "full_dim": int(matrix.shape[1]), "queries": len(queries), "k": k,
+              "full": full_stats, "reduced": []}
+    print(f"{len(matrix)} vectors x {matrix.shape[1]}, {len(queries)} queries, recall@{k}")
+    print(f"full {matrix.shape[1]:>4}-d              p50={full_stats['p50_ms']:>8}ms")
+
+    for dim in args.dims:
+        if dim >= matrix.shape[1]:
+            continue
+        storage = CountingStorage(MemoryStorageBackend())
+        writer = VectorService(S3Service("bench", storage=storage))
+        writer.configured_index_dim = dim
+        writer._write_vectors(ids, matrix, None)
+        reader = VectorService(S3Service("bench", storage=storage))
+        for candidates in args.candidates:
+            reader.rerank_candidates = candidates
+
+            def search(query):
+                ranked = reader._search_index(query.tolist(), limit, {})
+                if ranked is None:
+                    raise SystemExit("The reduced index was not used")
+                return ranked[0]
+
+            search(queries[0])  # loads the index and the vectors.npy header
+            storage.reset()
+            found, stats = timed(search, queries)
+            row = {"dim": dim, "candidates": candidates, "recall": recall_of(found),
+                   "index_mb": round(len(matrix) * dim * 4 / 1e6, 1),
+                   "range_reads_per_query": round(storage.calls["get_range"] / len(queries), 1), **stats}
+            report["reduced"].append(row)
+            print(f"{dim:>4}-d + {candidates:>4} re-ranked  p50={stats['p50_ms']:>8}ms  recall={row['recall']}  "
+                  f"range reads/query={row['range_reads_per_query']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main_cli()
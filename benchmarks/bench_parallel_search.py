@@ -0,0 +1,85 @@
+"""
+Vector scoring throughput from 1 to N threads: the single np.dot +
+argpartition that search uses by default against parallel_top_k, on a
+synthetic matrix of random unit vectors.
+
+Run this from the repo root with:
+    python3 -m benchmarks.bench_parallel_search --rows 200000 --threads 1 2 4 8 --output parallel.json
+"""
+import argparse
+import json
+import os
+import time
+
+# BLAS's own threads would hide the scaling being measured
+for _name in ("OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "OMP_NUM_THREADS"):
+    os.environ.setdefault(_name, "1")
+
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.similarity import cache_block_rows, parallel_top_k
+
+from .corpus import generate_vectors
+from .harness import latency_stats
+
+def single_call(matrix, query, k):
+    import numpy as np
+
+    scores = matrix @ query
+    top = np.argpartition(scores, -k)[-k:]
+    return list(top[np.argsort(scores[top])[::-1]])
+
+def timed(fn, iterations: int):
+    fn()  # warm-up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return latency_stats(samples)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threads", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--block-kb", type=int, nargs="*", default=[],
+                        help="Extra block sizes to compare with the cache-sized default")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    matrix = generate_vectors(args.rows, args.dim)
+    query = generate_vectors(1, args.dim, seed=7)[0]
+    expected = single_call(matrix, query, args.k)
+    default_rows = cache_block_rows(args.dim)
+    block_sizes = [("cache", default_rows)] + [(f"{kb}KB", cache_block_rows(args.dim, kb * 1024))
+                                               for kb in args.block_kb]
+
+    report = {"rows": args.rows, "dim": args.dim, "cpus": os.cpu_count(),
+              "single_call": timed(lambda: single_call(matrix, query, args.k), args.iterations),
+              "parallel": []}
+    baseline = report["single_call"]["p50_ms"]
+    print(f"{args.rows} x {args.dim} float32 ({matrix.nbytes / 1e6:.0f} MB), {os.cpu_count()} CPUs")
+    print(f"single np.dot      p50={baseline:>8}ms")
+    for threads in args.threads:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for label, block_rows in block_sizes:
+                top, _ = parallel_top_k(matrix, query, args.k, pool, threads, block_rows)
+                assert top == expected, "parallel scorer disagrees with the single call"
+                stats = timed(lambda: parallel_top_k(matrix, query, args.k, pool, threads, block_rows),
+                              args.iterations)
+                speedup = round(baseline / stats["p50_ms"], 2) if stats["p50_ms"] else None
+                report["parallel"].append({"threads": threads, "block": label, "block_rows": block_rows,
+                                           "speedup": speedup, **stats})
+                print(f"{threads:>2} threads {label:>6}  p50={stats['p50_ms']:>8}ms  "
+                      f"p95={stats['p95_ms']:>8}ms  x{speedup}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main_cli()
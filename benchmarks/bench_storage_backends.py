@@ -0,0 +1,87 @@
+"""
+Compares the S3, local-disk and SQLite storage backends on /prompts,
+the /search lexical fallback and /upvote.
+
+Run this from the repo root with:
+    python3 -m benchmarks.bench_storage_backends --prompts 2000 --requests 200 --output storage.json
+
+The S3 backend runs against moto when it is installed and is skipped otherwise.
+Search runs with MOCK_MODE=true, i.e. without Gemini: the substring scan for
+S3 and local disk, FTS5 for SQLite.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+os.environ["MOCK_MODE"] = "true"
+os.environ.setdefault("SNAPSHOT_ENABLED", "false")
+
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.auth_utils import create_session_token
+from backend.services import S3Service, VectorService
+
+from .corpus import WORDS, load_corpus, prompt_id
+from .harness import BUCKET, STORAGE_FACTORIES, latency_stats
+
+def timed(fn, n: int):
+    samples = []
+    for i in range(n):
+        start = time.perf_counter()
+        response = fn(i)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return latency_stats(samples)
+
+def run_backend(storage, prompt_count: int, request_count: int):
+    load_corpus(storage, prompt_count, with_vectors=False)
+    s3 = S3Service(BUCKET, storage=storage)
+    main.s3_service.override(s3)
+    main.vector_service.override(VectorService(s3))
+
+    client = TestClient(main.app)
+    client.cookies.set("session_token", create_session_token("bench@pega.com"))
+    rng = random.Random(7)
+
+    results = {}
+    results["GET /prompts"] = timed(lambda i: client.get("/prompts"), request_count)
+    results["GET /search"] = timed(lambda i: client.get("/search", params={"q": rng.choice(WORDS)}), request_count)
+
+    def upvote(i):
+        target = prompt_id(rng.randrange(prompt_count))
+        response = client.post(f"/prompts/{target}/upvote")
+        client.delete(f"/prompts/{target}/upvote")
+        return response
+    results["POST /prompts/{id}/upvote"] = timed(upvote, request_count)
+    return results
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--backends", default="s3,local,sqlite")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    factories = {"s3": STORAGE_FACTORIES["moto"], "local": STORAGE_FACTORIES["local"], "sqlite": STORAGE_FACTORIES["sqlite"]}
+    report = {"prompts": args.prompts, "requests": args.requests, "backends": {}}
+    for name in args.backends.split(","):
+        try:
+            with factories[name]() as storage:
+                report["backends"][name] = run_backend(storage, args.prompts, args.requests)
+        except ImportError as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        for endpoint, stats in report["backends"][name].items():
+            print(f"{name:>7}  {endpoint:<28} p50={stats['p50_ms']:>9}ms  p95={stats['p95_ms']:>9}ms  p99={stats['p99_ms']:>9}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,44 @@
+"""
+Compares two benchmark result files written by benchmarks.run.
+
+Run this with:
+    python3 -m benchmarks.compare results/before.json results/after.json
+"""
+import argparse
+import json
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "storage_calls_per_request", "s3_calls_per_request", "peak_rss_mb"]
+
+def change(before, after) -> str:
+    if before is None or after is None:
+        return "-"
+    if before == 0:
+        return "same" if after == 0 else "new"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    for key in ("storage", "prompts", "seed"):
+        if before["meta"].get(key) != after["meta"].get(key):
+            print(f"Warning: runs differ in {key} ({before['meta'].get(key)} vs {after['meta'].get(key)})")
+    print(f"{before['meta'].get('git_commit')} -> {after['meta'].get('git_commit')}")
+
+    for name in [n for n in after["results"] if n in before["results"]]:
+        print(f"\n{name}")
+        for metric in METRICS:
+            old, new = before["results"][name].get(metric), after["results"][name].get(metric)
+            if old is None and new is None:
+                continue
+            print(f"  {metric:<27} {str(old):>10} -> {str(new):>10}  {change(old, new)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Deterministic synthetic corpus for the benchmarks: prompts shaped like the
+S3Service dummy records plus random unit-length embedding vectors.
+
+The same (count, seed) always produces the same prompts and vectors, so runs
+on different machines or commits measure the same data.
+"""
+import hashlib
+import io
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List
+
+EMBEDDING_DIM = 768
+
+WORDS = [
+    "summarize", "refactor", "email", "customer", "report", "python", "sql", "meeting",
+    "agenda", "review", "onboarding", "incident", "release", "notes", "translate", "draft",
+    "react", "component", "lambda", "deploy", "docker", "database", "query", "tutorial",
+    "fibonacci", "memoization", "portrait", "lighting", "boilerplate", "crud", "testing", "api",
+]
+# Display names as stored in tool_used (see ToolMetadataService for the ids)
+TOOLS = ["ChatGPT", "Claude", "Gemini", "GitHub Copilot", "Cursor", "Midjourney"]
+USERNAMES = ["Alice", "Bob", "Charlie", "Dave", "Eve", "Frank"]
+EPOCH = datetime(2024, 1, 1)
+
+def prompt_id(index: int) -> str:
+    return f"bench-{index:07d}"
+
+def generate_prompts(count: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    """Yields count prompts with the same fields as the dummy records."""
+    rng = random.Random(seed)
+    for i in range(count):
+        words = rng.sample(WORDS, 8)
+        username = rng.choice(USERNAMES)
+        upvoted_by = [f"user{n}@pega.com" for n in rng.sample(range(200), rng.randint(0, 5))]
+        yield {
+            "id": prompt_id(i),
+            "title": " ".join(words[:3]).title(),
+            "description": " ".join(rng.choice(WORDS) for _ in range(25)) + ".",
+            "tool_used": rng.sample(TOOLS, rng.randint(1, 2)),
+            "prompt_text": " ".join(rng.choice(WORDS) for _ in range(40)) + ".",
+            "tags": words[3:3 + rng.randint(2, 5)],
+            "username": username,
+            "owner_email": f"{username.lower()}@pega.com",
+            "upvotes": len(upvoted_by),
+            "upvoted_by": upvoted_by,
+            "created_at": (EPOCH + timedelta(minutes=i)).isoformat(),
+        }
+
+def generate_vectors(count: int, dim: int = EMBEDDING_DIM, seed: int = 42):
+    """Returns a (count, dim) float32 matrix of random unit vectors."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    matrix = np.empty((count, dim), dtype=np.float32)
+    # Filled in blocks to keep the float64 temporaries small at 100k rows
+    for start in range(0, count, 8192):
+        block = rng.standard_normal((min(8192, count - start), dim))
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        matrix[start:start + len(block)] = block
+    return matrix
+
+def text_vector(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Deterministic unit vector for a piece of text (what the embedding stub returns)."""
+    import numpy as np
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def load_corpus(storage, count: int, seed: int = 42, with_vectors: bool = True, workers: int = 16) -> List[str]:
+    """
+    Writes the corpus into a StorageBackend using the bucket layout
+    (prompts/{id}.json, embeddings/ids.json, embeddings/vectors.npy).
+    Returns the prompt ids.
+    """
+    prompts = list(generate_prompts(count, seed))
+
+    def put(prompt):
+        storage.put(f"prompts/{prompt['id']}.json", json.dumps(prompt))
+
+    # Remote backends (moto, S3) are dominated by per-request latency
+    with ThreadPoolExecutor(max_workers=workers if storage.is_remote else 1) as pool:
+        list(pool.map(put, prompts))
+
+    ids = [p["id"] for p in prompts]
+    if with_vectors:
+        import numpy as np
+        buffer = io.BytesIO()
+        np.save(buffer, generate_vectors(count, seed=seed))
+        storage.put("embeddings/ids.json", json.dumps(ids))
+        storage.put("embeddings/vectors.npy", buffer.getvalue(), content_type="application/octet-stream")
+    return ids
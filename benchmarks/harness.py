@@ -0,0 +1,186 @@
+"""
+Shared pieces for the benchmarks: storage backends to run against, a local
+stand-in for the Gemini API, per-operation call counters and latency stats.
+"""
+import contextlib
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+from .corpus import text_vector
+
+BUCKET = "bench-prompt-repository"
+
+class CountingStorage:
+    """Wraps a StorageBackend and counts calls per operation."""
+    COUNTED = ("get", "get_if_changed", "get_range", "download_to", "head", "put", "delete", "list_keys")
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if name not in self.COUNTED:
+            return attr
+
+        def counted(*args, **kwargs):
+            with self._lock:
+                self.calls[name] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+class S3CallCounter:
+    """Counts S3 API requests (ListObjectsV2 pages, GetObject, ...) made by a boto3 client."""
+    def __init__(self, client):
+        self.calls = Counter()
+        client.meta.events.register("before-call.s3", self._on_call)
+
+    def _on_call(self, model, **kwargs):
+        self.calls[model.name] += 1
+
+    def reset(self) -> None:
+        self.calls.clear()
+
+@contextlib.contextmanager
+def moto_storage():
+    """S3StorageBackend against moto's in-process S3."""
+    from moto import mock_aws
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        from backend import storage as storage_module
+        # Clients created before mock_aws() would talk to real AWS
+        storage_module._boto3_clients.clear()
+        storage_module._boto3_session = None
+        storage_module.get_boto3_client("s3").create_bucket(Bucket=BUCKET)
+        yield storage_module.S3StorageBackend(BUCKET)
+        storage_module._boto3_clients.clear()
+        storage_module._boto3_session = None
+
+@contextlib.contextmanager
+def local_storage():
+    from backend.storage import LocalStorageBackend
+    with tempfile.TemporaryDirectory() as root:
+        yield LocalStorageBackend(root)
+
+@contextlib.contextmanager
+def memory_storage():
+    from backend.storage import MemoryStorageBackend
+    yield MemoryStorageBackend()
+
+@contextlib.contextmanager
+def sqlite_storage():
+    from backend.sqlite_storage import SQLiteStorageBackend
+    with tempfile.TemporaryDirectory() as root:
+        yield SQLiteStorageBackend(os.path.join(root, "prompts.db"))
+
+STORAGE_FACTORIES = {
+    "moto": moto_storage,
+    "local": local_storage,
+    "memory": memory_storage,
+    "sqlite": sqlite_storage,
+}
+
+class _GeminiStubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.latency:
+            time.sleep(self.latency)
+        text = body.get("content", {}).get("parts", [{}])[0].get("text", "")
+        if ":embedContent" in self.path:
+            payload = {"embedding": {"values": text_vector(text)}}
+        elif ":batchEmbedContents" in self.path:
+            payload = {"embeddings": [
+                {"values": text_vector(r["content"]["parts"][0]["text"])} for r in body.get("requests", [])
+            ]}
+        elif ":generateContent" in self.path:
+            details = {"description": "Synthetic description.", "tags": ["bench", "synthetic", "stub"]}
+            payload = {"candidates": [{"content": {"parts": [{"text": json.dumps(details)}]}}]}
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@contextlib.contextmanager
+def gemini_stub(latency_ms: float = 0.0):
+    """
+    Serves embedContent/generateContent on localhost with deterministic
+    vectors and sets GEMINI_API_BASE/GEMINI_API_KEY to point at it.
+    """
+    handler = type("GeminiStubHandler", (_GeminiStubHandler,), {"latency": latency_ms / 1000.0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    previous = {k: os.environ.get(k) for k in ("GEMINI_API_BASE", "GEMINI_API_KEY")}
+    os.environ["GEMINI_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["GEMINI_API_KEY"] = "bench-stub"
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def peak_rss_mb() -> float:
+    """High-water mark of this process's resident set size."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "p50_ms": round(pick(0.50) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "p99_ms": round(pick(0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+def measure(fn: Callable[[int], Any], iterations: int, counters=()) -> Dict[str, Any]:
+    """
+    Calls fn(i) iterations times and returns latency percentiles, calls per
+    iteration for each counter and the process's peak RSS afterwards.
+    """
+    for counter in counters:
+        counter.reset()
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+
+    result = {"iterations": iterations, **latency_stats(samples)}
+    for counter in counters:
+        key = "s3_calls" if isinstance(counter, S3CallCounter) else "storage_calls"
+        result[key] = {op: round(n / iterations, 2) for op, n in sorted(counter.calls.items())}
+        result[key + "_per_request"] = round(sum(counter.calls.values()) / iterations, 2)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
@@ -0,0 +1,176 @@
+"""
+Benchmarks the backend hot paths against a synthetic corpus.
+
+Run this from the repo root with:
+    python3 -m benchmarks.run --prompts 10000 --storage moto --output results/10k.json
+    python3 -m benchmarks.run --prompts 100000 --storage local --only search,list_prompts
+
+Storage is moto's in-process S3 (default), the local-disk backend, memory or
+sqlite. Gemini is replaced by a stub on localhost that returns deterministic
+vectors, so search and create exercise the real HTTP and numpy paths.
+
+Every benchmark reports p50/p95/p99 latency, storage and S3 calls per request
+and the process's peak RSS after it ran. Peak RSS is a high-water mark, so
+use --only to measure one benchmark per process. Compare two runs with
+    python3 -m benchmarks.compare results/before.json results/after.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+os.environ["MOCK_MODE"] = "false"
+os.environ.setdefault("SNAPSHOT_ENABLED", "false")
+
+from .corpus import WORDS, load_corpus, text_vector
+from .harness import (CountingStorage, S3CallCounter, STORAGE_FACTORIES, gemini_stub,
+                      measure, peak_rss_mb)
+
+def log(message: str) -> None:
+    print(message, file=sys.stderr, flush=True)
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+class Bench:
+    """The app wired to one storage backend, plus the benchmarks that run against it."""
+
+    def __init__(self, storage, prompt_ids, seed: int):
+        from fastapi.testclient import TestClient
+        from backend import main
+        from backend.auth_utils import create_session_token
+        from backend.services import S3Service, VectorService
+        from backend.tool_metadata_service import ToolMetadataService
+
+        self.storage = CountingStorage(storage)
+        self.counters = [self.storage]
+        if getattr(storage, "s3", None) is not None:
+            self.counters.append(S3CallCounter(storage.s3))
+
+        s3_service = S3Service(getattr(storage, "bucket_name", None), storage=self.storage)
+        self.vector_service = VectorService(s3_service)
+        main.s3_service.override(s3_service)
+        main.vector_service.override(self.vector_service)
+        main.tool_metadata_service.override(ToolMetadataService(main.s3_service))
+
+        self.client = TestClient(main.app)
+        self.create_session_token = create_session_token
+        self.prompt_ids = prompt_ids
+        self.rng = random.Random(seed)
+
+    def _cookie(self, email: str):
+        return {"Cookie": f"session_token={self.create_session_token(email)}"}
+
+    def _get(self, url: str, **kwargs):
+        response = self.client.get(url, **kwargs)
+        assert response.status_code == 200, f"GET {url}: {response.status_code} {response.text[:200]}"
+        return response
+
+    def list_prompts(self, i):
+        self._get("/prompts")
+
+    def search(self, i):
+        query = " ".join(self.rng.sample(WORDS, 2))
+        self._get("/search", params={"q": query})
+
+    def tool_stats(self, i):
+        self._get("/tools/chatgpt/stats")
+
+    def upvote(self, i):
+        prompt_id = self.rng.choice(self.prompt_ids)
+        response = self.client.post(f"/prompts/{prompt_id}/upvote", headers=self._cookie(f"bench{i}@pega.com"))
+        assert response.status_code in (200, 400), response.text[:200]
+
+    def save_embedding(self, i):
+        self.vector_service._save_embedding_to_s3(f"bench-new-{i}", text_vector(f"new prompt {i}"))
+
+    def create_prompt(self, i):
+        words = self.rng.sample(WORDS, 6)
+        response = self.client.post("/prompts", headers=self._cookie("bench@pega.com"), json={
+            "title": " ".join(words[:3]).title(),
+            "description": " ".join(words),
+            "prompt_text": " ".join(self.rng.choice(WORDS) for _ in range(40)),
+            "tool_used": ["ChatGPT"],
+            "tags": words[3:],
+        })
+        assert response.status_code == 200, response.text[:200]
+
+# Ordered so that writes run after the read benchmarks
+BENCHMARKS = ["list_prompts", "search", "tool_stats", "upvote", "save_embedding", "create_prompt"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend hot paths on a synthetic corpus")
+    parser.add_argument("--prompts", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--storage", choices=sorted(STORAGE_FACTORIES), default="moto")
+    parser.add_argument("--requests", type=int, default=50, help="Timed iterations per benchmark")
+    parser.add_argument("--write-requests", type=int, default=10, help="Timed iterations for save_embedding and create_prompt")
+    parser.add_argument("--only", help=f"Comma-separated subset of: {','.join(BENCHMARKS)}")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated Gemini latency")
+    parser.add_argument("--verbose", action="store_true", help="Show the services' log output")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    selected = args.only.split(",") if args.only else BENCHMARKS
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": args.storage,
+            "prompts": args.prompts,
+            "seed": args.seed,
+            "embed_latency_ms": args.embed_latency_ms,
+        },
+        "results": {},
+    }
+
+    devnull = open(os.devnull, "w")
+    quiet = contextlib.nullcontext if args.verbose else lambda: contextlib.redirect_stdout(devnull)
+    with gemini_stub(args.embed_latency_ms), STORAGE_FACTORIES[args.storage]() as storage:
+        log(f"Loading {args.prompts} prompts into {args.storage} storage...")
+        start = time.perf_counter()
+        prompt_ids = load_corpus(storage, args.prompts, seed=args.seed)
+        report["meta"]["corpus_load_s"] = round(time.perf_counter() - start, 2)
+        report["meta"]["rss_after_load_mb"] = peak_rss_mb()
+
+        with quiet():
+            bench = Bench(storage, prompt_ids, args.seed)
+        for name in [b for b in BENCHMARKS if b in selected]:
+            fn = getattr(bench, name)
+            iterations = args.write_requests if name in ("save_embedding", "create_prompt") else args.requests
+            with quiet():
+                # The first call pays for cold caches (catalog crawl, vector download)
+                first = measure(fn, 1, bench.counters)
+                result = measure(lambda i: fn(i + 1), iterations, bench.counters)
+            result["first_ms"] = first["p50_ms"]
+            result["first_storage_calls"] = first["storage_calls_per_request"]
+            report["results"][name] = result
+            log(f"{name:<15} p50={result['p50_ms']:>9}ms  p95={result['p95_ms']:>9}ms  p99={result['p99_ms']:>9}ms  "
+                f"storage/req={result['storage_calls_per_request']:<7} first={result['first_ms']}ms  rss={result['peak_rss_mb']}MB")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        log(f"Wrote {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
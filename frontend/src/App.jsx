@@ -79,6 +79,11 @@ function AppContent() {
 
         setActiveTab('browse');
         handleBrowse(); // Refresh list
+      } else if (response.status === 409) {
+        // Near-duplicate rejected by the backend (DUPLICATE_CHECK=reject)
+        const result = await response.json();
+        const match = result.detail?.duplicates?.[0];
+        addToast(match ? `A very similar prompt already exists: "${match.title}"` : 'A very similar prompt already exists.', 'error');
       } else {
         addToast(isUpdate ? 'Failed to update prompt.' : 'Failed to save prompt.', 'error');
       }
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { useToast } from './Toast';
 
 import { API_URL } from '../config';
@@ -7,8 +7,44 @@ function Login() {
     const [email, setEmail] = useState('');
     const [loading, setLoading] = useState(false);
     const [status, setStatus] = useState('IDLE'); // IDLE, VERIFYING, SENT
+    // The magic link is sent after /auth/login responds; poll until SES accepts or rejects it
+    const [deliveryId, setDeliveryId] = useState(null);
+    const [deliveryStatus, setDeliveryStatus] = useState(null); // queued, sending, sent, failed
     const { addToast } = useToast();
 
+    useEffect(() => {
+        if (!deliveryId) return undefined;
+        let cancelled = false;
+        let polls = 0;
+        const poll = async () => {
+            polls += 1;
+            try {
+                const response = await fetch(`${API_URL}/auth/login/deliveries/${deliveryId}`);
+                // 404: the send hasn't been recorded yet
+                if (response.ok) {
+                    const data = await response.json();
+                    if (cancelled) return;
+                    setDeliveryStatus(data.status);
+                    if (data.status === 'sent') {
+                        addToast('Magic link sent! Check your email.', 'success');
+                        return;
+                    }
+                    if (data.status === 'failed') {
+                        addToast(`We couldn't send your magic link${data.error ? ` (${data.error})` : ''}. Please try again.`, 'error');
+                        setStatus('IDLE');
+                        setDeliveryId(null);
+                        return;
+                    }
+                }
+            } catch (error) {
+                console.error('Delivery status error:', error);
+            }
+            if (!cancelled && polls < 20) setTimeout(poll, 1500);
+        };
+        poll();
+        return () => { cancelled = true; };
+    }, [deliveryId]);
+
     const handleSubmit = async (e) => {
         e.preventDefault();
         setLoading(true);
@@ -30,7 +66,9 @@ function Login() {
                     addToast('Verification required. Check your email.', 'info');
                 } else {
                     setStatus('SENT');
-                    addToast('Magic link sent! Check your email.', 'success');
+                    setDeliveryStatus(data.delivery_id ? 'queued' : 'sent');
+                    setDeliveryId(data.delivery_id || null);
+                    if (!data.delivery_id) addToast('Magic link sent! Check your email.', 'success');
                 }
             } else {
                 addToast(data.detail || 'Failed to send magic link.', 'error');
@@ -46,6 +84,8 @@ function Login() {
     const handleRetry = () => {
         setStatus('IDLE');
         setEmail('');
+        setDeliveryId(null);
+        setDeliveryStatus(null);
     };
 
     const handleVerified = () => {
@@ -91,7 +131,7 @@ function Login() {
     if (status === 'SENT') {
         return (
             <div className="login-container" style={{ maxWidth: '400px', margin: '4rem auto', textAlign: 'center' }}>
-                <h2>🚀 Magic Link Sent! (Step 2 of 2)</h2>
+                <h2>{deliveryStatus === 'sent' ? '🚀 Magic Link Sent! (Step 2 of 2)' : '✉️ Sending Your Magic Link… (Step 2 of 2)'}</h2>
                 <p>Your email has been verified. We have sent a private login link to your email.
 
                     <br /> <strong>If you do not see the email in your inbox, please check your Junk or Spam folder.</strong></p>
@@ -19,6 +19,8 @@ const PromptForm = ({ onSave, loading, initialData = null, onCancel = null }) =>
     const [promptText, setPromptText] = useState(initialData?.prompt_text || '');
     const [tags, setTags] = useState(initialData?.tags ? initialData.tags.join(', ') : '');
     const [username, setUsername] = useState(initialData?.username || '');
+    // Key of the embedding pre-computed by /generate-details, handed back on save
+    const [draftKey, setDraftKey] = useState(null);
     const { addToast } = useToast();
 
     const isEditing = !!initialData;
@@ -68,9 +70,12 @@ const PromptForm = ({ onSave, loading, initialData = null, onCancel = null }) =>
                 headers: {
                     'Content-Type': 'application/json',
                 },
+                credentials: 'include', // Signed-in users get a pre-computed embedding
                 body: JSON.stringify({
                     title: title,
-                    prompt_text: promptText
+                    prompt_text: promptText,
+                    // Lets the backend pre-compute the embedding for the save
+                    tool_used: selectedTools
                 }),
             });
 
@@ -78,6 +83,7 @@ const PromptForm = ({ onSave, loading, initialData = null, onCancel = null }) =>
                 const data = await response.json();
                 if (data.description) setDescription(data.description);
                 if (data.tags && Array.isArray(data.tags)) setTags(data.tags.join(', '));
+                setDraftKey(data.draft_key || null);
                 addToast("Details generated successfully!", "success");
             } else {
                 addToast("Failed to generate details.", "error");
@@ -109,7 +115,8 @@ const PromptForm = ({ onSave, loading, initialData = null, onCancel = null }) =>
             tool_used: selectedTools, // Send list
             prompt_text: promptText,
             tags: tagsList,
-            username: username.trim() || null
+            username: username.trim() || null,
+            draft_key: draftKey
         });
 
         // Reset form only if not editing
@@ -121,6 +128,7 @@ const PromptForm = ({ onSave, loading, initialData = null, onCancel = null }) =>
             setPromptText('');
             setTags('');
             setUsername('');
+            setDraftKey(null);
         }
     };
 